@@ -0,0 +1,2 @@
+#!/usr/bin/python3
+"""Performance benchmarks of the storage engines."""
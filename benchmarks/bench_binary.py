@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""
+Compares the binary snapshot format with JSON for size and speed.
+
+Usage:
+    python3 -m benchmarks.bench_binary [--sizes N,N,...] [-o results.json]
+                                       [--compare old_results.json]
+
+For each size, a store of mixed objects is written and read back in each
+format, as the storage writes and reads snapshots: JSON one member per
+line, binary with its string table and integer datetimes. Binary reads
+are timed giving ISO strings, as a JSON read does, and giving datetimes,
+as a reload does. The times are a full round trip through the disk.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from benchmarks.common import Timer, compare, make_records, write_results
+from models.engine import binary
+from models.engine.jsonstream import (atomic_open, iter_object, open_text,
+                                      write_object)
+
+SIZES = (10000, 100000)
+
+
+def json_case(path, members):
+    """Returns the metrics of writing and reading members as JSON."""
+    with Timer() as write:
+        with atomic_open(path) as fp:
+            write_object(fp, ((key, json.dumps(record))
+                              for key, record in members))
+    with Timer() as read:
+        with open_text(path) as fp:
+            count = sum(1 for _ in iter_object(fp))
+    check(count, members)
+    return {"write_s": write.seconds, "read_s": read.seconds,
+            "store_bytes": os.path.getsize(path)}
+
+
+def binary_case(path, members):
+    """Returns the metrics of writing and reading members as binary."""
+    with Timer() as write:
+        with atomic_open(path, binary=True) as fp:
+            binary.write_records(fp, members)
+    metrics = {"write_s": write.seconds}
+    for name, datetimes in (("read_s", False), ("read_datetimes_s", True)):
+        with Timer() as read:
+            count = sum(1 for _ in binary.iter_file(path, datetimes))
+        check(count, members)
+        metrics[name] = read.seconds
+    metrics["store_bytes"] = os.path.getsize(path)
+    return metrics
+
+
+def check(count, members):
+    """Raises RuntimeError unless count members were read back."""
+    if count != len(members):
+        raise RuntimeError(f"read {count} objects out of {len(members)}")
+
+
+def main():
+    """Runs the benchmark and writes its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma separated store sizes")
+    parser.add_argument("-o", "--output", default="bench_binary.json",
+                        help="results file")
+    parser.add_argument("--compare", help="results file of an older run")
+    args = parser.parse_args()
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "file.json")
+        for size in map(int, args.sizes.split(",")):
+            members = list(make_records(size))
+            for name, case in (("json", json_case), ("binary", binary_case)):
+                metrics = case(path, members)
+                results[f"{name}:{size}"] = metrics
+                print(name, size, json.dumps(metrics), file=sys.stderr)
+    write_results(args.output, "bench_binary", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
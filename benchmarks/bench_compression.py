@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Times the writing and reading of a store with each codec and level.
+
+Usage:
+    python3 -m benchmarks.bench_compression [--size N] [--cases C,C,...]
+                                            [-o results.json]
+                                            [--compare old_results.json]
+
+A store of size mixed objects is encoded once; then, for each case, a
+codec and level such as gzip:6 or none, the store is written as the
+storage writes it and read back as reload() reads it. The bytes on disk
+against the write and read times show what compression saves in I/O for
+the CPU it costs.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from benchmarks.common import Timer, compare, make_records, write_results
+from models.engine.jsonstream import (atomic_open, iter_object, open_text,
+                                      write_object)
+
+SIZE = 100000
+CASES = ("none", "gzip:1", "gzip:6", "gzip:9", "zlib:1", "zlib:6",
+         "zlib:9", "lzma:0", "lzma:6", "lzma:9")
+
+
+def run_case(path, members, codec, level):
+    """Returns the metrics of writing and reading members at path."""
+    with Timer() as write:
+        with atomic_open(path, codec=codec, level=level) as fp:
+            text_bytes = write_object(fp, members)
+    size = os.path.getsize(path)
+    with Timer() as read:
+        with open_text(path) as fp:
+            count = sum(1 for _ in iter_object(fp))
+    if count != len(members):
+        raise RuntimeError(f"read {count} objects out of {len(members)}")
+    return {"write_s": write.seconds, "read_s": read.seconds,
+            "store_bytes": size, "ratio": text_bytes / size}
+
+
+def main():
+    """Runs the benchmark and writes its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=SIZE,
+                        help="objects in the store")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="comma separated codec:level cases")
+    parser.add_argument("-o", "--output", default="bench_compression.json",
+                        help="results file")
+    parser.add_argument("--compare", help="results file of an older run")
+    args = parser.parse_args()
+
+    members = [(key, json.dumps(record))
+               for key, record in make_records(args.size)]
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for case in args.cases.split(","):
+            codec, _, level = case.partition(":")
+            path = os.path.join(directory, "file.json")
+            metrics = run_case(path, members,
+                               None if codec == "none" else codec,
+                               int(level) if level else None)
+            results[case] = metrics
+            print(case, json.dumps(metrics), file=sys.stderr)
+    write_results(args.output, "bench_compression", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
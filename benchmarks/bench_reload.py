@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+Times the cold start reload of a store against the number of workers.
+
+Usage:
+    python3 -m benchmarks.bench_reload [--size N] [--workers N,N,...]
+                                       [--lazy] [-o results.json]
+                                       [--compare old_results.json]
+
+A store of size mixed objects is written once; then, for each worker
+count, a fresh process times `import models`, which reloads the store
+with HBNB_STORAGE_WORKERS set to that count (0 reads it in the process
+itself). Peak RSS is given for the process and for its workers. With
+--lazy, a last process reloads the store in lazy mode, without workers.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+from benchmarks.common import (Timer, compare, peak_rss, run_phase,
+                               write_results, write_store)
+
+SIZE = 1000000
+WORKERS = (0, 1, 2, 4, 8)
+
+
+def read_phase(size):
+    """Returns the metrics of the reload done by `import models`."""
+    with Timer() as startup:
+        import models
+    count = models.storage.count()
+    if count != size:
+        raise RuntimeError(f"read {count} objects out of {size}")
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"startup_reload_s": startup.seconds, "peak_rss": peak_rss(),
+            "worker_peak_rss": children * (1 if sys.platform == "darwin"
+                                           else 1024)}
+
+
+def main():
+    """Runs the benchmark and writes its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=SIZE,
+                        help="objects in the store")
+    parser.add_argument("--workers", default=",".join(map(str, WORKERS)),
+                        help="comma separated worker counts")
+    parser.add_argument("--lazy", action="store_true",
+                        help="also time a lazy reload")
+    parser.add_argument("-o", "--output", default="bench_reload.json",
+                        help="results file")
+    parser.add_argument("--compare", help="results file of an older run")
+    parser.add_argument("--phase", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        print(json.dumps(read_phase(args.size)))
+        return
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        write_store(os.path.join(directory, "file.json"), args.size)
+        for workers in args.workers.split(","):
+            metrics = run_phase(
+                "benchmarks.bench_reload",
+                ["--phase", "--size", str(args.size)], directory,
+                {"HBNB_STORAGE_WORKERS": workers})
+            results[f"workers={workers}"] = metrics
+            print(workers, json.dumps(metrics), file=sys.stderr)
+        if args.lazy:
+            metrics = run_phase(
+                "benchmarks.bench_reload",
+                ["--phase", "--size", str(args.size)], directory,
+                {"HBNB_STORAGE_WORKERS": "0", "HBNB_STORAGE_LAZY": "1"})
+            results["lazy"] = metrics
+            print("lazy", json.dumps(metrics), file=sys.stderr)
+    write_results(args.output, "bench_reload", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""
+Times near() and within() on a store of places against a linear scan.
+
+Usage:
+    python3 -m benchmarks.bench_spatial [--size N] [--queries N]
+                                        [-o results.json]
+                                        [--compare old_results.json]
+
+A store of size places spread over the globe is written once; a fresh
+process reloads it with `import models`, which builds the grid, then
+runs queries around random positions for each radius and box size.
+Each case gives the mean time of a query through the grid and of the
+same query as a Python loop over storage.all(Place), which only runs
+a few times, with the mean number of places found.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from benchmarks.common import (Timer, compare, peak_rss, run_phase,
+                               write_results, write_store)
+
+SIZE = 1000000
+QUERIES = 100
+SCANS = 3
+RADII_KM = (1, 10, 100, 1000)
+BOX_DEGREES = (0.1, 1, 10)
+
+
+def scan_near(places, lat, lon, radius_km):
+    """Returns the keys near() finds, from a loop over places."""
+    from models.engine.indexes import distance_km, position
+
+    found = list()
+    for key, obj in places:
+        where = position(obj)
+        if where is not None:
+            distance = distance_km(lat, lon, *where)
+            if distance <= radius_km:
+                found.append((distance, key))
+    found.sort()
+    return [key for _, key in found]
+
+
+def scan_within(places, bbox):
+    """Returns the keys within() finds, from a loop over places."""
+    from models.engine.indexes import in_bbox, position
+
+    found = list()
+    for key, obj in places:
+        where = position(obj)
+        if where is not None and in_bbox(*where, bbox):
+            found.append(key)
+    return found
+
+
+def time_case(query, scan, arguments):
+    """
+    Returns the metrics of query and scan over the list of arguments,
+    checking that both find the same keys.
+    """
+    found = 0
+    with Timer() as grid:
+        for args in arguments:
+            found += len(query(*args))
+    with Timer() as loop:
+        for args in arguments[:SCANS]:
+            expected = scan(*args)
+            if sorted(query(*args)) != sorted(expected):
+                raise RuntimeError(f"the grid missed places around {args}")
+    return {"grid_ms": grid.seconds * 1000 / len(arguments),
+            "scan_ms": loop.seconds * 1000 / min(SCANS, len(arguments)),
+            "found": found / len(arguments)}
+
+
+def query_phase(size, queries):
+    """Returns the metrics of the queries on a store of size places."""
+    with Timer() as startup:
+        import models
+    from models.place import Place
+
+    storage = models.storage
+    count = storage.count(Place)
+    if count != size:
+        raise RuntimeError(f"read {count} places out of {size}")
+    results = {"reload": {"startup_reload_s": startup.seconds,
+                          "peak_rss": peak_rss()}}
+    places = list(storage.all(Place).items())
+    rng = random.Random(1)
+    centers = [(rng.uniform(-80, 80), rng.uniform(-180, 180))
+               for _ in range(queries)]
+    for radius in RADII_KM:
+        results[f"near:{radius}km"] = time_case(
+            lambda lat, lon: storage.near(Place, lat, lon, radius),
+            lambda lat, lon: scan_near(places, lat, lon, radius), centers)
+    for degrees in BOX_DEGREES:
+        boxes = [((lat, lon, lat + degrees,
+                   (lon + degrees + 180) % 360 - 180),)
+                 for lat, lon in centers]
+        results[f"within:{degrees}deg"] = time_case(
+            lambda bbox: storage.within(Place, bbox),
+            lambda bbox: scan_within(places, bbox), boxes)
+    return results
+
+
+def main():
+    """Runs the benchmark and writes its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=SIZE,
+                        help="places in the store")
+    parser.add_argument("--queries", type=int, default=QUERIES,
+                        help="queries of each case")
+    parser.add_argument("-o", "--output", default="bench_spatial.json",
+                        help="results file")
+    parser.add_argument("--compare", help="results file of an older run")
+    parser.add_argument("--phase", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        print(json.dumps(query_phase(args.size, args.queries)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_store(os.path.join(directory, "file.json"), args.size,
+                    mix=(("Place", 100),))
+        results = run_phase("benchmarks.bench_spatial",
+                            ["--phase", "--size", str(args.size),
+                             "--queries", str(args.queries)], directory)
+    for case, metrics in results.items():
+        print(case, json.dumps(metrics), file=sys.stderr)
+    write_results(args.output, "bench_spatial", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
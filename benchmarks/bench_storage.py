@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+Times the storage on stores of mixed objects of every class.
+
+Usage:
+    python3 -m benchmarks.bench_storage [--sizes N,N,...] [-o results.json]
+                                        [--compare old_results.json]
+
+For each size, a first process builds the instances, adds them with
+storage.new(), saves them and times a to_dict() round trip of each; a
+second process starts from the saved store and times the reload done by
+`import models`, all() and a second reload(). Both run in a temporary
+directory with the storage selected by the HBNB_* variables, and report
+their wall times, peak RSS and the bytes of the store; read_rss is the
+RSS once the store is loaded, before the second reload.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from benchmarks.common import (Timer, compare, current_rss,
+                               directory_bytes, make_records, peak_rss,
+                               run_phase, write_results)
+
+SIZES = (10000, 100000, 1000000)
+
+
+def write_phase(size):
+    """Returns the metrics of creating and saving size objects."""
+    import models
+    from models.engine.file_storage import hydrate
+
+    records = [record for _, record in make_records(size)]
+    with Timer() as build:
+        objects = [hydrate(record) for record in records]
+    del records
+    storage = models.storage
+    with Timer() as new:
+        for obj in objects:
+            storage.new(obj)
+    with Timer() as save:
+        storage.save()
+    saved_bytes = directory_bytes(".")
+    for obj in random.Random(0).sample(objects, max(1, size // 100)):
+        obj.name = "renamed"
+    with Timer() as resave:
+        storage.save()
+    with Timer() as round_trip:
+        for obj in objects:
+            type(obj)(**obj.to_dict())
+    return {"build_s": build.seconds, "new_s": new.seconds,
+            "save_s": save.seconds, "resave_1pct_s": resave.seconds,
+            "to_dict_round_trip_s": round_trip.seconds,
+            "store_bytes": saved_bytes, "write_peak_rss": peak_rss()}
+
+
+def read_phase(size):
+    """Returns the metrics of reading back a store of size objects."""
+    with Timer() as startup:
+        import models
+    storage = models.storage
+    with Timer() as all_objects:
+        count = sum(1 for _ in storage.all().values())
+    with Timer() as all_places:
+        storage.all("Place")
+    read_rss = current_rss()
+    read_peak = peak_rss()
+    with Timer() as reload:
+        storage.reload()
+    if count != size:
+        raise RuntimeError(f"read {count} objects out of {size}")
+    return {"startup_reload_s": startup.seconds, "all_s": all_objects.seconds,
+            "all_class_s": all_places.seconds, "reload_s": reload.seconds,
+            "read_rss": read_rss, "read_peak_rss": read_peak}
+
+
+def main():
+    """Runs the benchmark and writes its results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma separated store sizes")
+    parser.add_argument("-o", "--output", default="bench_storage.json",
+                        help="results file")
+    parser.add_argument("--compare", help="results file of an older run")
+    parser.add_argument("--phase", choices=("write", "read"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.phase:
+        phase = write_phase if args.phase == "write" else read_phase
+        print(json.dumps(phase(sizes[0])))
+        return
+
+    results = dict()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            metrics = dict()
+            for phase in ("write", "read"):
+                metrics.update(run_phase(
+                    "benchmarks.bench_storage",
+                    ["--phase", phase, "--sizes", str(size)], directory))
+        results[str(size)] = metrics
+        print(size, json.dumps(metrics), file=sys.stderr)
+    write_results(args.output, "bench_storage", results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
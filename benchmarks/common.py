@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""Synthetic stores and measurement helpers shared by the benchmarks."""
+
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# objects of each class per 100 objects of a store
+MIX = (("State", 2), ("City", 10), ("User", 20), ("Amenity", 10),
+       ("Place", 25), ("Review", 33))
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def make_records(count, seed=0, mix=MIX):
+    """
+    Yields the (key, record) pairs of a store of count objects of every
+    class, in the proportions of mix, whose foreign keys point to the
+    objects generated before them.
+    """
+    rng = random.Random(seed)
+    ids = {class_name: list() for class_name, _ in MIX}
+    for i in range(count):
+        n = i % 100
+        for class_name, share in mix:
+            if n < share:
+                break
+            n -= share
+        _id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        created = EPOCH + datetime.timedelta(
+            seconds=rng.randrange(10 ** 7),
+            microseconds=rng.randrange(10 ** 6))
+        record = {"id": _id, "created_at": created.isoformat(),
+                  "updated_at": created.isoformat(),
+                  "__class__": class_name}
+        record.update(fields(class_name, ids, rng))
+        ids[class_name].append(_id)
+        yield class_name + "." + _id, record
+
+
+def fields(class_name, ids, rng):
+    """Returns the class fields of a generated record."""
+    def pick(other):
+        return rng.choice(ids[other]) if ids[other] else ""
+
+    word = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz")
+                   for _ in range(rng.randrange(4, 10)))
+    if class_name == "State":
+        return {"name": word.title()}
+    if class_name == "City":
+        return {"state_id": pick("State"), "name": word.title()}
+    if class_name == "User":
+        return {"email": word + "@example.com", "password": word[::-1],
+                "first_name": word.title(), "last_name": word.upper()}
+    if class_name == "Amenity":
+        return {"name": word}
+    if class_name == "Place":
+        return {"city_id": pick("City"), "user_id": pick("User"),
+                "name": word.title(),
+                "description": " ".join([word] * rng.randrange(1, 20)),
+                "number_rooms": rng.randrange(1, 8),
+                "number_bathrooms": rng.randrange(1, 4),
+                "max_guest": rng.randrange(1, 12),
+                "price_by_night": rng.randrange(20, 500),
+                "latitude": round(rng.uniform(-90, 90), 6),
+                "longitude": round(rng.uniform(-180, 180), 6),
+                "amenity_ids": [pick("Amenity")
+                                for _ in range(rng.randrange(0, 4))]}
+    return {"place_id": pick("Place"), "user_id": pick("User"),
+            "text": " ".join([word] * rng.randrange(1, 40))}
+
+
+def write_store(path, count, seed=0, mix=MIX):
+    """Writes a store of count generated objects to the JSON file path."""
+    with open(path, 'w') as fp:
+        fp.write("{")
+        separator = "\n"
+        for key, record in make_records(count, seed, mix):
+            fp.write(separator + json.dumps(key) + ": " + json.dumps(record))
+            separator = ",\n"
+        fp.write("\n}\n")
+
+
+def directory_bytes(path):
+    """Returns the size of the files under the directory path."""
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def run_phase(module, args, cwd, env=None):
+    """
+    Runs python -m module with args in the directory cwd, with the extra
+    environment variables env, and returns the JSON it prints.
+    """
+    environ = dict(os.environ, **(env or {}))
+    environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (ROOT, environ.get("PYTHONPATH"))))
+    output = subprocess.run([sys.executable, "-m", module, *args], cwd=cwd,
+                            env=environ, stdout=subprocess.PIPE, text=True,
+                            check=True).stdout
+    return json.loads(output)
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes, or its peak
+    where /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as fp:
+            pages = int(fp.read().split()[1])
+    except OSError:
+        return peak_rss()
+    return pages * resource.getpagesize()
+
+
+class Timer:
+    """
+    Context manager measuring the wall time of its block
+
+    Attributes
+    ----------
+    seconds : float
+        wall time of the block once it ended
+    """
+
+    def __enter__(self):
+        """Start the clock."""
+        self.seconds = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop the clock."""
+        self.seconds = time.perf_counter() - self.start
+
+
+def environment():
+    """Returns what the results of a run depend on besides the code."""
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "storage": {name: value for name, value in os.environ.items()
+                        if name.startswith("HBNB_")}}
+
+
+def write_results(path, benchmark, results):
+    """Writes the results of benchmark, with its environment, to path."""
+    with open(path, 'w') as fp:
+        json.dump({"benchmark": benchmark, "environment": environment(),
+                   "results": results}, fp, indent=2)
+        fp.write("\n")
+
+
+def compare(old_path, results):
+    """
+    Prints each metric of results next to its value in the results file
+    old_path and their ratio, new / old.
+    """
+    with open(old_path, 'r') as fp:
+        old = json.load(fp)["results"]
+    print(f"{'case':<12} {'metric':<22} {'old':>14} {'new':>14} "
+          f"{'ratio':>7}")
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            before = old.get(case, {}).get(metric)
+            if before is None:
+                continue
+            ratio = f"{value / before:.2f}" if before else "-"
+            print(f"{case:<12} {metric:<22} {before:>14.6g} {value:>14.6g} "
+                  f"{ratio:>7}")
@@ -1,12 +1,14 @@
 #!/usr/bin/python3
 """Contains the entry point of the command interpreter."""
 
+import ast
 import cmd
 import shlex
 import re
 import json
 from models import BaseModel, User, State, City, Amenity, Place, Review
 from models import storage
+from models.engine.indexes import FOREIGN_KEYS, SPATIAL_FIELDS, TEXT_FIELDS
 
 
 METHODS_CMD = ["all", "show", "destroy", "update", "count"]
@@ -41,23 +43,118 @@ class HBNBCommand(cmd.Cmd):
             print("** invalid dictionary **")
             return
 
+        try:
+            attr_dict = {attr_name: coerce(instance, attr_name, attr_value)
+                         for attr_name, attr_value in attr_dict.items()}
+        except (TypeError, ValueError):
+            print("** invalid value **")
+            return
+
         for attr_name, attr_value in attr_dict.items():
-            if hasattr(instance, attr_name):
-                attr_type = type(getattr(instance, attr_name))
-                setattr(instance, attr_name, attr_type(attr_value))
-            else:
-                setattr(instance, attr_name, attr_value)
+            setattr(instance, attr_name, attr_value)
         instance.save()
 
     def count(self, class_name):
         """
         retrieve the number of instances of a class
         """
-        count_obj = 0
-        for key in storage.all():
-            if key.startswith(class_name):
-                count_obj += 1
-        print(count_obj)
+        print(storage.count(class_name))
+
+    def by_foreign_key(self, class_name, field, args):
+        """
+        Prints all string representation of the instances of class_name
+        whose foreign key field is the id given in args
+        """
+        if not class_exists(class_name):
+            return
+        obj_id = args[0].strip().strip('"') if args else None
+        if not obj_id:
+            print("** instance id missing **")
+            return
+
+        return_list = list()
+        for obj in storage.find_by(class_name, field, obj_id).values():
+            return_list.append(str(obj))
+        print(return_list)
+
+    def spatial(self, class_name, method_name, args):
+        """
+        Prints all string representation of the instances of class_name
+        near a position, nearest first, for
+        <class name>.near(<latitude>, <longitude>, <radius in km>), or
+        inside a box for
+        <class name>.within(<south>, <west>, <north>, <east>)
+        """
+        values = [arg.strip().strip('"') for arg in args]
+        count = 3 if method_name == "near" else 4
+        if len(values) < count or not all(values[:count]):
+            print("** coordinates missing **")
+            return
+        try:
+            numbers = [float(value) for value in values[:count]]
+            if method_name == "near":
+                found = storage.near(class_name, *numbers)
+            else:
+                found = storage.within(class_name, numbers)
+        except ValueError:
+            print("** invalid coordinates **")
+            return
+        print([str(obj) for obj in found.values()])
+
+    def search(self, class_name, args_str):
+        """
+        Prints all string representation of the instances of class_name
+        whose text holds every word, best match first, for
+        <class name>.search("<words>"[, "any"][, <count>]), "any" to
+        match any word and count to print at most count of them
+        """
+        try:
+            args = ast.literal_eval(f"({args_str},)") if args_str else ()
+        except (SyntaxError, ValueError):
+            print("** invalid search **")
+            return
+        if not args:
+            print("** search text missing **")
+            return
+        text, *options = args
+        match = next((arg for arg in options if isinstance(arg, str)), "all")
+        limit = next((arg for arg in options if not isinstance(arg, str)),
+                     None)
+        try:
+            if (not isinstance(text, str) or len(options) > 2 or
+                    limit is not None and (type(limit) is not int or
+                                           limit < 0)):
+                raise ValueError("invalid search")
+            found = storage.search(class_name, text, match, limit)
+        except ValueError:
+            print("** invalid search **")
+            return
+        print([str(obj) for obj in found.values()])
+
+    def where(self, class_name, args_str):
+        """
+        Prints all string representation of the instances of class_name
+        matching <class name>.where(<field>[__<operator>]=<value>, ...),
+        with the options order_by="[-]<field>", limit=<count> and
+        explain=True, which prints the plan of the query after them
+        """
+        if not class_exists(class_name):
+            return
+        try:
+            conditions = keywords(args_str)
+            order_by = conditions.pop("order_by", None)
+            limit = conditions.pop("limit", None)
+            explain = conditions.pop("explain", False)
+            selection = storage.query(class_name).where(**conditions)
+            if order_by is not None:
+                selection = selection.order_by(order_by)
+            results, plan = selection.limit(limit).run()
+        except (AttributeError, SyntaxError, TypeError, ValueError):
+            print("** invalid query **")
+            return
+        print([str(obj) for _, obj in results])
+        if explain:
+            print(plan)
 
     def default(self, line):
         """
@@ -80,6 +177,24 @@ class HBNBCommand(cmd.Cmd):
         update_args = re.search(pattern, line)
         args = match.group(3).split(',') if match.group(3) else []
 
+        # <class name>.by_<foreign key without _id>(<id>)
+        field = method_name[3:] + "_id"
+        if (method_name.startswith("by_") and
+                field in FOREIGN_KEYS.get(class_name, ())):
+            return self.by_foreign_key(class_name, field, args)
+
+        # <class name>.near(...) and <class name>.within(...)
+        if method_name in ("near", "within") and class_name in SPATIAL_FIELDS:
+            return self.spatial(class_name, method_name, args)
+
+        # <class name>.search("<words>"[, "any"][, <count>])
+        if method_name == "search" and class_name in TEXT_FIELDS:
+            return self.search(class_name, match.group(3))
+
+        # <class name>.where(<field>[__<operator>]=<value>, ...)
+        if method_name == "where":
+            return self.where(class_name, match.group(3))
+
         if method_name not in METHODS_CMD:
             return super().default(line)
 
@@ -131,13 +246,13 @@ class HBNBCommand(cmd.Cmd):
             return
 
         attr_name = args[2]
-        attr_value = args[3]
+        try:
+            attr_value = coerce(instance, attr_name, args[3])
+        except (TypeError, ValueError):
+            print("** invalid value **")
+            return
 
-        if hasattr(instance, attr_name):
-            attr_type = type(getattr(instance, attr_name))
-            setattr(instance, attr_name, attr_type(attr_value))
-        else:
-            setattr(instance, attr_name, attr_value)
+        setattr(instance, attr_name, attr_value)
         instance.save()
 
     def do_all(self, arg):
@@ -157,12 +272,8 @@ class HBNBCommand(cmd.Cmd):
                 return
 
         return_list = list()
-        for key, obj in storage.all().items():
-            if criterion:
-                if key.startswith(criterion):
-                    return_list.append(str(obj))
-            else:
-                return_list.append(str(obj))
+        for obj in storage.all(criterion).values():
+            return_list.append(str(obj))
         print(return_list)
 
     def do_destroy(self, arg):
@@ -172,8 +283,8 @@ class HBNBCommand(cmd.Cmd):
         """
         args = parse(arg)
         key, instance = retrieve(*args)
-        if key in storage.all():
-            del storage.all()[key]
+        if instance:
+            storage.delete(instance)
             storage.save()
 
     def do_show(self, arg):
@@ -196,6 +307,14 @@ class HBNBCommand(cmd.Cmd):
             obj.save()
             print(obj.id)
 
+    def do_stats(self, arg):
+        """
+        Prints the storage statistics: saves, flushes, reloads, their
+        timings, objects and bytes written and read, and objects by class.
+        """
+        for name, value in storage.stats().items():
+            print(f"{name}: {value}")
+
     def do_EOF(self, line):
         """Cleanly exit the program."""
         print()
@@ -242,13 +361,38 @@ def retrieve(classname=None, obj_id=None, *args):
         return None, None
 
     key = f"{classname}.{obj_id}"
-    if not (obj := storage.all().get(key)):
+    if not (obj := storage.get(classname, obj_id)):
         print("** no instance found **")
         return None, None
 
     return (key, obj)
 
 
+def coerce(instance, attr_name, attr_value):
+    """
+    Returns attr_value converted to the type of the attribute attr_name
+    of instance, if it has one
+    Raises ValueError or TypeError when it does not convert
+    """
+    if hasattr(instance, attr_name):
+        attr_type = type(getattr(instance, attr_name))
+        return attr_type(attr_value)
+    return attr_value
+
+
+def keywords(args_str):
+    """
+    Returns the dictionary of the keyword arguments <name>=<literal> of
+    args_str, such as 'price_by_night__lt=100, city_id="abc"'
+    Raises SyntaxError or ValueError for anything else
+    """
+    call = ast.parse(f"f({args_str})", mode="eval").body
+    if call.args or any(keyword.arg is None for keyword in call.keywords):
+        raise ValueError("only keyword arguments are allowed")
+    return {keyword.arg: ast.literal_eval(keyword.value)
+            for keyword in call.keywords}
+
+
 def parse(line):
     """
     Convert a series of zero or more strings to an argument tuple
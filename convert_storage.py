@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+"""
+Converts a JSON storage file into a binary snapshot and back.
+
+Usage:
+    ./convert_storage.py to-binary <file.json> <file.bin>
+    ./convert_storage.py to-json <file.bin> <file.json>
+
+Either file may be compressed; the output is compressed by the codec of
+its extension (.gz, .xz or .zz).
+"""
+
+import os
+import sys
+
+
+if __name__ == '__main__':
+    # the models package must not reload ./file.json on import: it fails
+    # when the storage of the directory does not match HBNB_STORAGE_*
+    os.environ["HBNB_STORAGE_RELOAD"] = "0"
+    from models.engine.binary import from_json, to_json
+    if len(sys.argv) == 4 and sys.argv[1] == "to-binary":
+        from_json(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 4 and sys.argv[1] == "to-json":
+        to_json(sys.argv[2], sys.argv[3])
+    else:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
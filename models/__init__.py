@@ -1,7 +1,12 @@
 #!/usr/bin/python3
-"""Create a unique FileStorage instance for your application."""
+"""
+Create a unique FileStorage, or DBStorage, instance for your application,
+and reload it unless HBNB_STORAGE_RELOAD is 0.
+"""
 
+from os import getenv
 from models.engine.file_storage import FileStorage
+from models.engine.db_storage import DBStorage
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -10,5 +15,24 @@ from models.amenity import Amenity
 from models.place import Place
 from models.review import Review
 
-storage = FileStorage()
-storage.reload()
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    storage = DBStorage(getenv("HBNB_SQLITE_PATH", "hbnb.db"),
+                        collect_stats=getenv("HBNB_STORAGE_STATS") != "0")
+else:
+    storage = FileStorage(journal=getenv("HBNB_STORAGE_JOURNAL") == "1",
+                          lazy=getenv("HBNB_STORAGE_LAZY") == "1",
+                          shards=getenv("HBNB_STORAGE_SHARDS"),
+                          flush=getenv("HBNB_STORAGE_FLUSH", "immediate"),
+                          fsync=getenv("HBNB_STORAGE_FSYNC") == "1",
+                          cache=getenv("HBNB_STORAGE_CACHE") != "0",
+                          collect_stats=getenv("HBNB_STORAGE_STATS") != "0",
+                          threaded=getenv("HBNB_STORAGE_THREADED") == "1",
+                          multiprocess=getenv(
+                              "HBNB_STORAGE_MULTIPROCESS") == "1",
+                          workers=getenv("HBNB_STORAGE_WORKERS"),
+                          compression=getenv("HBNB_STORAGE_COMPRESSION"),
+                          compression_level=getenv(
+                              "HBNB_STORAGE_COMPRESSION_LEVEL"),
+                          snapshot_format=getenv("HBNB_STORAGE_FORMAT"))
+if getenv("HBNB_STORAGE_RELOAD") != "0":
+    storage.reload()
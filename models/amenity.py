@@ -12,6 +12,9 @@ class Amenity(BaseModel):
     ----------
     name : str
         empty string
+    interned : frozenset
+        name, shared by many objects
     """
 
     name = ""
+    interned = frozenset({"name"})
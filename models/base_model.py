@@ -5,13 +5,211 @@ used in the project.
 """
 from uuid import uuid4
 import datetime
+import sys
 import models
 
 
-class BaseModel:
+def intern_value(_class, name, value):
+    """
+    Returns value, or its interned copy when it is the id, the class
+    name, a foreign key, a list of foreign keys or a low-cardinality
+    field of _class, so that the objects and records reloaded from storage
+    share one string per value.
+    """
+    if type(value) is str:
+        if (name in ("id", "__class__") or name.endswith("_id") or
+                name in _class.interned):
+            return sys.intern(value)
+    elif type(value) is list and name.endswith("_ids"):
+        return [sys.intern(item) if type(item) is str else item
+                for item in value]
+    return value
+
+
+def intern_fields(_class, dictionary):
+    """Interns, in place, the values of dictionary that intern_value() does."""
+    interned = _class.interned
+    for name, value in dictionary.items():
+        # intern_value() inlined: this runs on every field read lazily
+        if type(value) is str:
+            if (name in ("id", "__class__") or name.endswith("_id") or
+                    name in interned):
+                dictionary[name] = sys.intern(value)
+        elif type(value) is list and name.endswith("_ids"):
+            dictionary[name] = intern_value(_class, name, value)
+
+
+class FieldDefault:
+    """
+    Attribute of the metaclass of a model named after a schema field
+
+    It gives and sets the default of the field on the model declaring it
+    and on its subclasses, so that Place.name still reads "" once name is
+    a slot. A subclass giving the name another attribute reads that one.
+
+    Attributes
+    ----------
+    name : str
+        name of the field
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        """Set the name of the field."""
+        self.name = name
+
+    def __get__(self, cls, metaclass=None):
+        """Returns the default of the field on cls, or its attribute."""
+        if cls is None:
+            return self
+        defaults = cls.__dict__.get("_defaults", {})
+        if self.name in defaults:
+            return defaults[self.name]
+        for base in cls.__mro__:
+            if self.name in base.__dict__:
+                attribute = base.__dict__[self.name]
+                get = getattr(type(attribute), "__get__", None)
+                return attribute if get is None else \
+                    get(attribute, None, cls)
+        raise AttributeError(f"type object {cls.__name__!r} has no "
+                             f"attribute {self.name!r}")
+
+    def __set__(self, cls, value):
+        """Sets the default of the field on cls."""
+        cls.__dict__["_defaults"][self.name] = value
+
+
+class ModelType(type):
+    """
+    Metaclass of the models, storing their declared fields in slots
+
+    The class attributes of a model holding JSON values, such as
+    `name = ""`, declare its schema fields: they become slots, and their
+    values the defaults read while a slot is unset. The class attribute
+    still gives the default, through a FieldDefault of a metaclass made
+    for the model, derived from the metaclass of its base, so that the
+    other models keep plain class attributes of that name.
+
+    Attributes
+    ----------
+    _fields : tuple
+        (name, getter of the slot) pairs of the fields of the class and
+        of its bases, in declaration order; a getter raises
+        AttributeError while its slot is unset
+    _defaults : dictionary
+        default value of each schema field by name
+    models : dictionary
+        every model class by name
+    """
+
+    FIELD_TYPES = (str, int, float, bool, list, dict)
+    models = dict()
+
+    def __new__(mcs, name, bases, namespace):
+        """Turn the schema fields declared in namespace into slots."""
+        defaults = dict()
+        if "__slots__" not in namespace:
+            defaults = {field: value for field, value in namespace.items()
+                        if not field.startswith("_") and
+                        type(value) in mcs.FIELD_TYPES}
+            for field in defaults:
+                del namespace[field]
+            namespace["__slots__"] = tuple(defaults)
+        metaclass = mcs
+        if defaults:
+            metaclass = type(name + "Type", (mcs,), {
+                "__module__": namespace.get("__module__"),
+                **{field: FieldDefault(field) for field in defaults}})
+        cls = super().__new__(metaclass, name, bases, namespace)
+        inherited = getattr(cls, "_fields", ())
+        cls._fields = inherited + tuple(
+            (field, cls.__dict__[field].__get__) for field in cls.__slots__
+            if not field.startswith("_"))
+        cls._defaults = {**getattr(cls, "_defaults", {}), **defaults}
+        mcs.models[name] = cls
+        return cls
+
+
+class Attributes(dict):
+    """
+    Dictionary of the attributes of an instance, given by __dict__
+
+    Setting or deleting one of its keys also sets or deletes the
+    attribute of the instance, marking it dirty in storage as setattr()
+    does.
+
+    Attributes
+    ----------
+    owner : BaseModel
+        instance whose attributes the dictionary holds
+    """
+
+    __slots__ = ("owner",)
+
+    def __init__(self, owner, attributes):
+        """Hold the attributes of owner."""
+        super().__init__(attributes)
+        self.owner = owner
+
+    def __setitem__(self, name, value):
+        """Sets the attribute name of the owner."""
+        setattr(self.owner, name, value)
+        dict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        """Deletes the attribute name of the owner."""
+        dict.__delitem__(self, name)
+        delattr(self.owner, name)
+
+    def update(self, *args, **kwargs):
+        """Sets every (name, value) pair of args and kwargs."""
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+
+    def setdefault(self, name, default=None):
+        """Returns the attribute name, setting default if missing."""
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def pop(self, name, *default):
+        """Deletes the attribute name and returns it, or default."""
+        if name not in self:
+            return dict.pop(self, name, *default)
+        value = self[name]
+        del self[name]
+        return value
+
+    def popitem(self):
+        """Deletes the last attribute and returns its (name, value)."""
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        name = next(reversed(self))
+        return name, self.pop(name)
+
+    def clear(self):
+        """Deletes every attribute."""
+        for name in list(self):
+            del self[name]
+
+    def __ior__(self, other):
+        """Sets every (name, value) pair of other."""
+        self.update(other)
+        return self
+
+
+class BaseModel(metaclass=ModelType):
     """
     Defines all common attributes/methods for other classes.
 
+    The declared attributes live in slots (see ModelType); the others,
+    such as those set by the console's update, live in an overflow
+    dictionary created with the first of them. __dict__ gives them all,
+    as a new Attributes dictionary writing through to the instance, in
+    place of the instance dictionary. Instances can be weakly
+    referenced, as by the identity map of DBStorage.
+
     Attributes
     ----------
     id : string
@@ -20,29 +218,120 @@ class BaseModel:
         date and time of creation
     updated_at : datetime.datetime
         date and time when instance was last modified
+    interned : frozenset
+        names of the low-cardinality string fields, interned on load
+        along with the ids and foreign keys
+    __overflow : dictionary
+        undeclared attributes, None until one is set
     """
 
+    __slots__ = ("id", "created_at", "updated_at", "__overflow",
+                 "__weakref__")
+    interned = frozenset()
+
+    def __new__(cls, *args, **kwargs):
+        """Create an instance without undeclared attributes."""
+        obj = super().__new__(cls)
+        object.__setattr__(obj, "_BaseModel__overflow", None)
+        return obj
+
     def __init__(self, *args, **kwargs):
+        # a new instance is not in storage yet: no storage callbacks
         if kwargs:
-            self.create_from_dict(kwargs)
+            self.__update(kwargs)
         else:
-            self.id = str(uuid4())
-            self.created_at = datetime.datetime.now()
-            self.updated_at = datetime.datetime.now()
+            self.__set("id", str(uuid4()))
+            self.__set("created_at", datetime.datetime.now())
+            self.__set("updated_at", datetime.datetime.now())
             models.storage.new(self)
 
     def create_from_dict(self, dictionary):
         """Create BaseModel object from dictionary."""
+        self.__update(dictionary)
+        # once for all the attributes
+        models.storage.mark_dirty(self)
 
+    def __update(self, dictionary):
+        """Sets the attributes of a stored dictionary."""
         for key, value in dictionary.items():
             if key == '__class__':
-                pass
-            elif key == 'created_at':
-                self.created_at = datetime.datetime.fromisoformat(value)
-            elif key == 'updated_at':
-                self.updated_at = datetime.datetime.fromisoformat(value)
+                continue
+            elif key in ('created_at', 'updated_at'):
+                if type(value) is not datetime.datetime:
+                    # binary snapshots give datetimes, JSON ISO strings
+                    value = datetime.datetime.fromisoformat(value)
             else:
-                setattr(self, key, value)
+                value = intern_value(type(self), key, value)
+            self.__set(key, value)
+
+    @property
+    def __dict__(self):
+        """
+        Returns a new dictionary of the attributes set on the instance,
+        whose changes are made to the instance too.
+        """
+        return Attributes(self, self.__attributes())
+
+    def __attributes(self):
+        """Returns a new dictionary of the attributes set on the instance."""
+        attributes = dict()
+        for name, get in type(self)._fields:
+            try:
+                attributes[name] = get(self)
+            except AttributeError:
+                pass
+        if self.__overflow:
+            attributes.update(self.__overflow)
+        return attributes
+
+    def __getattr__(self, name):
+        """Returns an undeclared attribute, or the default of a field."""
+        overflow = self.__overflow
+        if overflow and name in overflow:
+            return overflow[name]
+        try:
+            return type(self)._defaults[name]
+        except KeyError:
+            raise AttributeError(f"{type(self).__name__!r} object has no "
+                                 f"attribute {name!r}") from None
+
+    def __setattr__(self, name, value):
+        """Sets the attribute and marks the instance dirty in storage."""
+        try:
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            self.__set(name, value)
+        models.storage.mark_dirty(self, name)
+
+    def __delattr__(self, name):
+        """Deletes the attribute, from its slot or the overflow."""
+        try:
+            object.__delattr__(self, name)
+        except AttributeError:
+            if not self.__overflow or name not in self.__overflow:
+                raise
+            del self.__overflow[name]
+
+    def __set(self, name, value):
+        """Sets the attribute in its slot or in the overflow."""
+        try:
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            if self.__overflow is None:
+                object.__setattr__(self, "_BaseModel__overflow", dict())
+            self.__overflow[name] = value
+
+    def __getstate__(self):
+        """Returns the attributes to pickle or copy."""
+        return self.__attributes()
+
+    def __setstate__(self, state):
+        """
+        Sets the attributes of state, without storage callbacks, sharing
+        the strings intern_value() interns.
+        """
+        for name, value in state.items():
+            self.__set(name, intern_value(type(self), name, value))
 
     def __str__(self):
         """Prints [<class name>] (<self.id>) <self.__dict__>."""
@@ -57,14 +346,25 @@ class BaseModel:
         """
 
         self.updated_at = datetime.datetime.now()
+        models.storage.mark_dirty(self)
         models.storage.save()
 
+    async def asave(self):
+        """
+        Awaitable save(): updates updated_at and returns once the storage
+        wrote the change without blocking the event loop.
+        """
+
+        self.updated_at = datetime.datetime.now()
+        models.storage.mark_dirty(self)
+        await models.storage.asave()
+
     def to_dict(self):
         """
         Returns a dictionary containing all keys/values of __dict__
         of the instance.
         """
-        model_dict = self.__dict__.copy()
+        model_dict = self.__attributes()
         model_dict["__class__"] = self.__class__.__name__
         model_dict["created_at"] = self.created_at.isoformat()
         model_dict["updated_at"] = self.updated_at.isoformat()
@@ -14,7 +14,10 @@ class City(BaseModel):
         empty string
     name : str
         empty string
+    interned : frozenset
+        name, shared by many objects
     """
 
     state_id = ""
     name = ""
+    interned = frozenset({"name"})
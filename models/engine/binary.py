@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+"""
+Writes and reads storage snapshots in a compact binary format.
+
+A snapshot is MAGIC, a frame per member, then an END byte. A frame is a
+kind byte, the varint length of its payload and the payload: the key,
+unless it is <__class__>.<id> of the record (kind DERIVED), then the
+record as a typed value. A value starts with a tag byte: integers are
+zigzag varints, floats IEEE doubles, and naive datetimes the varint
+microseconds since EPOCH. Strings holding a naive ISO datetime are
+written the same way under their own tag, ISO_STRING, and always read
+back as strings: only datetimes are read back as datetimes.
+
+Strings of at most SHARED_BYTES bytes go to a string table the first
+time they are written, and are then written as their index in it, so
+class names and foreign keys are stored once per file. Likewise the keys
+of a dictionary, its shape, are written the first time only, and the
+dictionaries of the same shape, such as the records of a class, are
+written as the index of their shape followed by their values. Both
+tables are built as the file is written and read, so a snapshot streams
+one member at a time both ways.
+
+JSON snapshots convert to this format and back without loss: see
+from_json() and to_json().
+
+Snapshots of the first version, MAGIC_V1, wrote datetimes and ISO
+strings under the same tag. They are still read, with only the
+created_at and updated_at of their records turned into datetimes.
+"""
+
+import datetime
+import io
+import json
+import os
+import struct
+from models.engine import jsonstream
+from models.engine.jsonstream import (atomic_open, codec_of, detect,
+                                      iter_object, open_binary, write_object)
+
+MAGIC = b"\x89HBS\x02"
+MAGIC_V1 = b"\x89HBS\x01"
+STAMPS = ("created_at", "updated_at")
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+SHARED_BYTES = 64
+DOUBLE = struct.Struct("<d")
+
+# frame kinds
+DERIVED, KEYED, END = range(3)
+# value tags
+(NONE, FALSE, TRUE, INT, FLOAT, STRING, TEXT, REF, DATETIME, LIST,
+ DICT, SHAPED, ISO_STRING) = range(13)
+
+
+def write_varint(out, number):
+    """Appends the unsigned varint of number to the bytearray out."""
+    while number >= 0x80:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def read_varint(data, pos):
+    """Returns the unsigned varint at pos in data and the next position."""
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    number = byte & 0x7f
+    shift = 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, pos + 1
+        shift += 7
+
+
+def zigzag(number):
+    """Maps a signed integer to an unsigned one, small for small values."""
+    return number << 1 if number >= 0 else (-number << 1) - 1
+
+
+def unzigzag(number):
+    """Reverses zigzag()."""
+    return number >> 1 if not number & 1 else -((number + 1) >> 1)
+
+
+def iso_datetime(text):
+    """
+    Returns the naive datetime written as text by isoformat(), None for
+    any other string.
+    """
+    if len(text) not in (19, 26) or text[10] != "T":
+        return None
+    try:
+        value = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    # other spellings of the same datetime would not read back as text
+    return value if value.isoformat() == text else None
+
+
+class Encoder:
+    """
+    Encodes members into frames, sharing a string table between them
+
+    Attributes
+    ----------
+    table : dictionary
+        index of each string of the table
+    shapes : dictionary
+        index of each tuple of dictionary keys written
+    """
+
+    def __init__(self):
+        """Start with empty string and shape tables."""
+        self.table = dict()
+        self.shapes = dict()
+
+    def frame(self, key, record):
+        """Returns the frame of the member (key, record)."""
+        out = bytearray()
+        try:
+            derived = key == record["__class__"] + "." + record["id"]
+        except (KeyError, TypeError):
+            derived = False
+        if not derived:
+            self.string(out, key)
+        self.value(out, record)
+        head = bytearray((DERIVED if derived else KEYED,))
+        write_varint(head, len(out))
+        return bytes(head + out)
+
+    def string(self, out, text):
+        """Appends text, as a string and never as a datetime."""
+        index = self.table.get(text)
+        if index is not None:
+            out.append(REF)
+            write_varint(out, index)
+            return
+        data = text.encode()
+        if len(data) <= SHARED_BYTES:
+            self.table[text] = len(self.table)
+            out.append(STRING)
+        else:
+            out.append(TEXT)
+        write_varint(out, len(data))
+        out += data
+
+    def value(self, out, value):
+        """Appends the typed value, which must be JSON serializable."""
+        kind = type(value)
+        if kind is str:
+            moment = None if value in self.table else iso_datetime(value)
+            if moment is None:
+                self.string(out, value)
+            else:
+                out.append(ISO_STRING)
+                write_varint(out, zigzag((moment - EPOCH) // MICROSECOND))
+            return
+        if kind is datetime.datetime and value.tzinfo is None:
+            out.append(DATETIME)
+            write_varint(out, zigzag((value - EPOCH) // MICROSECOND))
+        elif value is None:
+            out.append(NONE)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            write_varint(out, zigzag(int(value)))
+        elif isinstance(value, float):
+            out.append(FLOAT)
+            out += DOUBLE.pack(value)
+        elif isinstance(value, str):
+            self.value(out, str(value))
+        elif isinstance(value, dict):
+            shape = tuple(value)
+            index = self.shapes.get(shape)
+            if index is None:
+                self.shapes[shape] = len(self.shapes)
+                out.append(DICT)
+                write_varint(out, len(shape))
+                for name in shape:
+                    if not isinstance(name, str):
+                        raise TypeError("keys must be str, "
+                                        f"not {type(name).__name__}")
+                    self.string(out, str(name))
+            else:
+                out.append(SHAPED)
+                write_varint(out, index)
+            for item in value.values():
+                self.value(out, item)
+        elif isinstance(value, (list, tuple)):
+            out.append(LIST)
+            write_varint(out, len(value))
+            for item in value:
+                self.value(out, item)
+        else:
+            raise TypeError(f"Object of type {kind.__name__} "
+                            "is not serializable")
+
+
+class Decoder:
+    """
+    Decodes frames, rebuilding the string table of their encoder
+
+    Attributes
+    ----------
+    table : list
+        strings of the table by index
+    shapes : list
+        tuples of dictionary keys by index
+    datetimes : bool
+        decode datetimes as datetime.datetime instead of ISO strings
+    legacy : bool
+        frames of a MAGIC_V1 snapshot
+    """
+
+    def __init__(self, datetimes=False, legacy=False):
+        """Start with empty string and shape tables."""
+        self.table = list()
+        self.shapes = list()
+        self.datetimes = datetimes and not legacy
+        self.legacy = legacy
+        self.stamps = datetimes and legacy
+
+    def frame(self, kind, payload):
+        """Returns the member (key, record) of the frame."""
+        pos = 0
+        if kind == KEYED:
+            key, pos = self.value(payload, pos)
+        record, pos = self.value(payload, pos)
+        if pos != len(payload):
+            raise ValueError("frame longer than its value")
+        if kind == DERIVED:
+            key = record["__class__"] + "." + record["id"]
+        if self.stamps and type(record) is dict:
+            for name in STAMPS:
+                if type(record.get(name)) is str:
+                    record[name] = datetime.datetime.fromisoformat(
+                        record[name])
+        return key, record
+
+    def value(self, data, pos):
+        """Returns the value at pos in data and the next position."""
+        tag = data[pos]
+        pos += 1
+        if tag == REF:
+            index, pos = read_varint(data, pos)
+            return self.table[index], pos
+        if tag == STRING or tag == TEXT:
+            size, pos = read_varint(data, pos)
+            if pos + size > len(data):
+                raise ValueError("string runs past its frame")
+            text = data[pos:pos + size].decode()
+            if tag == STRING:
+                self.table.append(text)
+            return text, pos + size
+        if tag == DATETIME or tag == ISO_STRING:
+            number, pos = read_varint(data, pos)
+            moment = EPOCH + unzigzag(number) * MICROSECOND
+            if tag == DATETIME and self.datetimes:
+                return moment, pos
+            return moment.isoformat(), pos
+        if tag == INT:
+            number, pos = read_varint(data, pos)
+            return unzigzag(number), pos
+        if tag == SHAPED or tag == DICT:
+            index, pos = read_varint(data, pos)
+            if tag == DICT:
+                shape = list()
+                for _ in range(index):
+                    name, pos = self.value(data, pos)
+                    shape.append(name)
+                index = len(self.shapes)
+                self.shapes.append(shape)
+            value = dict()
+            for name in self.shapes[index]:
+                value[name], pos = self.value(data, pos)
+            return value, pos
+        if tag == LIST:
+            size, pos = read_varint(data, pos)
+            value = list()
+            for _ in range(size):
+                item, pos = self.value(data, pos)
+                value.append(item)
+            return value, pos
+        if tag == FLOAT:
+            return DOUBLE.unpack_from(data, pos)[0], pos + DOUBLE.size
+        if tag in (NONE, FALSE, TRUE):
+            return (None, False, True)[tag], pos
+        raise ValueError(f"unknown value tag {tag}")
+
+
+def write_records(fp, members):
+    """
+    Writes members, (key, record) pairs, to the binary file fp as a
+    snapshot. Only one member is encoded at a time. Returns the number
+    of bytes written.
+    """
+    encoder = Encoder()
+    written = fp.write(MAGIC)
+    for key, record in members:
+        written += fp.write(encoder.frame(key, record))
+    return written + fp.write(bytes((END,)))
+
+
+def iter_records(fp, datetimes=False):
+    """
+    Yields the (key, record) members of the snapshot in the binary file
+    fp, with datetimes as datetime.datetime if datetimes is True.
+    """
+    magic = fp.read(len(MAGIC))
+    if magic not in (MAGIC, MAGIC_V1):
+        raise ValueError("not a binary snapshot")
+    decoder = Decoder(datetimes, legacy=magic == MAGIC_V1)
+    while True:
+        kind = fp.read(1)
+        if not kind:
+            raise EOFError("binary snapshot ended before its end marker")
+        if kind[0] == END:
+            return
+        if kind[0] not in (DERIVED, KEYED):
+            raise ValueError(f"unknown frame kind {kind[0]}")
+        head = bytearray()
+        while not head or head[-1] >= 0x80:
+            byte = fp.read(1)
+            if not byte:
+                raise EOFError("binary snapshot ended inside a frame")
+            head += byte
+        size = read_varint(head, 0)[0]
+        payload = fp.read(size)
+        if len(payload) != size:
+            raise EOFError("binary snapshot ended inside a frame")
+        yield decoder.frame(kind[0], payload)
+
+
+def is_binary(fp):
+    """Returns whether the binary file fp, which can peek, is a snapshot."""
+    return fp.peek(len(MAGIC))[:len(MAGIC)] in (MAGIC, MAGIC_V1)
+
+
+def iter_file(path, datetimes=False):
+    """
+    Yields the (key, record) members of the snapshot at path, binary or
+    JSON, compressed or not. Only binary snapshots give datetimes.
+
+    A plain JSON file smaller than jsonstream.STREAM_MIN_BYTES is decoded
+    at once, and each record is dropped from the decoded object as it is
+    yielded; compressed or larger ones are read one member at a time.
+    """
+    with open(path, 'rb') as fp:
+        plain = detect(fp.read(6)) is None
+    small = os.path.getsize(path) < jsonstream.STREAM_MIN_BYTES
+    with open_binary(path) as fp:
+        if is_binary(fp):
+            yield from iter_records(fp, datetimes)
+        elif plain and small:
+            members = json.load(fp)
+            if type(members) is not dict:
+                raise ValueError(f"{path} does not hold a JSON object")
+            for key in list(members):
+                yield key, members.pop(key)
+        else:
+            yield from iter_object(io.TextIOWrapper(fp, encoding="utf-8"))
+
+
+def from_json(json_path, path):
+    """
+    Writes the JSON snapshot json_path as a binary snapshot at path,
+    compressed by the codec of its extension.
+    """
+    with atomic_open(path, codec=codec_of(path), binary=True) as fp:
+        write_records(fp, iter_file(json_path))
+
+
+def to_json(path, json_path):
+    """
+    Writes the binary snapshot path as a JSON snapshot at json_path,
+    compressed by the codec of its extension.
+    """
+    members = ((key, json.dumps(record)) for key, record in iter_file(path))
+    with atomic_open(json_path, codec=codec_of(json_path)) as fp:
+        write_object(fp, members)
@@ -0,0 +1,466 @@
+#!/usr/bin/python3
+"""Handles SQLite storage."""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from models.base_model import BaseModel
+from models.user import User
+from models.state import State
+from models.city import City
+from models.amenity import Amenity
+from models.place import Place
+from models.review import Review
+from models.engine.indexes import AGGREGATES, FOREIGN_KEYS, TEXT_FIELDS
+from models.engine.indexes import TextIndex, tokens
+from models.engine.indexes import bbox_around, check_bbox, distance_km
+from models.engine.indexes import in_bbox, numeric_value, position
+from models.engine.query import Query, order
+
+CLASSES = {
+    "BaseModel": BaseModel, "User": User, "State": State, "City": City,
+    "Amenity": Amenity, "Place": Place, "Review": Review
+}
+
+
+class DBStorage:
+    """
+    Stores instances in a SQLite database, one table per class
+
+    Each row holds the id, the timestamps and the foreign keys of an
+    instance in their own columns and its whole dictionary as JSON.
+    Objects only leave the database when they are asked for, and save()
+    upserts the rows of the objects changed since the last save in one
+    transaction. Pending changes are written, without commit, before
+    every query so that queries see them. Unless collect_stats is False,
+    saves are counted and timed along with the rows they commit; see
+    stats().
+
+    asave() runs save() in a worker thread. The pending changes and the
+    transaction are guarded by a lock meanwhile.
+
+    Attributes
+    ----------
+    __db_path : string
+        path to the SQLite database
+    __connection : sqlite3.Connection
+        connection opened by reload()
+    __objects : weakref.WeakValueDictionary
+        objects read or created in this session by <class name>.id, as
+        long as they are used elsewhere or hold unsaved changes
+    __changes : dictionary
+        objects changed since the last write by <class name>.id, None
+        for deleted objects
+    __written : dictionary
+        <class name>.id of the rows written since the last commit, with
+        None values
+    __lock : threading.RLock
+        lock of __changes, __written and the transaction
+    collect_stats : bool
+        update __stats
+    __stats : dictionary
+        counters and timers of the saves
+    """
+
+    def __init__(self, db_path="hbnb.db", collect_stats=True):
+        """Set the path of the database."""
+        self.__db_path = db_path
+        self.__connection = None
+        self.__objects = weakref.WeakValueDictionary()
+        self.__changes = dict()
+        self.__written = dict()
+        self.__lock = threading.RLock()
+        self.collect_stats = collect_stats
+        self.__stats = {"saves": 0, "last_save_seconds": 0.0,
+                        "save_seconds": 0.0, "rows_written": 0}
+
+    def reload(self):
+        """Opens the database and creates the missing tables."""
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+            # asave() writes from a worker thread, under __lock
+            self.__connection = sqlite3.connect(self.__db_path,
+                                                check_same_thread=False)
+            self.__objects.clear()
+            self.__changes.clear()
+            self.__written.clear()
+            self.__create_tables()
+
+    def __create_tables(self):
+        """Creates the tables, and the indexes, that are missing."""
+        with self.__connection:
+            for class_name in CLASSES:
+                fields = FOREIGN_KEYS.get(class_name, ())
+                columns = "".join(f", {field} TEXT" for field in fields)
+                self.__connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{class_name}" ('
+                    f'id TEXT PRIMARY KEY, created_at TEXT, '
+                    f'updated_at TEXT{columns}, data TEXT NOT NULL)')
+                for field in fields:
+                    self.__connection.execute(
+                        f'CREATE INDEX IF NOT EXISTS '
+                        f'"{class_name}_{field}" ON "{class_name}" ({field})')
+
+    def close(self):
+        """Closes the database without saving."""
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __load(self, class_name, data):
+        """Returns the instance of a row, reusing the one in memory."""
+        record = json.loads(data)
+        key = class_name + "." + record["id"]
+        obj = self.__objects.get(key)
+        if obj is None:
+            obj = CLASSES[class_name](**record)
+            self.__objects[key] = obj
+        return obj
+
+    def __query(self, class_name, where="", params=()):
+        """Returns a dictionary of the objects of a query on one table."""
+        self.__flush()
+        rows = self.__connection.execute(
+            f'SELECT data FROM "{class_name}"{where}', params)
+        objects = dict()
+        for (data,) in rows:
+            obj = self.__load(class_name, data)
+            objects[class_name + "." + obj.id] = obj
+        return objects
+
+    def all(self, cls=None):
+        """
+        Returns a dictionary of all the objects, or of the objects of cls,
+        a class or class name, by <class name>.id
+        """
+        if cls is None:
+            objects = dict()
+            for class_name in CLASSES:
+                objects.update(self.__query(class_name))
+            return objects
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in CLASSES:
+            return dict()
+        return self.__query(class_name)
+
+    def get(self, cls, obj_id):
+        """Returns the object of cls with obj_id, or None."""
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in CLASSES:
+            return None
+        key = class_name + "." + obj_id
+        obj = self.__objects.get(key)
+        if obj is not None:
+            return obj
+        if key in self.__changes:
+            return None
+        objects = self.__query(class_name, " WHERE id = ?", (obj_id,))
+        return objects.get(key)
+
+    def count(self, cls=None):
+        """Returns the number of objects, or of objects of cls."""
+        if cls is not None and not isinstance(cls, str):
+            cls = cls.__name__
+        if cls is not None and cls not in CLASSES:
+            return 0
+        self.__flush()
+        total = 0
+        for class_name in (CLASSES if cls is None else (cls,)):
+            total += self.__connection.execute(
+                f'SELECT COUNT(*) FROM "{class_name}"').fetchone()[0]
+        return total
+
+    def find_by(self, cls, field, value):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose field equals value. Foreign keys are looked up in their
+        column index, other fields are compared object by object.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if field in FOREIGN_KEYS.get(class_name, ()):
+            return self.__query(class_name, f" WHERE {field} = ?", (value,))
+        return {key: obj for key, obj in self.all(class_name).items()
+                if getattr(obj, field, None) == value}
+
+    @staticmethod
+    def __field(class_name, field):
+        """
+        Returns the SQL expression of field in the JSON data, and its
+        parameters: the class default stands for a missing number, as
+        it does for the attribute.
+        """
+        path = '$."' + field + '"'
+        default = numeric_value(CLASSES[class_name]._defaults.get(field))
+        if default is None:
+            return "json_extract(data, ?)", (path,)
+        return "COALESCE(json_extract(data, ?), ?)", (path, default)
+
+    def __ranges_where(self, class_name, ranges):
+        """
+        Returns the WHERE clause and parameters of ranges, inclusive
+        (low, high) bounds by field where None is open, on the JSON data.
+        """
+        conditions = list()
+        params = list()
+        for field, (low, high) in ranges.items():
+            value, value_params = self.__field(class_name, field)
+            conditions.append(f"typeof({value}) IN ('integer', 'real')")
+            params.extend(value_params)
+            for bound, operator in ((low, ">="), (high, "<=")):
+                if bound is not None:
+                    conditions.append(f"{value} {operator} ?")
+                    params.extend((*value_params, bound))
+        if not conditions:
+            return "", ()
+        return " WHERE " + " AND ".join(conditions), tuple(params)
+
+    def find_range(self, cls, **ranges):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose fields hold numbers inside ranges, inclusive (low, high)
+        bounds by field where None is open.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in CLASSES:
+            return dict()
+        return self.__query(class_name,
+                            *self.__ranges_where(class_name, ranges))
+
+    def find_sorted(self, cls, field, reverse=False, **ranges):
+        """
+        Returns a dictionary of the objects of cls found by find_range(),
+        field being one of the ranges, ordered by the number in field and
+        then by key, or the other way round with reverse.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in CLASSES:
+            return dict()
+        ranges.setdefault(field, (None, None))
+        where, params = self.__ranges_where(class_name, ranges)
+        value, value_params = self.__field(class_name, field)
+        order = " DESC" if reverse else ""
+        return self.__query(
+            class_name, f"{where} ORDER BY {value}{order}, id{order}",
+            (*params, *value_params))
+
+    def aggregate(self, cls, field, function="sum", **ranges):
+        """
+        Returns the aggregate function, one of indexes.AGGREGATES, of the
+        numbers in field of the objects of cls found by find_range().
+        """
+        if function not in AGGREGATES:
+            raise ValueError(f"unknown aggregate {function!r}")
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in CLASSES:
+            return 0 if function in ("count", "sum") else None
+        ranges.setdefault(field, (None, None))
+        where, params = self.__ranges_where(class_name, ranges)
+        value, value_params = self.__field(class_name, field)
+        sql = {"count": "COUNT", "sum": "SUM", "min": "MIN",
+               "max": "MAX", "mean": "AVG"}[function]
+        self.__flush()
+        (result,), = self.__connection.execute(
+            f'SELECT {sql}({value}) FROM "{class_name}"{where}',
+            (*value_params, *params))
+        if function == "sum" and result is None:
+            return 0
+        return result
+
+    def near(self, cls, lat, lon, radius_km):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        at most radius_km from the position (lat, lon) in degrees, nearest
+        first. Only the rows in the latitudes of the circle are read.
+        """
+        south, _, north, _ = bbox_around(lat, lon, radius_km)
+        found = list()
+        for key, obj in self.find_range(cls, latitude=(south, north),
+                                        longitude=(-180, 180)).items():
+            where = position(obj)
+            if where is not None:
+                distance = distance_km(lat, lon, *where)
+                if distance <= radius_km:
+                    found.append((distance, key, obj))
+        found.sort(key=lambda item: item[:2])
+        return {key: obj for _, key, obj in found}
+
+    def within(self, cls, bbox):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        inside bbox, (south, west, north, east) in degrees; west greater
+        than east crosses the 180th meridian.
+        """
+        bbox = check_bbox(bbox)
+        found = self.find_range(cls, latitude=(bbox[0], bbox[2]),
+                                longitude=(-180, 180))
+        return {key: obj for key, obj in found.items()
+                if in_bbox(*position(obj), bbox)}
+
+    def search(self, cls, text, match="all", limit=None):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose text fields (see indexes.TEXT_FIELDS) hold all the words of
+        text, or any of them for match "any", ranked by the number of
+        times the words occur, at most limit of them when given. For
+        match "all", only the rows whose fields contain every ASCII word,
+        whatever the case, leave the database.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        if class_name not in TEXT_FIELDS:
+            raise ValueError(f"{class_name} has no text fields")
+        index = TextIndex(class_name, TEXT_FIELDS[class_name])
+        conditions = list()
+        params = list()
+        if match == "all":
+            for word in dict.fromkeys(tokens(text)):
+                if not word.isascii():
+                    continue
+                pattern = "%" + word.replace("_", "\\_") + "%"
+                conditions.append("(" + " OR ".join(
+                    "json_extract(data, ?) LIKE ? ESCAPE '\\'"
+                    for _ in index.fields) + ")")
+                for field in index.fields:
+                    params.extend(('$."' + field + '"', pattern))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self.__query(class_name, where, params)
+        for key, obj in rows.items():
+            index.add(key, obj)
+        return {key: rows[key]
+                for _, key in index.search(text, match, limit)}
+
+    def query(self, cls):
+        """
+        Returns a query on the objects of cls, a class or class name (see
+        models.engine.query).
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        return Query(class_name, self.__run_query)
+
+    def __run_query(self, selection):
+        """
+        Returns the results of the query selection and its plan: the
+        conditions on foreign keys select rows on their column index,
+        the others are checked object by object.
+        """
+        class_name = selection.class_name
+        conditions = list()
+        params = list()
+        for condition in selection.conditions:
+            values = (condition.value,) if condition.operator == "eq" \
+                else condition.value
+            if (condition.field not in FOREIGN_KEYS.get(class_name, ()) or
+                    condition.operator not in ("eq", "in") or not values or
+                    not all(isinstance(value, str) for value in values)):
+                continue
+            marks = ", ".join("?" * len(values))
+            conditions.append(f"{condition.field} IN ({marks})")
+            params.extend(values)
+        rows = dict()
+        if class_name in CLASSES:
+            where = " WHERE " + " AND ".join(conditions) if conditions \
+                else ""
+            rows = self.__query(class_name, where, params)
+        results = order(selection, [(key, obj) for key, obj in rows.items()
+                                    if selection.matches(obj)])
+        fields = [condition.split()[0] for condition in conditions]
+        return results, {"class": class_name,
+                         "path": "foreign key column" if fields else "scan",
+                         "index": ", ".join(fields) or None,
+                         "candidates": len(rows), "examined": len(rows),
+                         "returned": len(results)}
+
+    def new(self, obj):
+        """Adds obj to the objects to write on the next save."""
+        key = obj.__class__.__name__ + "." + obj.id
+        with self.__lock:
+            self.__objects[key] = obj
+            self.__changes[key] = obj
+
+    def mark_dirty(self, obj, name=None):
+        """Records that a stored obj changed since the last save."""
+        _id = getattr(obj, "id", None)
+        if _id is None:
+            return
+        key = obj.__class__.__name__ + "." + _id
+        if self.__objects.get(key) is obj:
+            with self.__lock:
+                self.__changes[key] = obj
+
+    def delete(self, obj=None):
+        """Deletes obj from the database on the next save."""
+        if obj is None:
+            return
+        key = obj.__class__.__name__ + "." + obj.id
+        with self.__lock:
+            self.__objects.pop(key, None)
+            self.__changes[key] = None
+
+    def stats(self):
+        """
+        Returns the counters and timers of the saves, empty when
+        collect_stats is False, with the number of stored objects, in all
+        and by class.
+        """
+        stats = self.__stats.copy() if self.collect_stats else {}
+        stats["pending_changes"] = len(self.__changes)
+        classes = {class_name: self.count(class_name)
+                   for class_name in CLASSES}
+        stats["objects"] = sum(classes.values())
+        stats["classes"] = {class_name: count
+                            for class_name, count in classes.items() if count}
+        return stats
+
+    def __flush(self):
+        """Writes the pending changes in the current transaction."""
+        with self.__lock:
+            self.__write()
+
+    def __write(self):
+        """Writes the pending changes, holding __lock."""
+        for key, obj in self.__changes.items():
+            class_name, _, obj_id = key.partition(".")
+            if obj is None:
+                self.__connection.execute(
+                    f'DELETE FROM "{class_name}" WHERE id = ?', (obj_id,))
+                continue
+            record = obj.to_dict()
+            fields = FOREIGN_KEYS.get(class_name, ())
+            values = [record["id"], record["created_at"],
+                      record["updated_at"]]
+            for field in fields:
+                value = getattr(obj, field, None)
+                values.append(value if isinstance(value, str) else None)
+            values.append(json.dumps(record))
+            columns = ["id", "created_at", "updated_at", *fields, "data"]
+            self.__connection.execute(
+                f'INSERT INTO "{class_name}" ({", ".join(columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))}) '
+                f'ON CONFLICT(id) DO UPDATE SET ' +
+                ", ".join(f"{column} = excluded.{column}"
+                          for column in columns[1:]), values)
+        self.__written.update(dict.fromkeys(self.__changes))
+        self.__changes.clear()
+
+    def save(self):
+        """Writes and commits the changes since the last save."""
+        start = time.perf_counter()
+        with self.__lock:
+            with self.__connection:
+                self.__write()
+            written = len(self.__written)
+            self.__written.clear()
+        if self.collect_stats:
+            seconds = time.perf_counter() - start
+            self.__stats["saves"] += 1
+            self.__stats["last_save_seconds"] = seconds
+            self.__stats["save_seconds"] += seconds
+            self.__stats["rows_written"] += written
+
+    async def asave(self):
+        """Awaitable save(): writes and commits off the event loop."""
+        await asyncio.to_thread(self.save)
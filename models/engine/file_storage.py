@@ -1,15 +1,59 @@
 #!/usr/bin/python3
 """Handles File storage."""
 
+import asyncio
+import atexit
+import contextlib
+import datetime
 import json
+import os
 import os.path
-from models.base_model import BaseModel
+import threading
+import time
+from models.base_model import BaseModel, intern_fields
 from models.user import User
 from models.state import State
 from models.city import City
 from models.amenity import Amenity
 from models.place import Place
 from models.review import Review
+from models.engine.object_registry import ObjectRegistry
+from models.engine.indexes import ColumnIndex, ForeignKeyIndex, GridIndex
+from models.engine.indexes import SortedIndex, TextIndex, intersect
+from models.engine.indexes import aggregate_values, in_ranges
+from models.engine.indexes import bbox_around, check_bbox, distance_km
+from models.engine.indexes import in_bbox, position, storage_indexes
+from models.engine import indexes
+from models.engine.db_storage import CLASSES
+from models.engine import sharding, parallel
+from models.engine import binary, jsonstream
+from models.engine.query import Query, run_query
+from models.engine.jsonstream import atomic_open, write_object
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# types of the values of a list copied by copy_json() as they are
+SCALARS = frozenset((str, int, float, bool, type(None)))
+# types of the values that can change without marking their object dirty
+CONTAINERS = frozenset((list, dict))
+# objects encoded per hold of the lock by a locked snapshot
+SNAPSHOT_CHUNK = 1000
+
+
+def hydrate(record):
+    """Builds the model instance of a stored record."""
+    _class = globals()[record['__class__']]
+    return _class(**record)
+
+
+def copy_json(value):
+    """Returns a deep copy of value, a JSON serializable value."""
+    if type(value) is list and SCALARS.issuperset(map(type, value)):
+        return value.copy()
+    return json.loads(json.dumps(value))
 
 
 class FileStorage:
@@ -17,43 +61,1317 @@ class FileStorage:
     Serializes instances to a JSON file and deserializes JSON file to
     instances
 
+    In journal mode the JSON file is only a snapshot: save() appends one
+    record per changed object to <file>.journal and reload() replays that
+    journal on top of the snapshot. Once the journal grows past
+    journal_max_bytes, or past journal_ratio times the snapshot size, it
+    is compacted into a fresh snapshot.
+
+    In lazy mode reload() keeps the records it reads and only builds an
+    instance the first time it is fetched from __objects.
+
+    In sharded mode the objects live in <file>.d/, one file per class or
+    per hash bucket of the key (see models.engine.sharding), and save()
+    only rewrites the shards holding dirty objects. With per class shards
+    in lazy mode, reload() reads no shard: the shard of a class is read
+    the first time the objects of that class are asked for.
+
+    The flush policy decides when save() writes:
+    - "immediate": every save() writes before returning.
+    - "count:<N>": every Nth save() writes; a crash loses at most the
+      last N - 1 saves.
+    - "interval:<T>": the first save() writes, then a save() writes when
+      T milliseconds passed since the last write, and a timer thread
+      writes the saves held back once T ms passed; a crash loses at most
+      the saves of the last T ms. As the timer writes from its own thread,
+      __objects is guarded by the lock of threaded mode.
+    - "exit": save() never writes; the changes are written by flush(),
+      close() or at interpreter exit, and a crash loses all of them.
+    Pending saves are also written at exit in every policy, and each write
+    replaces the file through a temporary file and os.replace, so a crash
+    never leaves a half written snapshot. A write survives the crash of
+    the process; with fsync it is also on disk, and survives a power loss,
+    when it returns.
+
+    In threaded mode, mutations and reads of __objects happen under a
+    lock, all() returns a copy, and save() only wakes a daemon flusher
+    thread: request threads never wait for the disk. The flusher encodes a
+    snapshot of the objects under the lock, then writes it without holding
+    the lock. flush() writes from the calling thread the same way, and
+    wait() blocks until the flusher wrote the saves made so far. Threaded
+    mode writes a single file, without journal or shards.
+
+    In multiprocess mode, several processes can share the JSON file. A
+    save takes an exclusive lock on <file>.lock, a reload a shared one.
+    When the file changed since this process last read or wrote it, save()
+    first merges it: records whose updated_at differs from the version
+    this process knows are loaded, and records gone from the file are
+    dropped, unless this process changed them too. When both changed a
+    record, the latest updated_at wins and a deletion always wins; such
+    conflicts are counted in the stats. Multiprocess mode needs fcntl and
+    writes a single file.
+
+    asave(), areload() and aall() are the awaitable counterparts of save(),
+    reload() and all() for asyncio code: encoding, reading and writing run
+    in the default executor, and asave() calls made while a write is under
+    way are coalesced into the next write, which they all wait for. From
+    the first awaitable call on, the storage guards __objects with the
+    lock of threaded mode, all() still returning __objects itself. A
+    single file snapshot is then encoded SNAPSHOT_CHUNK objects at a time,
+    releasing the lock in between, and written without holding it, so
+    creating or changing objects on the event loop waits for one chunk at
+    most.
+
+    With workers, where processes can be forked, reload() splits a JSON
+    file of more than parallel.MIN_BYTES between that many processes,
+    which parse and check the records (see models.engine.parallel). The
+    journal is then replayed as usual. Parallel reloads build every
+    instance, so they are not lazy, and read a single file.
+
+    The JSON file and the shards can be compressed with gzip, lzma or
+    zlib: by default, when the file name ends with .gz, .xz or .zz. Reads
+    find the codec of a file from its first bytes, whatever its name, so
+    a plain file is read by a compressed storage and the other way round.
+    The journal is never compressed.
+
+    With snapshot_format "binary", the snapshot is written in the binary
+    format of models.engine.binary instead of JSON: typed values, integer
+    datetimes and a table of the repeated strings. It is encoded from
+    the attributes of each object, without the JSON text cache, and
+    reloads build the instances from its datetimes without parsing them.
+    Reloads read either format, and the journal stays JSON. A binary
+    snapshot is a single file, without shards.
+
+    The words of the text fields of indexes.TEXT_FIELDS are kept in an
+    inverted index, searched by search(). Each full snapshot of a single
+    file also writes that index to <file>.text, once it holds
+    indexes.TEXT_SAVE_MIN_DOCUMENTS documents, and the first search
+    after reload() restores it from there: only the documents whose text
+    changed since are split into words again. Until then, reload() does
+    not split any text.
+
+    Unless collect_stats is False, saves, flushes and reloads are counted
+    and timed, along with the objects and bytes they write and read; see
+    stats().
+
     Attributes
     ----------
     __file_path : string
         path to the JSON file
-    __objects : dictionary
+    __objects : ObjectRegistry
         store all objects by <class name>.id
+    __indexes : dictionary
+        secondary indexes of __objects by class name
+    __changes : dictionary
+        dirty objects, changed since the last save, by <class name>.id,
+        None for deleted objects
+    __encoded : dictionary
+        (object, JSON text, (name, copy) pairs of its list and dictionary
+        values) by <class name>.id from the last save, so that only dirty
+        objects, or objects whose lists or dictionaries changed in place,
+        are encoded again
+    __counters : dictionary
+        number of flushes and of objects encoded by them
+    __stats : dictionary
+        counters and timers of the saves, flushes and reloads
+    __lock : threading.RLock
+        lock of __objects and __changes in threaded mode
+    journal : bool
+        append changes to a journal instead of rewriting the file
+    journal_max_bytes : int
+        journal size that triggers a compaction
+    journal_ratio : float
+        journal to snapshot size ratio that triggers a compaction
+    lazy : bool
+        build instances on first fetch instead of on reload
+    shards : str or int
+        None for a single file, "class" for one shard per class or the
+        number of hash buckets
+    flush_policy : str
+        "immediate", "count", "interval" or "exit"
+    flush_limit : int
+        saves per write in "count", milliseconds in "interval"
+    fsync : bool
+        sync every write to disk
+    cache : bool
+        keep the JSON text of every object between saves, so that only
+        dirty objects are encoded again, for as much memory as the file
+    collect_stats : bool
+        update __stats
+    threaded : bool
+        lock __objects and write from a background flusher thread
+    workers : int
+        processes reading the JSON file on reload, 0 to read it here
+    compression : str
+        "auto" to compress by the extension of the file, "none", or the
+        codec of every write: "gzip", "lzma" or "zlib"
+    compression_level : int
+        level of the codec, None for its default
+    snapshot_format : str
+        "json" or "binary"
+    locked : bool
+        guard __objects with __lock, in threaded mode or once an
+        awaitable method was called
+    flush_error : Exception
+        last error of the flusher or timer thread, raised again by wait()
+    multiprocess : bool
+        lock the file and merge the changes of other processes on save
+    __versions : dictionary
+        updated_at of the records on disk by <class name>.id, as this
+        process last read or wrote them, in multiprocess mode
+    __disk_stat : tuple
+        inode, size and modification time of the file when this process
+        last read or wrote it, None without file
+    __unread : set
+        shards not read yet
+    __text_unread : bool
+        whether the next search restores the text indexes from the file
+        next to the JSON file, read since
+    __buckets : dictionary
+        keys by hash bucket, each as a dictionary with None values
     """
 
     __file_path = "file.json"
-    __objects = dict()
+    __indexes = storage_indexes()
+    __objects = ObjectRegistry(loader=hydrate, indexes=__indexes)
+    __changes = dict()
+    __encoded = dict()
+    __counters = {"flushes": 0, "encoded": 0, "last_encoded": 0,
+                  "last_reused": 0}
+    __stats = {"saves": 0, "flushes": 0, "last_flush_seconds": 0.0,
+               "flush_seconds": 0.0, "reloads": 0,
+               "last_reload_seconds": 0.0, "reload_seconds": 0.0,
+               "objects_encoded": 0, "objects_read": 0, "bytes_written": 0,
+               "bytes_read": 0, "merged_records": 0, "merge_conflicts": 0}
+    __lock = threading.RLock()
 
-    def all(self):
-        """Returns the dictionary FileStorage.__objects."""
+    def __init__(self, journal=False, journal_max_bytes=16 * 1024 * 1024,
+                 journal_ratio=1.0, lazy=False, shards=None,
+                 flush="immediate", fsync=False, cache=True,
+                 collect_stats=True, threaded=False, multiprocess=False,
+                 workers=0, compression="auto", compression_level=None,
+                 snapshot_format="json"):
+        """Set the storage mode."""
+        if isinstance(shards, str) and shards.isdigit():
+            shards = int(shards)
+        if journal and shards:
+            raise ValueError("journal mode cannot be sharded")
+        if threaded and (journal or shards):
+            raise ValueError("threaded mode cannot use a journal or shards")
+        if multiprocess and (journal or shards or threaded):
+            raise ValueError("multiprocess mode cannot use a journal, "
+                             "shards or threads")
+        if multiprocess and fcntl is None:
+            raise ValueError("multiprocess mode needs fcntl file locks")
+        workers = int(workers or 0)
+        if workers and (lazy or shards):
+            raise ValueError("parallel reload cannot be lazy or sharded")
+        self.workers = workers
+        compression = compression or "auto"
+        if compression not in ("auto", "none", *jsonstream.CODECS):
+            raise ValueError(f"unknown compression {compression!r}")
+        self.compression = compression
+        if compression_level in ("", None):
+            compression_level = None
+        else:
+            compression_level = int(compression_level)
+        self.compression_level = compression_level
+        snapshot_format = snapshot_format or "json"
+        if snapshot_format not in ("json", "binary"):
+            raise ValueError(f"unknown snapshot format {snapshot_format!r}")
+        if snapshot_format == "binary" and shards:
+            raise ValueError("binary snapshots cannot be sharded")
+        self.snapshot_format = snapshot_format
+        self.journal = journal
+        self.journal_max_bytes = journal_max_bytes
+        self.journal_ratio = journal_ratio
+        self.lazy = lazy
+        self.shards = shards
+        self.__unread = set()
+        self.__text_unread = False
+        self.__buckets = dict()
+
+        policy, _, limit = flush.partition(":")
+        if (policy not in ("immediate", "count", "interval", "exit") or
+                bool(limit) != (policy in ("count", "interval")) or
+                (limit and not limit.isdigit())):
+            raise ValueError(f"unknown flush policy {flush!r}")
+        self.flush_policy = policy
+        self.flush_limit = int(limit) if limit else 0
+        self.fsync = fsync
+        self.cache = cache
+        self.collect_stats = collect_stats
+        self.__pending = 0
+        self.__last_flush = None
+        self.__timer = None
+        self.threaded = threaded
+        self.flush_error = None
+        self.multiprocess = multiprocess
+        self.__versions = dict()
+        self.__disk_stat = None
+        self.locked = threaded
+        self.__guard = FileStorage.__lock if threaded or \
+            policy == "interval" else contextlib.nullcontext()
+        self.__write_lock = threading.Lock()
+        self.__current_save = None
+        self.__next_save = None
+        if threaded:
+            self.__wakeup = threading.Condition()
+            self.__requested = 0
+            self.__written = 0
+            self.__stopping = False
+            self.__flusher = threading.Thread(
+                target=self.__run_flusher, name="FileStorage flusher",
+                daemon=True)
+            self.__flusher.start()
+        if policy != "immediate" or threaded:
+            atexit.register(self.close)
+
+    def __registry(self):
+        """Returns __objects, as a registry again if it was replaced."""
+        if type(FileStorage.__objects) is not ObjectRegistry:
+            FileStorage.__objects = ObjectRegistry(
+                FileStorage.__objects, loader=hydrate,
+                indexes=FileStorage.__indexes)
         return FileStorage.__objects
 
+    def all(self, cls=None):
+        """
+        Returns the dictionary FileStorage.__objects, or a copy of it in
+        threaded mode, or a dictionary of the objects of cls only when cls,
+        a class or class name, is given.
+        """
+        with self.__guard:
+            if cls is None:
+                self.__read_shards(self.__unread)
+                if self.threaded:
+                    return self.__registry().copy()
+                return self.__registry()
+            class_name = cls if isinstance(cls, str) else cls.__name__
+            objects = self.__read_class(class_name)
+            return {key: objects[key]
+                    for key in objects.class_keys(class_name)}
+
+    def get(self, cls, obj_id):
+        """Returns the object of cls, a class or class name, with obj_id."""
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            return self.__read_class(class_name).get(
+                class_name + "." + obj_id)
+
+    def count(self, cls=None):
+        """Returns the number of objects, or of objects of cls."""
+        with self.__guard:
+            if cls is None:
+                self.__read_shards(self.__unread)
+                return len(self.__registry())
+            if not isinstance(cls, str):
+                cls = cls.__name__
+            return self.__read_class(cls).count(cls)
+
     def new(self, obj):
         """Sets in __objects the obj with key <obj class name>.id."""
         class_name = obj.__class__.__name__
         _id = obj.id
         key = class_name + "." + _id
         value = obj
-        FileStorage.__objects.update({key: value})
+        with self.__guard:
+            self.__registry()[key] = value
+            FileStorage.__changes[key] = value
+
+    def mark_dirty(self, obj, name=None):
+        """
+        Records that the attribute name, or any attribute when name is
+        None, of a stored obj changed since the last save.
+        """
+        _id = getattr(obj, "id", None)
+        if _id is None:
+            return
+        key = obj.__class__.__name__ + "." + _id
+        objects = self.__registry()
+        if dict.get(objects, key) is obj:
+            with self.__guard:
+                FileStorage.__changes[key] = obj
+                objects.reindex(key, name)
+
+    def find_by(self, cls, field, value):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose field equals value. Foreign keys are looked up in their
+        index, other fields are compared object by object.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            for index in objects.indexes_of(class_name):
+                if type(index) is ForeignKeyIndex and index.field == field:
+                    return {key: objects[key]
+                            for key in index.lookup(value)}
+        return {key: obj for key, obj in self.all(class_name).items()
+                if getattr(obj, field, None) == value}
+
+    def __columns(self, class_name, fields):
+        """Returns the ColumnIndex of class_name holding fields, or None."""
+        for index in self.__registry().indexes_of(class_name):
+            if type(index) is ColumnIndex and set(fields) <= set(
+                    index.fields):
+                return index
+        return None
+
+    def query(self, cls):
+        """
+        Returns a query on the objects of cls, a class or class name, run
+        on the indexes of the class (see models.engine.query).
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        return Query(class_name, self.__run_query)
+
+    def __run_query(self, selection):
+        """Returns the results of the query selection and its plan."""
+        class_name = selection.class_name
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            return run_query(selection, objects,
+                             objects.indexes_of(class_name),
+                             objects.class_keys(class_name))
+
+    def __sorted(self, class_name):
+        """Returns the SortedIndex instances of class_name by field."""
+        return {index.field: index
+                for index in self.__registry().indexes_of(class_name)
+                if type(index) is SortedIndex}
+
+    def find_range(self, cls, **ranges):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose fields hold numbers inside ranges, inclusive (low, high)
+        bounds by field where None is open. When every field has a sorted
+        index (see indexes.SORTED_FIELDS), the ranges are intersected
+        there; fields with a column (see indexes.NUMERIC_FIELDS) are
+        scanned there, other fields are compared object by object.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            indexes = self.__sorted(class_name)
+            if ranges and set(ranges) <= set(indexes):
+                return {key: objects[key] for key in intersect(
+                    [(indexes[field], low, high)
+                     for field, (low, high) in ranges.items()])}
+            index = self.__columns(class_name, ranges)
+            if index is not None:
+                return {key: objects[key] for key in index.select(ranges)}
+        return {key: obj for key, obj in self.all(class_name).items()
+                if in_ranges(obj, ranges)}
+
+    def find_sorted(self, cls, field, reverse=False, **ranges):
+        """
+        Returns a dictionary of the objects of cls found by find_range(),
+        field being one of the ranges, ordered by the number in field and
+        then by key, or the other way round with reverse. Fields with a
+        sorted index are read in its order.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        ranges.setdefault(field, (None, None))
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            index = self.__sorted(class_name).get(field)
+            if index is not None and len(ranges) == 1:
+                return {key: objects[key]
+                        for key in index.range(*ranges[field], reverse)}
+            found = self.find_range(class_name, **ranges)
+            if index is not None:
+                values = index.values
+                return {key: found[key] for key in sorted(
+                    found, key=lambda key: (values[key], key),
+                    reverse=reverse)}
+        return dict(sorted(found.items(),
+                           key=lambda item: (getattr(item[1], field),
+                                             item[0]),
+                           reverse=reverse))
+
+    def aggregate(self, cls, field, function="sum", **ranges):
+        """
+        Returns the aggregate function, one of indexes.AGGREGATES, of the
+        numbers in field of the objects of cls found by find_range().
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            self.__read_class(class_name)
+            index = self.__columns(class_name, (*ranges, field))
+            if index is not None:
+                return index.aggregate(field, function, ranges)
+        ranges.setdefault(field, (None, None))
+        return aggregate_values(
+            (getattr(obj, field)
+             for obj in self.find_range(class_name, **ranges).values()),
+            function)
+
+    def __grid(self, class_name):
+        """Returns the GridIndex of class_name, or None."""
+        for index in self.__registry().indexes_of(class_name):
+            if type(index) is GridIndex:
+                return index
+        return None
+
+    def near(self, cls, lat, lon, radius_km):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        at most radius_km from the position (lat, lon) in degrees, nearest
+        first. The classes of indexes.SPATIAL_FIELDS are looked up in
+        their grid, other classes are measured object by object.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            grid = self.__grid(class_name)
+            if grid is not None:
+                return {key: objects[key]
+                        for _, key in grid.near(lat, lon, radius_km)}
+        # raises ValueError as the grid does
+        bbox_around(lat, lon, radius_km)
+        found = list()
+        for key, obj in self.all(class_name).items():
+            where = position(obj)
+            if where is not None:
+                distance = distance_km(lat, lon, *where)
+                if distance <= radius_km:
+                    found.append((distance, key, obj))
+        found.sort(key=lambda item: item[:2])
+        return {key: obj for _, key, obj in found}
+
+    def within(self, cls, bbox):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        inside bbox, (south, west, north, east) in degrees; west greater
+        than east crosses the 180th meridian.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            grid = self.__grid(class_name)
+            if grid is not None:
+                return {key: objects[key] for key in grid.within(bbox)}
+        bbox = check_bbox(bbox)
+        found = dict()
+        for key, obj in self.all(class_name).items():
+            where = position(obj)
+            if where is not None and in_bbox(*where, bbox):
+                found[key] = obj
+        return found
+
+    def __text(self, class_name):
+        """Returns the TextIndex of class_name, or None."""
+        for index in self.__registry().indexes_of(class_name):
+            if type(index) is TextIndex:
+                return index
+        return None
+
+    def search(self, cls, text, match="all", limit=None):
+        """
+        Returns a dictionary of the objects of cls, a class or class name,
+        whose text fields (see indexes.TEXT_FIELDS) hold all the words of
+        text, or any of them for match "any", ranked by the number of
+        times the words occur, at most limit of them when given.
+        """
+        class_name = cls if isinstance(cls, str) else cls.__name__
+        with self.__guard:
+            objects = self.__read_class(class_name)
+            index = self.__text(class_name)
+            if index is None:
+                raise ValueError(f"{class_name} has no text fields")
+            if self.__text_unread:
+                self.__text_unread = False
+                self.__restore_text()
+            return {key: objects[key]
+                    for _, key in index.search(text, match, limit)}
+
+    def encode_counters(self):
+        """
+        Returns the number of flushes, the number of objects encoded by
+        all of them and the number encoded and reused by the last one.
+        """
+        return FileStorage.__counters.copy()
+
+    def stats(self):
+        """
+        Returns the counters and timers of the saves, flushes and reloads,
+        empty when collect_stats is False, with the number of objects in
+        memory, in all and by class.
+        """
+        stats = FileStorage.__stats.copy() if self.collect_stats else {}
+        stats["pending_saves"] = self.__pending
+        with self.__guard:
+            objects = self.__registry()
+            stats["objects"] = len(objects)
+            stats["classes"] = {
+                class_name: len(keys)
+                for class_name, keys in objects.classes.items()}
+        return stats
+
+    def __count(self, name, amount=1):
+        """Adds amount to the statistic name, if stats are collected."""
+        if self.collect_stats:
+            FileStorage.__stats[name] += amount
+
+    def __time(self, counter, name, start):
+        """
+        Counts in counter an operation name started at start, and records
+        its duration.
+        """
+        if self.collect_stats:
+            seconds = time.perf_counter() - start
+            FileStorage.__stats[counter] += 1
+            FileStorage.__stats["last_" + name + "_seconds"] = seconds
+            FileStorage.__stats[name + "_seconds"] += seconds
+
+    def __encode(self, key, obj):
+        """
+        Returns the JSON text of obj, or of a record not loaded yet,
+        encoding it only when dirty. Lists and dictionaries change in
+        place without marking obj dirty, so they are compared with a copy
+        taken when they were encoded.
+        """
+        cached = FileStorage.__encoded.get(key)
+        if (cached is not None and cached[0] is obj and
+                key not in FileStorage.__changes):
+            for name, value in cached[2]:
+                if getattr(obj, name, None) != value:
+                    break
+            else:
+                FileStorage.__counters["last_reused"] += 1
+                return cached[1]
+        record = obj if type(obj) is dict else obj.to_dict()
+        text = json.dumps(record)
+        if self.cache:
+            # a record not loaded yet is replaced, never changed in place
+            containers = ()
+            if (record is not obj and
+                    not CONTAINERS.isdisjoint(map(type, record.values()))):
+                containers = tuple((name, copy_json(value))
+                                   for name, value in record.items()
+                                   if type(value) in CONTAINERS)
+            FileStorage.__encoded[key] = (obj, text, containers)
+        FileStorage.__counters["last_encoded"] += 1
+        return text
+
+    def __start_flush(self):
+        """Resets the per flush counters."""
+        FileStorage.__counters["flushes"] += 1
+        FileStorage.__counters["last_encoded"] = 0
+        FileStorage.__counters["last_reused"] = 0
+
+    def __end_flush(self, written=None):
+        """
+        Adds the objects encoded by the last flush to the total, and
+        forgets the changes it wrote: all of them, or those under the keys
+        in written.
+        """
+        FileStorage.__counters["encoded"] += \
+            FileStorage.__counters["last_encoded"]
+        self.__count("objects_encoded",
+                     FileStorage.__counters["last_encoded"])
+        if written is None:
+            FileStorage.__changes.clear()
+        else:
+            for key in written:
+                FileStorage.__changes.pop(key, None)
+
+    def delete(self, obj=None):
+        """Deletes obj from __objects if it is inside."""
+        if obj is None:
+            return
+        key = obj.__class__.__name__ + "." + obj.id
+        with self.__guard:
+            objects = self.__registry()
+            if key in objects:
+                del objects[key]
+                FileStorage.__changes[key] = None
+                FileStorage.__encoded.pop(key, None)
+
+    def journal_path(self):
+        """Returns the path of the journal kept next to the JSON file."""
+        return FileStorage.__file_path + ".journal"
+
+    def text_path(self):
+        """Returns the path of the text indexes kept next to the file."""
+        return FileStorage.__file_path + ".text"
+
+    def lock_path(self):
+        """Returns the path of the lock file of the JSON file."""
+        return FileStorage.__file_path + ".lock"
+
+    @contextlib.contextmanager
+    def __file_lock(self, exclusive):
+        """Holds the lock of the JSON file in multiprocess mode."""
+        if not self.multiprocess:
+            yield
+            return
+        with open(self.lock_path(), 'a') as fp:
+            fcntl.flock(fp.fileno(),
+                        fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+    def __stat_file(self):
+        """Returns the inode, size and modification time of the file."""
+        try:
+            stat = os.stat(FileStorage.__file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def shard_dir(self):
+        """Returns the directory of the shards of the JSON file."""
+        return FileStorage.__file_path + ".d"
 
     def save(self):
-        """Serializes __objects to the JSON file."""
-        temp_dict = dict()
-        for key, obj in FileStorage.__objects.items():
-            temp_dict[key] = obj.to_dict()
-        with open(FileStorage.__file_path, 'w') as fp:
-            json.dump(temp_dict, fp)
+        """
+        Serializes __objects to the JSON file, now or when the flush
+        policy says so.
+        """
+        with self.__guard:
+            self.__pending += 1
+            self.__count("saves")
+            if not self.__flush_due():
+                self.__start_timer()
+                return
+        if self.threaded and not self.__stopping:
+            self.__wake_flusher()
+        else:
+            self.flush()
 
-    def reload(self):
-        """Deserializes the JSON file to __objects."""
-        temp_dict = dict()
+    def __flush_due(self):
+        """Returns whether the flush policy says the saves must be written."""
+        if self.flush_policy == "exit":
+            return False
+        if self.flush_policy == "count":
+            return self.__pending >= self.flush_limit
+        if self.flush_policy == "interval":
+            return (self.__last_flush is None or
+                    (time.monotonic() - self.__last_flush) * 1000 >=
+                    self.flush_limit)
+        return True
+
+    def __start_timer(self):
+        """
+        Starts the timer writing the saves held back by the interval
+        policy when the interval ends, unless it runs already.
+        """
+        if self.flush_policy != "interval" or self.__timer is not None:
+            return
+        delay = (self.flush_limit / 1000 -
+                 (time.monotonic() - self.__last_flush))
+        self.__timer = threading.Timer(max(delay, 0), self.__timed_flush)
+        self.__timer.name = "FileStorage timer"
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __stop_timer(self):
+        """Cancels the timer of the interval policy, if any."""
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+    def __timed_flush(self):
+        """Writes the saves held back when the interval ended."""
+        with self.__guard:
+            # a write since the timer started cancelled or replaced it
+            if self.__timer is not threading.current_thread():
+                return
+            self.__timer = None
+            if not self.__pending:
+                return
+        try:
+            if self.threaded and not self.__stopping:
+                self.__wake_flusher()
+            else:
+                self.flush()
+        except Exception as error:
+            self.flush_error = error
+
+    def __wake_flusher(self):
+        """Asks the flusher thread to write the saves made so far."""
+        with self.__wakeup:
+            self.__requested += 1
+            self.__wakeup.notify_all()
+
+    def __run_flusher(self):
+        """Writes the saves signaled by save() until close()."""
+        while True:
+            with self.__wakeup:
+                self.__wakeup.wait_for(
+                    lambda: (self.__requested > self.__written or
+                             self.__stopping))
+                if self.__requested == self.__written:
+                    return
+                requested = self.__requested
+            try:
+                self.flush()
+            except Exception as error:
+                self.flush_error = error
+            with self.__wakeup:
+                self.__written = requested
+                self.__wakeup.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the flusher thread wrote the saves made so far, and
+        raises its last error if it failed. Returns False when timeout
+        seconds passed first.
+        """
+        if not self.threaded:
+            return True
+        with self.__wakeup:
+            requested = self.__requested
+            written = self.__wakeup.wait_for(
+                lambda: self.__written >= requested, timeout)
+        error, self.flush_error = self.flush_error, None
+        if error is not None:
+            raise error
+        return written
+
+    def flush(self):
+        """Writes the changes of every pending save at once."""
+        start = time.perf_counter()
+        # a locked single file snapshot only takes the lock to encode
+        snapshot = self.locked and not (self.shards or self.journal or
+                                        self.multiprocess)
+        with self.__guard:
+            self.__pending = 0
+            self.__last_flush = time.monotonic()
+            self.__stop_timer()
+            if self.shards:
+                self.__save_shards()
+            elif self.multiprocess:
+                self.__save_merged()
+            elif self.journal and os.path.exists(FileStorage.__file_path):
+                self.__append_journal()
+            elif not snapshot:
+                self.compact()
+        if snapshot:
+            self.compact()
+        self.__time("flushes", "flush", start)
+
+    def __use_lock(self):
+        """Guards __objects with __lock from now on."""
+        if not self.locked:
+            self.locked = True
+            self.__guard = FileStorage.__lock
+
+    async def asave(self):
+        """
+        Awaitable save(): returns once a write, done off the event loop,
+        covered this save.
+        """
+        self.__use_lock()
+        with self.__guard:
+            self.__pending += 1
+            self.__count("saves")
+            if not self.__flush_due():
+                self.__start_timer()
+                return
+        loop = asyncio.get_running_loop()
+        task = self.__next_save
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(self.__coalesced_flush())
+            self.__next_save = task
+        await asyncio.shield(task)
+
+    async def __coalesced_flush(self):
+        """Flushes off the loop once the write under way, if any, ended."""
+        previous = self.__current_save
+        loop = asyncio.get_running_loop()
+        if previous is not None and previous.get_loop() is loop:
+            await asyncio.wait((previous,))
+        # later saves wait for the next write
+        self.__next_save = None
+        self.__current_save = asyncio.current_task()
+        await loop.run_in_executor(None, self.flush)
+
+    async def areload(self):
+        """Awaitable reload(), reading the file off the event loop."""
+        self.__use_lock()
+        await asyncio.get_running_loop().run_in_executor(None, self.reload)
+
+    async def aall(self, cls=None):
+        """
+        Awaitable all(), returning a copy built off the event loop, where
+        the records not loaded yet are turned into instances.
+        """
+        self.__use_lock()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.__copy_all, cls)
+
+    def __copy_all(self, cls):
+        """Returns a copy of all(cls) with every instance built."""
+        with self.__guard:
+            return dict(self.all(cls).items())
+
+    def __append_journal(self):
+        """Appends the changes since the last save to the journal."""
+        if not FileStorage.__changes:
+            return
+        self.__start_flush()
+        lines = list()
+        for key, obj in FileStorage.__changes.items():
+            if obj is None:
+                record = '{{"op": "del", "key": {}}}'.format(json.dumps(key))
+            else:
+                record = '{{"op": "set", "key": {}, "value": {}}}'.format(
+                    json.dumps(key), self.__encode(key, obj))
+            lines.append((record + "\n").encode())
+        with open(self.journal_path(), 'ab+') as fp:
+            if fp.seek(0, os.SEEK_END):
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    # end the torn record left by an interrupted append
+                    lines.insert(0, b"\n")
+            fp.writelines(lines)
+            journal_size = fp.tell()
+            self.__count("bytes_written", sum(map(len, lines)))
+            if self.fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        self.__end_flush()
+
+        snapshot_size = os.path.getsize(FileStorage.__file_path)
+        if (journal_size > self.journal_max_bytes or
+                journal_size > self.journal_ratio * snapshot_size):
+            self.compact()
+
+    def close(self):
+        """
+        Stops the flusher and timer threads, writes the pending saves and
+        stops writing them at exit.
+        """
+        with self.__guard:
+            self.__stop_timer()
+        if self.threaded and not self.__stopping:
+            with self.__wakeup:
+                self.__stopping = True
+                self.__wakeup.notify_all()
+            self.__flusher.join()
+        if self.__pending:
+            self.flush()
+        atexit.unregister(self.close)
+
+    def compact(self):
+        """
+        Writes a full snapshot of __objects and drops the journal, or
+        rewrites every shard in sharded mode.
+        """
+        if self.shards:
+            self.__save_shards(everything=True)
+            return
+        if self.locked and not (self.journal or self.multiprocess):
+            self.__write_locked_snapshot()
+            return
+        self.__start_flush()
+        objects = self.__registry()
+        self.__write_snapshot(FileStorage.__file_path, objects)
+        self.__forget_removed(objects)
+        if os.path.exists(self.journal_path()):
+            os.remove(self.journal_path())
+        self.__write_text(self.__encode_text())
+        self.__end_flush()
+
+    def __save_merged(self):
+        """
+        Merges the changes other processes wrote to the file, then writes
+        the snapshot, holding the file lock.
+        """
+        with self.__file_lock(exclusive=True):
+            if self.__stat_file() != self.__disk_stat:
+                self.__merge_file()
+            written = dict(FileStorage.__changes)
+            self.compact()
+            for key, obj in written.items():
+                if obj is None:
+                    self.__versions.pop(key, None)
+                else:
+                    self.__versions[key] = obj.updated_at.isoformat()
+            self.__disk_stat = self.__stat_file()
+
+    def __merge_file(self):
+        """
+        Loads the records changed on disk since this process last read or
+        wrote the file, and drops the records deleted from it.
+        """
+        objects = self.__registry()
+        changes = FileStorage.__changes
+        on_disk = set()
         if os.path.exists(FileStorage.__file_path):
-            with open(FileStorage.__file_path, 'r') as fp:
-                temp_dict = json.load(fp)
-        for key, _dict in temp_dict.items():
-            _class = globals()[_dict['__class__']]
-            FileStorage.__objects[key] = _class(**_dict)
+            for key, record in binary.iter_file(FileStorage.__file_path):
+                on_disk.add(key)
+                version = record.get("updated_at")
+                if version == self.__versions.get(key):
+                    continue
+                if key in changes:
+                    # changed here and in another process
+                    self.__count("merge_conflicts")
+                    ours = changes[key]
+                    if (ours is None or ours.updated_at >=
+                            datetime.datetime.fromisoformat(version)):
+                        continue
+                self.__load(key, record)
+                self.__versions[key] = version
+                self.__count("merged_records")
+        for key in set(self.__versions) - on_disk:
+            # deleted by another process: the deletion wins over a change
+            del self.__versions[key]
+            if changes.pop(key, None) is not None:
+                self.__count("merge_conflicts")
+            if key in objects:
+                del objects[key]
+                FileStorage.__encoded.pop(key, None)
+                self.__count("merged_records")
+
+    def __write_locked_snapshot(self):
+        """
+        Encodes every object, SNAPSHOT_CHUNK objects per hold of the lock,
+        then writes them without holding it, one writer at a time. The
+        change of an object is forgotten once it is encoded, so objects
+        changed during the flush stay dirty for the next one.
+        """
+        with self.__write_lock:
+            with FileStorage.__lock:
+                self.__start_flush()
+                objects = self.__registry()
+                keys = list(objects)
+                deleted = [key for key, obj in FileStorage.__changes.items()
+                           if obj is None]
+            encode = self.__member_encoder()
+            members = list()
+            for start in range(0, len(keys), SNAPSHOT_CHUNK):
+                with FileStorage.__lock:
+                    for key in keys[start:start + SNAPSHOT_CHUNK]:
+                        obj = dict.get(objects, key)
+                        if obj is None:
+                            # deleted during the flush
+                            continue
+                        members.append((key, encode(key, obj)))
+                        FileStorage.__changes.pop(key, None)
+            with FileStorage.__lock:
+                self.__forget_removed(objects)
+                text = self.__encode_text()
+                self.__end_flush(written=deleted)
+            self.__write_members(FileStorage.__file_path, members)
+            self.__write_text(text)
+
+    def __text_indexes(self):
+        """Returns the TextIndex of every class."""
+        return [index for class_indexes in FileStorage.__indexes.values()
+                for index in class_indexes if type(index) is TextIndex]
+
+    def __encode_text(self):
+        """
+        Returns the JSON text of the text indexes when they changed since
+        they were written, "" when they are too small to be written, and
+        None when the file is up to date. An index not split or built
+        since it was read is written as restored, if it was: the first
+        search checks the file against the objects anyway.
+        """
+        unindexed = self.__registry().unindexed
+        split = list()
+        states = dict()
+        documents = 0
+        for index in self.__text_indexes():
+            if not index.waiting() and index.class_name not in unindexed:
+                split.append(index)
+                documents += len(index)
+            elif index.restored is not None:
+                states[index.class_name] = dict(index.restored,
+                                                fields=list(index.fields))
+                documents += len(index.restored["documents"])
+        if not split:
+            return None
+        if documents < indexes.TEXT_SAVE_MIN_DOCUMENTS:
+            return ""
+        if (not any(index.changed for index in split) and
+                os.path.exists(self.text_path())):
+            return None
+        for index in split:
+            index.changed = False
+            states[index.class_name] = index.state()
+        return json.dumps(states)
+
+    def __write_text(self, text):
+        """Writes the text indexes encoded by __encode_text()."""
+        if text is None:
+            return
+        path = self.text_path()
+        if not text:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with atomic_open(path, self.fsync, self.codec(),
+                         self.compression_level) as fp:
+            fp.write(text)
+
+    def __restore_text(self):
+        """
+        Restores the text indexes not split yet from the file written next
+        to the JSON file.
+        """
+        path = self.text_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with jsonstream.open_text(path) as fp:
+                state = json.load(fp)
+        except (OSError, EOFError, ValueError):
+            return
+        if type(state) is not dict:
+            return
+        for index in self.__text_indexes():
+            class_state = state.get(index.class_name)
+            if type(class_state) is dict:
+                index.restore(class_state)
+
+    def __forget_removed(self, objects):
+        """Drops the cached text of the objects no longer in objects."""
+        if len(FileStorage.__encoded) > len(objects):
+            # forget objects removed from __objects behind our back
+            FileStorage.__encoded = {
+                key: cached for key, cached in FileStorage.__encoded.items()
+                if key in objects}
+
+    def __write_snapshot(self, path, keys):
+        """
+        Writes the objects under keys to the JSON file at path, encoding
+        and writing one object at a time.
+        """
+        objects = self.__registry()
+        encode = self.__member_encoder()
+        members = ((key, encode(key, dict.__getitem__(objects, key)))
+                   for key in keys)
+        self.__write_members(path, members)
+
+    def __member_encoder(self):
+        """Returns the function encoding an object for the snapshot."""
+        if self.snapshot_format == "binary":
+            return self.__record
+        return self.__encode
+
+    def __record(self, key, obj):
+        """
+        Returns the record of obj, or the record not loaded yet, for a
+        binary snapshot: to_dict() with the datetimes left as they are.
+        The ISO strings of the timestamps of a record not loaded yet are
+        turned into datetimes, which only timestamps are written as.
+        """
+        FileStorage.__counters["last_encoded"] += 1
+        if type(obj) is dict:
+            record = obj
+            for name in ("created_at", "updated_at"):
+                if type(obj.get(name)) is str:
+                    if record is obj:
+                        record = obj.copy()
+                    record[name] = datetime.datetime.fromisoformat(
+                        obj[name])
+            return record
+        record = obj.__dict__.copy()
+        record["__class__"] = type(obj).__name__
+        return record
+
+    def codec(self):
+        """Returns the codec of the files written, None for plain text."""
+        if self.compression == "auto":
+            return jsonstream.codec_of(FileStorage.__file_path)
+        if self.compression == "none":
+            return None
+        return self.compression
+
+    def __write_members(self, path, members):
+        """Writes the (key, JSON text) pairs members to the file path."""
+        codec = self.codec()
+        is_binary = self.snapshot_format == "binary"
+        with atomic_open(path, self.fsync, codec, self.compression_level,
+                         binary=is_binary) as fp:
+            if is_binary:
+                written = binary.write_records(fp, members)
+            else:
+                # the JSON text is ASCII, so characters are bytes
+                written = write_object(fp, members)
+        if codec is not None:
+            written = os.path.getsize(path)
+        self.__count("bytes_written", written)
+
+    def __save_shards(self, everything=False):
+        """Rewrites the shards holding dirty objects, or every shard."""
+        shard_dir = self.shard_dir()
+        if sharding.read_layout(shard_dir) != self.shards:
+            sharding.write_layout(shard_dir, self.shards)
+            everything = True
+        objects = self.__registry()
+        if everything:
+            self.__read_shards(self.__unread)
+            dirty = {sharding.shard_of(key, self.shards) for key in objects}
+            dirty.update(sharding.list_shards(shard_dir))
+        else:
+            dirty = {sharding.shard_of(key, self.shards)
+                     for key in FileStorage.__changes}
+            # never rewrite a shard without its objects on disk
+            self.__read_shards(dirty & self.__unread)
+
+        self.__start_flush()
+        buckets = self.__shard_keys()
+        for shard in dirty:
+            if self.shards == "class":
+                keys = objects.class_keys(shard)
+            else:
+                keys = buckets.get(shard, ())
+            path = sharding.shard_path(shard_dir, shard)
+            if keys:
+                self.__write_snapshot(path, keys)
+            elif os.path.exists(path):
+                os.remove(path)
+        self.__end_flush()
+
+    def __shard_keys(self):
+        """Returns the keys by hash bucket, following the changes."""
+        if self.shards == "class":
+            return self.__buckets
+        objects = self.__registry()
+        for key, obj in FileStorage.__changes.items():
+            bucket = sharding.shard_of(key, self.shards)
+            if obj is None:
+                self.__buckets.get(bucket, {}).pop(key, None)
+            else:
+                self.__buckets.setdefault(bucket, dict())[key] = None
+        if sum(map(len, self.__buckets.values())) != len(objects):
+            # __objects changed behind our back, sort every key again
+            self.__buckets = dict()
+            for key in objects:
+                bucket = sharding.shard_of(key, self.shards)
+                self.__buckets.setdefault(bucket, dict())[key] = None
+        return self.__buckets
+
+    def reload(self):
+        """Deserializes the JSON file, then its journal, to __objects."""
+        start = time.perf_counter()
+        with self.__guard, self.__file_lock(exclusive=False):
+            if self.shards:
+                self.__reload_shards()
+            else:
+                self.__reload_file()
+            if self.multiprocess:
+                self.__disk_stat = self.__stat_file()
+        self.__time("reloads", "reload", start)
+
+    def __reload_file(self):
+        """
+        Reads the JSON file, then replays its journal, leaving the text
+        indexes to be restored from the file next to it by the next
+        search.
+        """
+        self.__text_unread = True
+        self.__read_file()
+
+    def __read_file(self):
+        """Reads the JSON file, then replays its journal."""
+        path = FileStorage.__file_path
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            self.__count("bytes_read", size)
+            built = None
+            if (self.workers and size > parallel.MIN_BYTES and
+                    parallel.available() and
+                    parallel.one_record_per_line(path)):
+                try:
+                    built = parallel.load(path, self.workers)
+                except ValueError:
+                    # a line is not a whole member after all, as in a
+                    # file edited by hand: read it here
+                    pass
+            if built is not None:
+                self.__load_built(built)
+            else:
+                # records keep ISO strings where they are compared or
+                # encoded again as JSON
+                records = binary.iter_file(
+                    path, datetimes=not (self.lazy or self.multiprocess))
+                for key, _dict in records:
+                    self.__load(key, _dict)
+        if os.path.exists(self.journal_path()):
+            self.__count("bytes_read", os.path.getsize(self.journal_path()))
+            self.__replay_journal()
+
+    def __replay_journal(self):
+        """Applies the journal records, in order, to __objects."""
+        with open(self.journal_path(), 'r') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn record of an interrupted append
+                    continue
+                key = record["key"]
+                if record["op"] == "del":
+                    if key in self.__registry():
+                        del self.__registry()[key]
+                    FileStorage.__changes.pop(key, None)
+                else:
+                    self.__load(key, record["value"])
+
+    def __reload_shards(self):
+        """Reads the shards, or lists them when they can wait."""
+        shard_dir = self.shard_dir()
+        layout = sharding.read_layout(shard_dir)
+        if layout is None:
+            return
+        if layout != self.shards:
+            raise ValueError(f"{shard_dir} is sharded by {layout!r}, "
+                             f"not {self.shards!r}")
+        self.__unread = set(sharding.list_shards(shard_dir))
+        if not (self.lazy and self.shards == "class"):
+            self.__read_shards(self.__unread, replace=True)
+
+    def __read_shards(self, shards, replace=False):
+        """
+        Reads the unread shards among shards into __objects, without
+        replacing the objects already in memory unless replace is True.
+        """
+        objects = self.__registry()
+        for shard in list(shards):
+            self.__unread.discard(shard)
+            path = sharding.shard_path(self.shard_dir(), shard)
+            if not os.path.exists(path):
+                continue
+            self.__count("bytes_read", os.path.getsize(path))
+            for key, _dict in sharding.iter_json(path):
+                if replace or key not in objects:
+                    self.__load(key, _dict)
+
+    def __read_class(self, class_name):
+        """Returns __objects once the shard of class_name is read."""
+        if class_name in self.__unread:
+            self.__read_shards((class_name,))
+        return self.__registry()
+
+    def __load_built(self, objects):
+        """Puts the (key, instance) pairs built by workers in __objects."""
+        registry = self.__registry()
+        for key, obj in objects:
+            self.__count("objects_read")
+            if self.multiprocess:
+                self.__versions[key] = obj.updated_at.isoformat()
+            registry[key] = obj
+            FileStorage.__changes.pop(key, None)
+
+    def __load(self, key, record):
+        """Puts the record read from the file in __objects."""
+        self.__count("objects_read")
+        if self.multiprocess:
+            self.__versions[key] = record.get("updated_at")
+        if self.lazy:
+            _class = CLASSES.get(record.get("__class__"))
+            if _class is not None:
+                intern_fields(_class, record)
+            self.__registry().load(key, record)
+        else:
+            self.__registry()[key] = hydrate(record)
+        FileStorage.__changes.pop(key, None)
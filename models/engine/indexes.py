@@ -0,0 +1,975 @@
+#!/usr/bin/python3
+"""Secondary indexes kept up to date by the object registry."""
+
+import array
+import heapq
+import math
+import operator
+import re
+import sys
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from itertools import compress, repeat
+from models.base_model import ModelType
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FOREIGN_KEYS = {
+    "City": ("state_id",),
+    "Place": ("city_id", "user_id"),
+    "Review": ("place_id", "user_id"),
+}
+NUMERIC_FIELDS = {
+    "Place": {"number_rooms": "q", "number_bathrooms": "q",
+              "max_guest": "q", "price_by_night": "q",
+              "latitude": "d", "longitude": "d"},
+}
+AGGREGATES = ("count", "sum", "min", "max", "mean")
+SORTED_FIELDS = {"Place": ("price_by_night", "number_rooms", "max_guest")}
+SPATIAL_FIELDS = {"Place": ("latitude", "longitude")}
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GRID_DEGREES = 0.5
+TEXT_FIELDS = {"Place": ("description",), "Review": ("text",)}
+TOKEN = re.compile(r"\w+")
+# the ASCII characters TOKEN does not match, turned into spaces
+ASCII_SEPARATORS = str.maketrans({chr(code): " " for code in range(128)
+                                  if not TOKEN.match(chr(code))})
+# fewer documents are split again faster than their saved state is read
+TEXT_SAVE_MIN_DOCUMENTS = 1000
+
+
+def field_value(obj, field):
+    """
+    Returns the field of an instance, or of a record not loaded yet,
+    where a missing field holds the default of its class as it does on
+    the instance.
+    """
+    if type(obj) is dict:
+        if field in obj:
+            return obj[field]
+        _class = ModelType.models.get(obj.get("__class__"))
+        return None if _class is None else _class._defaults.get(field)
+    return getattr(obj, field, None)
+
+
+def values_getter(fields):
+    """
+    Returns a function giving the tuple of fields of an instance, or of a
+    record not loaded yet, read at once by operator getters.
+    """
+    by_item = operator.itemgetter(*fields)
+    by_attribute = operator.attrgetter(*fields)
+
+    def values(obj):
+        """Returns the tuple of the fields of obj."""
+        try:
+            found = by_item(obj) if type(obj) is dict else by_attribute(obj)
+        except (KeyError, AttributeError):
+            return tuple(field_value(obj, field) for field in fields)
+        return found if len(fields) > 1 else (found,)
+    return values
+
+
+def foreign_key_indexes():
+    """Returns a ForeignKeyIndex for each FOREIGN_KEYS field by class."""
+    return {class_name: [ForeignKeyIndex(class_name, field)
+                         for field in fields]
+            for class_name, fields in FOREIGN_KEYS.items()}
+
+
+class ForeignKeyIndex:
+    """
+    Reverse index of the objects of a class by the value of a foreign key
+
+    Attributes
+    ----------
+    class_name : str
+        class of the indexed objects
+    field : str
+        indexed attribute
+    fields : tuple
+        attributes whose change needs the object to be indexed again
+    keys : dictionary
+        keys of the objects by field value, as dictionaries with None
+        values
+    values : dictionary
+        indexed field value by key
+    """
+
+    def __init__(self, class_name, field):
+        """Create an empty index of field for class_name."""
+        self.class_name = class_name
+        self.field = field
+        self.fields = (field,)
+        self.keys = dict()
+        self.values = dict()
+
+    def add(self, key, obj):
+        """Indexes obj under key, unless its field is empty."""
+        value = field_value(obj, self.field)
+        if not value or not isinstance(value, str):
+            return
+        self.values[key] = value
+        self.keys.setdefault(value, dict())[key] = None
+
+    def discard(self, key):
+        """Removes key from the index if it is inside."""
+        value = self.values.pop(key, None)
+        if value is None:
+            return
+        keys = self.keys[value]
+        del keys[key]
+        if not keys:
+            del self.keys[value]
+
+    def clear(self):
+        """Removes every key."""
+        self.keys.clear()
+        self.values.clear()
+
+    def lookup(self, value):
+        """Returns the keys of the objects whose field equals value."""
+        return self.keys.get(value, {}).keys()
+
+
+def column_indexes():
+    """Returns a ColumnIndex of the NUMERIC_FIELDS of each class."""
+    return {class_name: [ColumnIndex(class_name, typecodes)]
+            for class_name, typecodes in NUMERIC_FIELDS.items()}
+
+
+def grid_indexes():
+    """Returns a GridIndex of the SPATIAL_FIELDS of each class."""
+    return {class_name: [GridIndex(class_name, fields)]
+            for class_name, fields in SPATIAL_FIELDS.items()}
+
+
+def sorted_indexes():
+    """Returns a SortedIndex of each SORTED_FIELDS field by class."""
+    return {class_name: [SortedIndex(class_name, field)
+                         for field in fields]
+            for class_name, fields in SORTED_FIELDS.items()}
+
+
+def text_indexes():
+    """Returns a TextIndex of the TEXT_FIELDS of each class."""
+    return {class_name: [TextIndex(class_name, fields)]
+            for class_name, fields in TEXT_FIELDS.items()}
+
+
+def storage_indexes():
+    """Returns every index the storage keeps, as lists by class name."""
+    indexes = foreign_key_indexes()
+    for more in (column_indexes(), sorted_indexes(), grid_indexes(),
+                 text_indexes()):
+        for class_name, class_indexes in more.items():
+            indexes.setdefault(class_name, []).extend(class_indexes)
+    return indexes
+
+
+def numeric_value(value, typecode="d"):
+    """
+    Returns value if a column of typecode holds it, None otherwise: "q"
+    columns hold 64-bit integers, "d" columns integers and floats up to
+    the largest double, and neither holds booleans or NaN.
+    """
+    kind = type(value)
+    if kind is int:
+        if typecode == "d":
+            return value if abs(value) <= sys.float_info.max else None
+        return value if -2 ** 63 <= value < 2 ** 63 else None
+    if kind is float and typecode == "d" and value == value:
+        return value
+    return None
+
+
+def in_ranges(obj, ranges, typecodes=None):
+    """
+    Returns whether every field of ranges, a dictionary of inclusive
+    (low, high) bounds by field where None is open, holds a number of
+    obj inside its bounds.
+    """
+    for field, (low, high) in ranges.items():
+        value = numeric_value(field_value(obj, field),
+                              (typecodes or {}).get(field, "d"))
+        if (value is None or low is not None and value < low or
+                high is not None and value > high):
+            return False
+    return True
+
+
+def aggregate_values(values, function):
+    """
+    Returns the aggregate function, one of AGGREGATES, of the numbers
+    values: 0 for the count or sum of nothing, None for the rest.
+    """
+    if function not in AGGREGATES:
+        raise ValueError(f"unknown aggregate {function!r}")
+    values = list(values)
+    if function == "count":
+        return len(values)
+    if function == "sum":
+        return sum(values)
+    if not values:
+        return None
+    if function == "mean":
+        return sum(values) / len(values)
+    return min(values) if function == "min" else max(values)
+
+
+class ColumnIndex:
+    """
+    Typed columns of the numeric fields of the objects of a class
+
+    Each object takes a row of every column. A row left by a removed
+    object is reused by the next added one, so the columns do not grow
+    with updates. An integer column becomes a column of doubles with
+    the first float, or integer out of 64 bits, of its field, so that
+    every number is found as numeric_value() finds it. Range predicates
+    and aggregates scan whole columns at C speed: with NumPy when it is
+    installed, else with operator and itertools functions mapped over
+    the arrays.
+
+    Attributes
+    ----------
+    class_name : str
+        class of the indexed objects
+    fields : tuple
+        indexed attributes
+    typecodes : dictionary
+        array typecode of each field: "q" (64-bit integers) for the
+        int fields of the model while they only hold such integers, "d"
+        (doubles) for the float ones
+    types : tuple
+        Python type of the numbers of each column
+    values : function
+        returns the tuple of the fields of an object
+    columns : dictionary
+        array of the values of each field by row
+    present : dictionary
+        bytearray of each field, 1 for the rows holding a value of the
+        type of its column
+    column_list, present_list : list
+        columns and present in the order of fields
+    rows : dictionary
+        row by key
+    row_keys : list
+        key by row, None for free rows
+    free : list
+        free rows
+    """
+
+    def __init__(self, class_name, typecodes):
+        """Create empty columns of the fields of typecodes."""
+        self.class_name = class_name
+        self.fields = tuple(typecodes)
+        self.typecodes = dict(typecodes)
+        self.types = tuple(int if typecodes[field] == "q" else float
+                           for field in self.fields)
+        self.values = values_getter(self.fields)
+        self.clear()
+
+    def clear(self):
+        """Removes every key."""
+        self.columns = {field: array.array(self.typecodes[field])
+                        for field in self.fields}
+        self.present = {field: bytearray() for field in self.fields}
+        self.column_list = [self.columns[field] for field in self.fields]
+        self.present_list = [self.present[field] for field in self.fields]
+        self.rows = dict()
+        self.row_keys = list()
+        self.free = list()
+
+    def add(self, key, obj):
+        """Writes the fields of obj in a row for key."""
+        values = self.values(obj)
+        if self.free:
+            row = self.free.pop()
+        elif self.__append(values):
+            self.rows[key] = len(self.row_keys)
+            self.row_keys.append(key)
+            return
+        else:
+            row = len(self.row_keys)
+            self.row_keys.append(None)
+            for column in self.column_list:
+                column.append(0)
+            for present in self.present_list:
+                present.append(0)
+        self.row_keys[row] = key
+        self.rows[key] = row
+        for field, value in zip(self.fields, values):
+            number = numeric_value(value, self.typecodes[field])
+            if number is None and self.typecodes[field] == "q":
+                number = numeric_value(value)
+                if number is not None:
+                    self.__widen(field)
+            self.columns[field][row] = 0 if number is None else number
+            self.present[field][row] = number is not None
+
+    def __widen(self, field):
+        """Turns the integer column of field into a column of doubles."""
+        self.typecodes[field] = "d"
+        self.columns[field] = array.array("d", self.columns[field])
+        self.column_list = [self.columns[field] for field in self.fields]
+        self.types = tuple(int if self.typecodes[field] == "q" else float
+                           for field in self.fields)
+
+    def __append(self, values):
+        """
+        Appends a row of values when each is a number of the type of its
+        column, as most are, and returns whether it did.
+        """
+        if (tuple(map(type, values)) != self.types or
+                not all(map(operator.eq, values, values))):
+            return False
+        try:
+            for column, value in zip(self.column_list, values):
+                column.append(value)
+        except OverflowError:
+            for column in self.column_list:
+                del column[len(self.row_keys):]
+            return False
+        for present in self.present_list:
+            present.append(1)
+        return True
+
+    def discard(self, key):
+        """Frees the row of key if it is inside."""
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.row_keys[row] = None
+        for field in self.fields:
+            self.columns[field][row] = 0
+            self.present[field][row] = 0
+        self.free.append(row)
+
+    def __len__(self):
+        """Returns the number of indexed keys."""
+        return len(self.rows)
+
+    def covers(self, field):
+        """Returns whether the row of every key holds a number in field."""
+        return self.present[field].count(1) == len(self.rows)
+
+    def __mask(self, ranges):
+        """
+        Returns the iterable of the truth of ranges for each row, or its
+        NumPy array of booleans.
+        """
+        if numpy is not None:
+            mask = numpy.frombuffer(bytes(map(operator.is_not,
+                                              self.row_keys,
+                                              repeat(None))), numpy.bool_)
+            for field, (low, high) in ranges.items():
+                mask = mask & numpy.frombuffer(self.present[field],
+                                               numpy.bool_)
+                column = numpy.frombuffer(self.columns[field],
+                                          self.columns[field].typecode)
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column <= high
+            return mask
+        masks = [map(operator.is_not, self.row_keys, repeat(None))]
+        for field, (low, high) in ranges.items():
+            masks.append(self.present[field])
+            if low is not None:
+                masks.append(map(operator.le, repeat(low),
+                                 self.columns[field]))
+            if high is not None:
+                masks.append(map(operator.ge, repeat(high),
+                                 self.columns[field]))
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = map(operator.and_, mask, other)
+        return mask
+
+    def __check(self, ranges):
+        """Raises KeyError for a field of ranges without column."""
+        for field in ranges:
+            if field not in self.columns:
+                raise KeyError(f"{field!r} is not a column "
+                               f"of {self.class_name}")
+
+    def select(self, ranges):
+        """
+        Returns the list of the keys whose fields are inside ranges, a
+        dictionary of inclusive (low, high) bounds by field where None
+        is open. Rows without a number in a field of ranges never match.
+        """
+        self.__check(ranges)
+        if not self.rows:
+            return []
+        mask = self.__mask(ranges)
+        if numpy is not None:
+            rows = numpy.flatnonzero(mask).tolist()
+        else:
+            rows = compress(range(len(self.row_keys)), mask)
+        return [self.row_keys[row] for row in rows]
+
+    def aggregate(self, field, function, ranges):
+        """
+        Returns the aggregate function, one of AGGREGATES, of the numbers
+        of field in the rows inside ranges (see select()).
+        """
+        if function not in AGGREGATES:
+            raise ValueError(f"unknown aggregate {function!r}")
+        ranges = dict(ranges)
+        ranges.setdefault(field, (None, None))
+        self.__check(ranges)
+        if not self.rows:
+            return aggregate_values((), function)
+        mask = self.__mask(ranges)
+        if numpy is None:
+            return aggregate_values(compress(self.columns[field], mask),
+                                    function)
+        values = numpy.frombuffer(self.columns[field],
+                                  self.columns[field].typecode)[mask]
+        if function == "count":
+            return len(values)
+        if function == "sum" and not len(values):
+            return 0
+        if not len(values):
+            return None
+        return getattr(values, function)().item()
+
+
+def intersect(lookups):
+    """
+    Returns the list of the keys inside every range of lookups, (index,
+    low, high) triples of SortedIndex instances and inclusive bounds
+    where None is open. The range holding the fewest keys is read, in
+    the order of its index, and the values of its keys are checked in
+    the other indexes.
+    """
+    lookups = sorted(lookups, key=lambda lookup: lookup[0].count(
+        lookup[1], lookup[2]))
+    index, low, high = lookups[0]
+    keys = index.range(low, high)
+    for index, low, high in lookups[1:]:
+        values = index.values
+        keys = [key for key in keys
+                if (value := values.get(key)) is not None and
+                (low is None or value >= low) and
+                (high is None or value <= high)]
+    return keys
+
+
+class SortedIndex:
+    """
+    Index of the objects of a class in the order of the number in a field
+
+    Entries are (value, key) pairs in a sorted list, searched by bisect.
+    Added entries wait in pending until the next lookup, which merges
+    them one at a time when they are few and by a sort otherwise: a
+    reload builds the index with one sort. Integers and floats are
+    indexed alike, as numeric_value() finds them.
+
+    Attributes
+    ----------
+    class_name : str
+        class of the indexed objects
+    field : str
+        indexed attribute
+    fields : tuple
+        attributes whose change needs the object to be indexed again
+    entries : list
+        sorted (value, key) pairs
+    values : dictionary
+        indexed value by key
+    pending : list
+        (value, key) pairs not merged into entries yet
+    """
+
+    def __init__(self, class_name, field):
+        """Create an empty index of field for class_name."""
+        self.class_name = class_name
+        self.field = field
+        self.fields = (field,)
+        self.entries = list()
+        self.values = dict()
+        self.pending = list()
+
+    def add(self, key, obj):
+        """Indexes obj under key, unless its field holds no number."""
+        value = field_value(obj, self.field)
+        if type(value) is not int or not -2 ** 63 <= value < 2 ** 63:
+            value = numeric_value(value)
+            if value is None:
+                return
+        self.values[key] = value
+        self.pending.append((value, key))
+
+    def discard(self, key):
+        """Removes key from the index if it is inside."""
+        value = self.values.pop(key, None)
+        if value is None:
+            return
+        self.__merge()
+        del self.entries[bisect_left(self.entries, (value, key))]
+
+    def clear(self):
+        """Removes every key."""
+        self.entries.clear()
+        self.values.clear()
+        self.pending.clear()
+
+    def __len__(self):
+        """Returns the number of indexed keys."""
+        return len(self.values)
+
+    def __merge(self):
+        """Merges the pending entries into entries."""
+        if not self.pending:
+            return
+        if len(self.pending) * 32 < len(self.entries):
+            for entry in self.pending:
+                insort(self.entries, entry)
+        else:
+            self.entries.extend(self.pending)
+            self.entries.sort()
+        self.pending.clear()
+
+    def __bounds(self, low, high):
+        """Returns the slice of entries between low and high."""
+        self.__merge()
+        first = operator.itemgetter(0)
+        start = 0 if low is None else bisect_left(self.entries, low,
+                                                  key=first)
+        end = len(self.entries) if high is None else bisect_right(
+            self.entries, high, key=first)
+        return start, max(start, end)
+
+    def count(self, low=None, high=None):
+        """Returns the number of keys whose value is in [low, high]."""
+        start, end = self.__bounds(low, high)
+        return end - start
+
+    def range(self, low=None, high=None, reverse=False):
+        """
+        Returns the list of the keys whose value is in [low, high], None
+        being open, by increasing value, or decreasing with reverse; keys
+        of the same value come in their order.
+        """
+        start, end = self.__bounds(low, high)
+        entries = self.entries[start:end]
+        if reverse:
+            entries.reverse()
+        return [key for _, key in entries]
+
+
+def position(obj, fields=("latitude", "longitude")):
+    """
+    Returns the (latitude, longitude) of obj in degrees, None unless both
+    fields hold numbers of the globe.
+    """
+    lat = numeric_value(field_value(obj, fields[0]))
+    lon = numeric_value(field_value(obj, fields[1]))
+    if lat is None or lon is None or not (-90 <= lat <= 90 and
+                                          -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Returns the great circle distance between two positions in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) *
+         math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def check_bbox(bbox):
+    """
+    Returns bbox as a tuple of floats (south, west, north, east), in
+    degrees, or raises ValueError. A bbox whose west is greater than its
+    east crosses the 180th meridian.
+    """
+    try:
+        south, west, north, east = map(float, bbox)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be 4 numbers: south, west, north, "
+                         "east") from None
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and
+            -180 <= east <= 180):
+        raise ValueError(f"invalid bbox {bbox!r}")
+    return south, west, north, east
+
+
+def in_bbox(lat, lon, bbox):
+    """Returns whether the position is inside the checked bbox."""
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lon <= east
+    return lon >= west or lon <= east
+
+
+def bbox_around(lat, lon, radius_km):
+    """
+    Returns the smallest bbox holding the circle of radius_km around the
+    position, over every longitude when it holds a pole.
+    """
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and radius_km >= 0):
+        raise ValueError("invalid position or radius")
+    angle = radius_km / EARTH_RADIUS_KM
+    south = max(-90.0, lat - math.degrees(angle))
+    north = min(90.0, lat + math.degrees(angle))
+    if south == -90 or north == 90 or angle >= math.pi / 2:
+        return south, -180.0, north, 180.0
+    # widest longitude of the circle, reached at its tangent meridians
+    ratio = math.sin(angle) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return south, -180.0, north, 180.0
+    width = math.degrees(math.asin(ratio))
+    west = (lon - width + 180) % 360 - 180
+    east = (lon + width + 180) % 360 - 180
+    return south, west, north, east
+
+
+class GridIndex:
+    """
+    Grid of the positions of the objects of a class
+
+    The globe is cut into cells of cell_degrees of latitude by as many of
+    longitude. A query reads the cells its bbox covers, or every filled
+    cell when there are fewer of them, and checks the positions found
+    there exactly.
+
+    Attributes
+    ----------
+    class_name : str
+        class of the indexed objects
+    fields : tuple
+        latitude and longitude attributes, in degrees
+    cell_degrees : float
+        size of the cells
+    rows, columns : int
+        number of rows and columns of cells
+    values : function
+        returns the (latitude, longitude) fields of an object
+    cells : dictionary
+        keys of the objects by (row, column) of their cell, as
+        dictionaries with None values
+    positions : dictionary
+        (latitude, longitude, cell) by key
+    """
+
+    def __init__(self, class_name, fields=("latitude", "longitude"),
+                 cell_degrees=GRID_DEGREES):
+        """Create an empty grid of fields for class_name."""
+        self.class_name = class_name
+        self.fields = tuple(fields)
+        self.cell_degrees = cell_degrees
+        self.rows = math.ceil(180 / cell_degrees)
+        self.columns = math.ceil(360 / cell_degrees)
+        self.values = values_getter(self.fields)
+        self.cells = dict()
+        self.positions = dict()
+
+    def __row(self, lat):
+        """Returns the row of the latitude."""
+        return min(int((lat + 90) // self.cell_degrees), self.rows - 1)
+
+    def __column(self, lon):
+        """Returns the column of the longitude."""
+        return min(int((lon + 180) // self.cell_degrees), self.columns - 1)
+
+    def add(self, key, obj):
+        """Indexes obj under key, unless it has no position."""
+        lat, lon = self.values(obj)
+        if type(lat) is not float or type(lon) is not float or not (
+                -90 <= lat <= 90 and -180 <= lon <= 180):
+            found = position(obj, self.fields)
+            if found is None:
+                return
+            lat, lon = found
+        size = self.cell_degrees
+        cell = (min(int((lat + 90) // size), self.rows - 1),
+                min(int((lon + 180) // size), self.columns - 1))
+        self.positions[key] = (lat, lon, cell)
+        self.cells.setdefault(cell, dict())[key] = None
+
+    def discard(self, key):
+        """Removes key from the index if it is inside."""
+        found = self.positions.pop(key, None)
+        if found is None:
+            return
+        keys = self.cells[found[2]]
+        del keys[key]
+        if not keys:
+            del self.cells[found[2]]
+
+    def clear(self):
+        """Removes every key."""
+        self.cells.clear()
+        self.positions.clear()
+
+    def __len__(self):
+        """Returns the number of indexed keys."""
+        return len(self.positions)
+
+    def __covered(self, bbox):
+        """Yields the filled cells the checked bbox covers."""
+        south, west, north, east = bbox
+        rows = range(self.__row(south), self.__row(north) + 1)
+        first, last = self.__column(west), self.__column(east)
+        if west <= east:
+            columns = range(first, last + 1)
+        elif first <= last:
+            # crossing the 180th meridian inside a column covers them all
+            columns = range(self.columns)
+        else:
+            columns = [*range(first, self.columns), *range(0, last + 1)]
+        if len(rows) * len(columns) <= len(self.cells):
+            for row in rows:
+                for column in columns:
+                    if (row, column) in self.cells:
+                        yield self.cells[(row, column)]
+            return
+        columns = set(columns)
+        for (row, column), keys in self.cells.items():
+            if row in rows and column in columns:
+                yield keys
+
+    def within(self, bbox):
+        """
+        Returns the list of the keys whose position is inside bbox,
+        (south, west, north, east) in degrees.
+        """
+        bbox = check_bbox(bbox)
+        positions = self.positions
+        return [key for keys in self.__covered(bbox) for key in keys
+                if in_bbox(*positions[key][:2], bbox)]
+
+    def near(self, lat, lon, radius_km):
+        """
+        Returns the list of the (distance in km, key) pairs of the keys
+        at most radius_km from the position, nearest first.
+        """
+        found = list()
+        positions = self.positions
+        for keys in self.__covered(bbox_around(lat, lon, radius_km)):
+            for key in keys:
+                distance = distance_km(lat, lon, *positions[key][:2])
+                if distance <= radius_km:
+                    found.append((distance, key))
+        found.sort()
+        return found
+
+
+def tokens(text):
+    """Returns the lowercase words of text, a string or anything else."""
+    if not isinstance(text, str):
+        return []
+    text = text.lower()
+    if text.isascii():
+        # the words of TOKEN, split at C speed
+        return text.translate(ASCII_SEPARATORS).split()
+    return TOKEN.findall(text)
+
+
+def document_text(obj, fields):
+    """Returns the text of the fields of obj, one per line."""
+    if len(fields) == 1:
+        value = field_value(obj, fields[0])
+        return value if isinstance(value, str) else ""
+    return "\n".join(value for value in (field_value(obj, field)
+                                         for field in fields)
+                     if isinstance(value, str))
+
+
+def rank(scores, limit=None):
+    """
+    Returns the list of the (score, key) pairs of the dictionary scores,
+    highest first, then by key, the limit first ones only when given.
+    """
+    found = ((-score, key) for key, score in scores.items())
+    if limit is None:
+        found = sorted(found)
+    else:
+        found = heapq.nsmallest(limit, found)
+    return [(-score, key) for score, key in found]
+
+
+class TextIndex:
+    """
+    Inverted index of the words in the text fields of a class
+
+    A document, the text of the fields of an object, is split into
+    lowercase words by tokens(). The postings list of a word gives how
+    many times it occurs in each document holding it.
+
+    add() and discard() only note the key: the documents are split by
+    the next search(), len() or state(), so that reading a file does not
+    split the text of every object.
+
+    The index can be restored from state(), saved earlier, instead of
+    splitting every document again: the restored documents are taken by
+    the first split, and only those whose checksum changed are split
+    again, while those not given by add() are dropped.
+
+    Attributes
+    ----------
+    class_name : str
+        class of the indexed objects
+    fields : tuple
+        text attributes
+    postings : dictionary
+        count of each word by key, as dictionaries, by word
+    documents : dictionary
+        [checksum of the text, words separated by spaces] by key
+    pending : dictionary
+        objects to split by key, None for the keys to remove
+    restored : dictionary
+        state() restored, taken by the next split, or None
+    changed : bool
+        whether the index changed since state() was last saved
+    """
+
+    def __init__(self, class_name, fields):
+        """Create an empty index of fields for class_name."""
+        self.class_name = class_name
+        self.fields = tuple(fields)
+        self.postings = dict()
+        self.documents = dict()
+        self.pending = dict()
+        self.restored = None
+        self.changed = False
+
+    def add(self, key, obj):
+        """Indexes the words of obj under key on the next split."""
+        self.pending[key] = obj
+
+    def discard(self, key):
+        """Removes key from the index on the next split."""
+        self.pending[key] = None
+
+    def waiting(self):
+        """Returns whether documents wait for the next split."""
+        return bool(self.pending) or self.restored is not None
+
+    def __split(self):
+        """
+        Splits the pending documents, except the restored or indexed
+        ones whose checksum did not change.
+        """
+        if not self.waiting():
+            return
+        pending, self.pending = self.pending, dict()
+        dropped = ()
+        if self.restored is not None:
+            self.postings = self.restored["postings"]
+            self.documents = self.restored["documents"]
+            self.restored = None
+            dropped = set(self.documents).difference(pending)
+        for key, obj in pending.items():
+            if obj is None:
+                self.__remove(key)
+                continue
+            text = document_text(obj, self.fields)
+            checksum = zlib.crc32(text.encode())
+            document = self.documents.get(key)
+            if document is not None:
+                if document[0] == checksum:
+                    continue
+                self.__remove(key)
+            self.__insert(key, checksum, text)
+        for key in dropped:
+            self.__remove(key)
+
+    def __insert(self, key, checksum, text):
+        """Adds the words of text to the postings under key."""
+        counts = Counter(tokens(text))
+        if not counts:
+            return
+        self.documents[key] = [checksum, " ".join(counts)]
+        postings = self.postings
+        for word, count in counts.items():
+            if word in postings:
+                postings[word][key] = count
+            else:
+                postings[word] = {key: count}
+        self.changed = True
+
+    def __remove(self, key):
+        """Removes the document of key from the postings."""
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        for word in document[1].split(" "):
+            keys = self.postings[word]
+            del keys[key]
+            if not keys:
+                del self.postings[word]
+        self.changed = True
+
+    def clear(self):
+        """Removes every key."""
+        self.postings.clear()
+        self.documents.clear()
+        self.pending.clear()
+        self.restored = None
+        self.changed = True
+
+    def __len__(self):
+        """Returns the number of indexed documents."""
+        self.__split()
+        return len(self.documents)
+
+    def state(self):
+        """Returns the postings and documents, to be restored later."""
+        self.__split()
+        return {"fields": list(self.fields), "postings": self.postings,
+                "documents": self.documents}
+
+    def restore(self, state):
+        """
+        Takes the postings and documents of state() for the next split
+        while nothing was split. Returns whether it did.
+        """
+        if (self.documents or self.restored is not None or
+                state.get("fields") != list(self.fields)):
+            return False
+        postings, documents = state.get("postings"), state.get("documents")
+        if type(postings) is not dict or type(documents) is not dict:
+            raise ValueError("invalid text index state")
+        self.restored = {"postings": postings, "documents": documents}
+        self.changed = False
+        return True
+
+    def search(self, text, match="all", limit=None):
+        """
+        Returns the list of the (score, key) pairs of the documents
+        holding all the words of text, or any of them for match "any",
+        highest score first. The score of a document is the number of
+        times the words occur in it.
+        """
+        if match not in ("all", "any"):
+            raise ValueError(f"unknown match {match!r}")
+        self.__split()
+        words = dict.fromkeys(tokens(text))
+        lists = [self.postings.get(word, {}) for word in words]
+        scores = dict()
+        if match == "any":
+            for keys in lists:
+                for key, count in keys.items():
+                    scores[key] = scores.get(key, 0) + count
+        elif lists and all(lists):
+            lists.sort(key=len)
+            first, others = lists[0], lists[1:]
+            for key, count in first.items():
+                for keys in others:
+                    if key not in keys:
+                        break
+                    count += keys[key]
+                else:
+                    scores[key] = count
+        return rank(scores, limit)
@@ -0,0 +1,332 @@
+#!/usr/bin/python3
+"""
+Writes and reads storage files one record at a time.
+
+Files can be compressed with gzip, lzma (xz) or zlib. The codec of a
+file to write is given, or chosen by its extension with codec_of(); the
+codec of a file to read is found by open_text() from its first bytes.
+"""
+
+import gzip
+import io
+import json
+import lzma
+import os
+import re
+import zlib
+from contextlib import contextmanager
+
+BUFFER_SIZE = 1024 * 1024
+# plain files at least this large are read one member at a time, smaller
+# ones at once by json.load(), which is several times faster
+STREAM_MIN_BYTES = 64 * 1024 * 1024
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+CODECS = ("gzip", "lzma", "zlib")
+EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".xz": "lzma",
+              ".lzma": "lzma", ".zz": "zlib", ".zlib": "zlib"}
+
+
+def codec_of(path):
+    """Returns the codec of the extension of path, None for plain text."""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def detect(head):
+    """
+    Returns the codec of a file starting with the bytes head, None for
+    plain text. A JSON text starts with none of these bytes.
+    """
+    if head.startswith(b"\x1f\x8b"):
+        return "gzip"
+    if head.startswith(b"\xfd7zXZ\x00") or head.startswith(b"\x5d\x00"):
+        return "lzma"
+    if (len(head) >= 2 and head[0] & 0x0f == 8 and
+            (head[0] * 256 + head[1]) % 31 == 0):
+        return "zlib"
+    return None
+
+
+class ZlibStream(io.RawIOBase):
+    """
+    Raw stream compressing what is written to, or decompressing what is
+    read from, a binary file in the zlib format
+
+    Attributes
+    ----------
+    fileobj : file object
+        binary file holding the compressed data
+    closefd : bool
+        whether closing the stream closes fileobj
+    codec : zlib.Compress or zlib.Decompress
+        state of the compression or decompression
+    pending : bytes
+        decompressed data not read yet
+    """
+
+    def __init__(self, fileobj, mode="rb", level=None, closefd=False):
+        """Compress to fileobj in mode 'wb', decompress it in mode 'rb'."""
+        super().__init__()
+        self.fileobj = fileobj
+        self.closefd = closefd
+        self.mode = mode
+        if mode == "wb":
+            self.codec = zlib.compressobj(-1 if level is None else level)
+        else:
+            self.codec = zlib.decompressobj()
+        self.pending = b""
+
+    def readable(self):
+        """Returns whether the stream decompresses."""
+        return self.mode == "rb"
+
+    def writable(self):
+        """Returns whether the stream compresses."""
+        return self.mode == "wb"
+
+    def readinto(self, buffer):
+        """Decompresses into buffer, returns the number of bytes."""
+        while not self.pending and not self.codec.eof:
+            chunk = self.fileobj.read(BUFFER_SIZE)
+            if not chunk:
+                raise EOFError("compressed file ended before the "
+                               "end-of-stream marker was reached")
+            self.pending = self.codec.decompress(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def write(self, data):
+        """Compresses data, returns its length."""
+        self.fileobj.write(self.codec.compress(data))
+        return len(data)
+
+    def close(self):
+        """Writes the end of the compressed data, if any, and closes."""
+        if not self.closed:
+            if self.mode == "wb":
+                self.fileobj.write(self.codec.flush())
+            if self.closefd:
+                self.fileobj.close()
+        super().close()
+
+
+def compressor(fileobj, codec, level=None):
+    """Returns a binary stream compressing with codec to fileobj."""
+    if codec == "gzip":
+        return gzip.GzipFile(filename="", mode="wb", fileobj=fileobj,
+                             compresslevel=9 if level is None else level)
+    if codec == "lzma":
+        return lzma.LZMAFile(fileobj, "wb", preset=level)
+    if codec == "zlib":
+        return io.BufferedWriter(ZlibStream(fileobj, "wb", level),
+                                 BUFFER_SIZE)
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def open_binary(path):
+    """
+    Opens the file at path for reading as bytes, decompressing it when
+    it is compressed. The stream supports peek().
+    """
+    with open(path, 'rb') as fp:
+        codec = detect(fp.read(6))
+    if codec is None:
+        return open(path, 'rb', buffering=BUFFER_SIZE)
+    if codec == "gzip":
+        return gzip.open(path, 'rb')
+    if codec == "lzma":
+        return lzma.open(path, 'rb')
+    return io.BufferedReader(
+        ZlibStream(open(path, 'rb'), "rb", closefd=True), BUFFER_SIZE)
+
+
+def open_text(path):
+    """
+    Opens the file at path for reading as text, decompressing it when it
+    is compressed.
+    """
+    with open(path, 'rb') as fp:
+        codec = detect(fp.read(6))
+    if codec is None:
+        return open(path, 'r')
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8")
+
+
+@contextmanager
+def atomic_open(path, fsync=False, codec=None, level=None, binary=False):
+    """
+    Opens a temporary file to write in place of path, and replaces path
+    by it when the block ends without error, so that readers see the old
+    or the new file and never a part of it. With fsync, both the file and
+    the directory entry are on disk when the block ends. With codec, the
+    data is compressed, at level if given. The file is opened in text
+    mode, or for bytes when binary is True.
+    """
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'wb', buffering=BUFFER_SIZE) as raw:
+            stream = raw if codec is None else compressor(raw, codec, level)
+            if binary:
+                yield stream
+            else:
+                fp = io.TextIOWrapper(stream, encoding="utf-8")
+                yield fp
+                fp.flush()
+                fp.detach()
+            if codec is not None:
+                # writes the end of the compressed data, keeps raw open
+                stream.close()
+            if fsync:
+                raw.flush()
+                os.fsync(raw.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+    if fsync:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def write_object(fp, members):
+    """
+    Writes members, (key, JSON text of the value) pairs, to fp as one
+    JSON object holding a member per line. Only one member is in memory
+    at a time. Returns the number of characters written.
+    """
+    written = fp.write("{")
+    separator = "\n"
+    for key, text in members:
+        written += fp.write(separator + json.dumps(key) + ": " + text)
+        separator = ",\n"
+    written += fp.write("\n}\n")
+    return written
+
+
+class ObjectWriter:
+    """
+    Writes a JSON object to a file one member at a time, in the format of
+    write_object(), for members that come interleaved with those of other
+    files
+
+    Attributes
+    ----------
+    fp : file object
+        file opened for writing in text mode
+    separator : str
+        text written before the next member
+    """
+
+    def __init__(self, fp):
+        """Start the object in fp."""
+        self.fp = fp
+        self.separator = "\n"
+        fp.write("{")
+
+    def write(self, key, text):
+        """Writes the member key, with text as the JSON text of its value."""
+        self.fp.write(self.separator + json.dumps(key) + ": " + text)
+        self.separator = ",\n"
+
+    def close(self):
+        """Ends the object."""
+        self.fp.write("\n}\n")
+
+
+class ObjectReader:
+    """
+    Reads the members of the JSON object in a file one at a time
+
+    The file is read in chunks of chunk_size characters, and the text of
+    a member is dropped once it is decoded, so memory holds a chunk and
+    one member whatever the size of the file.
+
+    Attributes
+    ----------
+    fp : file object
+        file opened for reading in text mode
+    chunk_size : int
+        number of characters read at once
+    buffer : str
+        text read but not decoded yet, from pos
+    pos : int
+        position of the next character to decode in buffer
+    eof : bool
+        whether the whole file was read
+    """
+
+    def __init__(self, fp, chunk_size=BUFFER_SIZE):
+        """Read from fp chunk_size characters at a time."""
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def __fill(self):
+        """Adds a chunk to the buffer, returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def __next_char(self):
+        """Skips whitespace and returns the next character, '' at end."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.__fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def __expect(self, chars):
+        """Consumes the next character, which must be one of chars."""
+        char = self.__next_char()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}",
+                                       self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def __decode(self):
+        """Decodes the next JSON value, reading chunks until it is whole."""
+        self.__next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            # a number or literal at the end of the buffer may go on
+            if end < len(self.buffer) or not self.__fill():
+                self.pos = end
+                return value
+
+    def __iter__(self):
+        """Yields the (key, value) members of the object."""
+        self.__expect("{")
+        if self.__next_char() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.__decode()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting property name",
+                                           self.buffer, self.pos)
+            self.__expect(":")
+            yield key, self.__decode()
+            if self.__expect(",}") == "}":
+                return
+
+
+def iter_object(fp, chunk_size=BUFFER_SIZE):
+    """Yields the (key, value) members of the JSON object in fp."""
+    return iter(ObjectReader(fp, chunk_size))
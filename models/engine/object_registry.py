@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+"""Dictionary of stored objects that can hold records not yet loaded."""
+
+
+class ObjectRegistry(dict):
+    """
+    Dictionary of objects by <class name>.id
+
+    A value can also be the raw dictionary of a record that was read from
+    storage but not turned into an instance yet. It is built with loader
+    the first time it is fetched, so reading the registry always gives
+    model instances.
+
+    Keys are also partitioned by class name, so that the keys and the
+    number of objects of one class come without scanning the others.
+    The secondary indexes of a class are updated along with its partition,
+    except after load(): they are then built from the raw records by the
+    first indexes_of() of the class, so that reading records is not
+    slowed down by indexing them.
+
+    Attributes
+    ----------
+    loader : function
+        builds the instance of a raw record
+    unloaded : int
+        number of raw records in the registry
+    classes : dictionary
+        keys by class name, each as a dictionary with None values
+    indexes : dictionary
+        secondary indexes by the name of the class they index
+    unindexed : set
+        names of the classes whose indexes wait for indexes_of()
+    """
+
+    def __init__(self, objects=(), loader=None, indexes=None):
+        """Fill the registry, and its indexes, with objects."""
+        super().__init__()
+        self.loader = loader
+        self.unloaded = 0
+        self.classes = dict()
+        self.indexes = indexes if indexes is not None else dict()
+        self.unindexed = set()
+        for class_indexes in self.indexes.values():
+            for index in class_indexes:
+                index.clear()
+        self.update(objects)
+
+    def load(self, key, record):
+        """
+        Adds the raw record under key, to be built when fetched, leaving
+        the indexes of its class to indexes_of().
+        """
+        class_name = key.partition(".")[0]
+        if class_name not in self.unindexed:
+            self.unindexed.add(class_name)
+            for index in self.indexes.get(class_name, ()):
+                index.clear()
+        self[key] = record
+
+    def indexes_of(self, class_name):
+        """Returns the indexes of class_name, building them if needed."""
+        class_indexes = self.indexes.get(class_name, ())
+        if class_name in self.unindexed:
+            self.unindexed.discard(class_name)
+            for key in self.class_keys(class_name):
+                value = dict.__getitem__(self, key)
+                for index in class_indexes:
+                    index.add(key, value)
+        return class_indexes
+
+    def __updated(self, class_name):
+        """
+        Returns the indexes of class_name to update, none while they wait
+        for indexes_of().
+        """
+        if class_name in self.unindexed:
+            return ()
+        return self.indexes.get(class_name, ())
+
+    def __load(self, key, value):
+        """Returns the instance for value, building it if needed."""
+        if type(value) is dict:
+            value = self.loader(value)
+            dict.__setitem__(self, key, value)
+            self.unloaded -= 1
+        return value
+
+    def load_all(self):
+        """Builds the instance of every raw record."""
+        if self.unloaded:
+            for key, value in dict.items(self):
+                if type(value) is dict:
+                    self.__load(key, value)
+
+    def class_keys(self, class_name):
+        """Returns the keys of the objects of class_name."""
+        return self.classes.get(class_name, {}).keys()
+
+    def count(self, class_name=None):
+        """Returns the number of objects, or of objects of class_name."""
+        if class_name is None:
+            return len(self)
+        return len(self.classes.get(class_name, ()))
+
+    def reindex(self, key, name=None):
+        """
+        Updates the indexes of the object under key after its attribute
+        name, or any attribute when name is None, changed.
+        """
+        for index in self.__updated(key.partition(".")[0]):
+            if name is None or name in index.fields:
+                index.discard(key)
+                index.add(key, dict.__getitem__(self, key))
+
+    def raw_items(self):
+        """Returns the items without building any instance."""
+        return dict.items(self)
+
+    def __setitem__(self, key, value):
+        """Sets value under key."""
+        class_name = key.partition(".")[0]
+        if key not in self:
+            self.classes.setdefault(class_name, dict())[key] = None
+        elif type(dict.__getitem__(self, key)) is dict:
+            self.unloaded -= 1
+        if type(value) is dict:
+            self.unloaded += 1
+        dict.__setitem__(self, key, value)
+        for index in self.__updated(class_name):
+            index.discard(key)
+            index.add(key, value)
+
+    def __delitem__(self, key):
+        """Removes key, without building its instance."""
+        if type(dict.__getitem__(self, key)) is dict:
+            self.unloaded -= 1
+        dict.__delitem__(self, key)
+        class_name = key.partition(".")[0]
+        del self.classes[class_name][key]
+        if not self.classes[class_name]:
+            del self.classes[class_name]
+        for index in self.__updated(class_name):
+            index.discard(key)
+
+    def __getitem__(self, key):
+        """Returns the instance under key."""
+        return self.__load(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        """Returns the instance under key, or default."""
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        """Removes key and returns its instance, or default."""
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        """Removes and returns the last (key, instance) pair."""
+        if not self:
+            raise KeyError("popitem(): registry is empty")
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        """Returns the instance under key, setting default if missing."""
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """Sets every (key, value) pair of args and kwargs."""
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        """Removes every key."""
+        dict.clear(self)
+        self.unloaded = 0
+        self.classes.clear()
+        self.unindexed.clear()
+        for class_indexes in self.indexes.values():
+            for index in class_indexes:
+                index.clear()
+
+    def items(self):
+        """Returns the (key, instance) pairs."""
+        self.load_all()
+        return dict.items(self)
+
+    def values(self):
+        """Returns the instances."""
+        self.load_all()
+        return dict.values(self)
+
+    def copy(self):
+        """Returns a plain dictionary of the instances."""
+        return dict(self.items())
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+"""
+Reads a storage file in several processes.
+
+The JSON files written by FileStorage hold one member per line, so the
+file splits into byte ranges at line boundaries. A forked worker per
+range parses its records, checks them and builds their instances, which
+the parent unpickles in file order.
+
+Workers are forked, and get their work through the fork instead of
+pickled functions: the first reload runs while `models` is being
+imported, and a worker importing anything from it would wait forever
+on the import lock its parent held when it forked.
+"""
+
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+from models.engine.db_storage import CLASSES
+
+# smaller files are read faster by one process than by several
+MIN_BYTES = 4 * 1024 * 1024
+
+
+def available():
+    """Returns whether workers can be forked on this platform."""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def one_record_per_line(path):
+    """
+    Returns whether the JSON file at path holds a member per line, as
+    far as its first line and first member tell.
+    """
+    with open(path, 'rb') as fp:
+        if fp.readline().rstrip(b"\r\n") != b"{":
+            return False
+        line = fp.readline()
+    try:
+        parse_line(line)
+    except ValueError:
+        return False
+    return True
+
+
+def chunks(path, count):
+    """Returns at most count (start, end) byte ranges covering path."""
+    size = os.path.getsize(path)
+    step = max(1, -(-size // count))
+    return [(start, min(start + step, size))
+            for start in range(0, size, step)]
+
+
+def parse_line(line):
+    """
+    Returns the (key, record) pair of a member line, None for the lines
+    opening and closing the object.
+    """
+    line = line.strip()
+    if line.endswith(b","):
+        line = line[:-1]
+    if line in (b"", b"{", b"}"):
+        return None
+    (key, record), = json.loads(b"{" + line + b"}").items()
+    return key, record
+
+
+def check(key, record):
+    """
+    Checks that record is a record of key, and turns its dates into
+    datetimes.
+    """
+    class_name = record.get("__class__")
+    if (class_name not in CLASSES or
+            key != "{}.{}".format(class_name, record.get("id"))):
+        raise ValueError(f"invalid record {key!r}")
+    for name in ("created_at", "updated_at"):
+        if name in record:
+            record[name] = datetime.datetime.fromisoformat(record[name])
+    return record
+
+
+def load_chunk(path, start, end):
+    """Returns the (key, instance) pairs of the lines in range."""
+    members = list()
+    with open(path, 'rb') as fp:
+        if start:
+            # the line running over start belongs to the previous range
+            fp.seek(start - 1)
+            fp.readline()
+        while fp.tell() < end:
+            line = fp.readline()
+            if not line:
+                break
+            member = parse_line(line)
+            if member is not None:
+                members.append((member[0], build(check(*member))))
+    return members
+
+
+def build(record):
+    """Returns the instance of a checked record."""
+    _class = CLASSES[record.pop("__class__")]
+    obj = _class.__new__(_class)
+    # what create_from_dict() sets, without storage callbacks
+    obj.__setstate__(record)
+    return obj
+
+
+def work(path, start, end, connection):
+    """Sends the instances of a range, or the error reading them."""
+    try:
+        result = (None, load_chunk(path, start, end))
+    except Exception as error:
+        result = (error, None)
+    connection.send(result)
+    connection.close()
+
+
+def load(path, workers):
+    """
+    Returns an iterator of the (key, instance) pairs of the JSON file at
+    path, read by workers forked processes, in file order. The error of
+    a worker, such as the ValueError of a line that is not a whole
+    member, is raised once they all ended, before any pair is given.
+    """
+    context = multiprocessing.get_context("fork")
+    jobs = list()
+    for start, end in chunks(path, workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=work,
+                                  args=(path, start, end, sender))
+        process.start()
+        sender.close()
+        jobs.append((process, receiver))
+    results = list()
+    try:
+        for process, receiver in jobs:
+            results.append(receiver.recv())
+    finally:
+        for process, receiver in jobs:
+            receiver.close()
+            process.join()
+    for error, _ in results:
+        if error is not None:
+            raise error
+    return itertools.chain.from_iterable(
+        members for _, members in results)
@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+"""
+Queries on the objects of a class, planned on the storage indexes.
+
+    storage.query(Place).where(city_id=city.id, price_by_night__lt=100)
+                        .order_by("-price_by_night").limit(10).all()
+
+A condition is a keyword <field>__<operator>=<value>, or <field>=<value>
+for equality, with an operator of OPERATORS. A query runs when its
+results are asked for: the planner of the storage picks the index
+giving the fewest candidates, or a scan of the class, and every
+candidate is then checked against all the conditions. explain() gives
+the path chosen and the number of objects examined.
+"""
+
+from collections import namedtuple
+from collections.abc import Collection, Iterable
+from models.engine.indexes import (ColumnIndex, ForeignKeyIndex,
+                                   SortedIndex, field_value, numeric_value)
+
+OPERATORS = ("eq", "ne", "lt", "lte", "gt", "gte", "in")
+# a column scan reads a row at C speed, many times faster than a check
+COLUMN_ROWS_PER_CHECK = 20
+
+
+class Condition(namedtuple("Condition", "field operator value")):
+    """
+    Condition on the value of a field of an object
+
+    Attributes
+    ----------
+    field : str
+        attribute compared
+    operator : str
+        one of OPERATORS
+    value
+        value compared with, a collection for "in"
+    """
+
+    @classmethod
+    def parse(cls, name, value):
+        """Returns the Condition of the keyword argument name=value."""
+        field, _, operator = name.rpartition("__")
+        if not field:
+            field, operator = name, "eq"
+        if operator not in OPERATORS:
+            raise ValueError(f"unknown operator {operator!r} in {name!r}")
+        if operator == "in":
+            if (isinstance(value, (str, bytes)) or
+                    not isinstance(value, Iterable)):
+                raise ValueError(f"{name} needs a collection of values")
+            if not isinstance(value, Collection):
+                # the planners go through the values more than once
+                value = tuple(value)
+        return cls(field, operator, value)
+
+    def test(self, obj):
+        """Returns whether obj satisfies the condition."""
+        value = field_value(obj, self.field)
+        operator = self.operator
+        try:
+            if operator == "eq":
+                return value == self.value
+            if operator == "ne":
+                return value != self.value
+            if operator == "in":
+                return value in self.value
+            if value is None:
+                return False
+            if operator == "lt":
+                return value < self.value
+            if operator == "lte":
+                return value <= self.value
+            if operator == "gt":
+                return value > self.value
+            return value >= self.value
+        except TypeError:
+            return False
+
+
+def bounds(conditions, field):
+    """
+    Returns the inclusive (low, high) bounds, None being open, that the
+    conditions on field put on a number, or None when they put none.
+    Strict bounds are kept inclusive: the candidates are checked anyway.
+    """
+    low = high = None
+    found = False
+    for condition in conditions:
+        if (condition.field != field or condition.operator in ("ne", "in")
+                or numeric_value(condition.value) is None):
+            continue
+        found = True
+        if condition.operator in ("eq", "gt", "gte"):
+            low = condition.value if low is None else max(low,
+                                                          condition.value)
+        if condition.operator in ("eq", "lt", "lte"):
+            high = condition.value if high is None else min(high,
+                                                            condition.value)
+    return (low, high) if found else None
+
+
+def order_key(value):
+    """
+    Returns the sort key of a value: numbers, then strings, then the
+    other values.
+    """
+    if numeric_value(value) is not None:
+        return 0, value
+    if isinstance(value, str):
+        return 1, value
+    return 2, str(value)
+
+
+class Query:
+    """
+    Conditions, order and limit of a query on the objects of a class
+
+    Queries are immutable: where(), order_by() and limit() return a new
+    query.
+
+    Attributes
+    ----------
+    class_name : str
+        class of the objects queried
+    runner : function
+        returns the (key, object) pairs of the results of a query, and
+        its plan, as run by the storage
+    conditions : tuple
+        Condition instances all results satisfy
+    order : str
+        field the results are ordered by, None for no order
+    reverse : bool
+        order by decreasing value
+    count : int
+        maximum number of results, None for all
+    """
+
+    def __init__(self, class_name, runner, conditions=(), order=None,
+                 reverse=False, count=None):
+        """Create a query on class_name run by runner."""
+        self.class_name = class_name
+        self.runner = runner
+        self.conditions = tuple(conditions)
+        self.order = order
+        self.reverse = reverse
+        self.count = count
+
+    def __copy(self, **changes):
+        """Returns a copy of the query with changes."""
+        attributes = {"conditions": self.conditions, "order": self.order,
+                      "reverse": self.reverse, "count": self.count}
+        attributes.update(changes)
+        return Query(self.class_name, self.runner, **attributes)
+
+    def where(self, **conditions):
+        """Returns the query with conditions added."""
+        return self.__copy(conditions=self.conditions + tuple(
+            Condition.parse(name, value)
+            for name, value in conditions.items()))
+
+    def order_by(self, field):
+        """
+        Returns the query ordered by field, decreasing when it starts
+        with "-". Ties are ordered by key.
+        """
+        reverse = field.startswith("-")
+        return self.__copy(order=field.lstrip("-"), reverse=reverse)
+
+    def limit(self, count):
+        """Returns the query giving at most count results."""
+        if count is not None and (type(count) is not int or count < 0):
+            raise ValueError("limit must be an integer, at least 0")
+        return self.__copy(count=count)
+
+    def matches(self, obj):
+        """Returns whether obj satisfies every condition."""
+        for condition in self.conditions:
+            if not condition.test(obj):
+                return False
+        return True
+
+    def run(self):
+        """
+        Returns the list of the (key, object) pairs of the results, in
+        order, and the plan of the query: a dictionary of the path
+        chosen, the index used, the number of candidates the path gave,
+        of objects checked against the conditions and of results.
+        """
+        return self.runner(self)
+
+    def all(self):
+        """Returns the dictionary of the results by key, in order."""
+        return dict(self.run()[0])
+
+    def __iter__(self):
+        """Yields the objects of the results, in order."""
+        for _, obj in self.run()[0]:
+            yield obj
+
+    def explain(self):
+        """Runs the query and returns its plan (see run())."""
+        return self.run()[1]
+
+
+def plan(query, indexes, size):
+    """
+    Returns the cheapest path to the candidates of query, given the
+    indexes of its class and its number of objects, as a (cost, path,
+    index, candidates) tuple: candidates is a function returning the
+    candidate keys, or None for a scan of the class. The cost is the
+    number of objects checked against the conditions, plus the rows of
+    a column scan over COLUMN_ROWS_PER_CHECK. A sorted index or column
+    only gives candidates when it holds a number for every object of
+    the class: the conditions may match values it leaves out.
+    """
+    best = (size, "scan", None, None)
+    ranges = dict()
+    counts = dict()
+    columns = None
+    for index in indexes:
+        kind = type(index)
+        if kind is ForeignKeyIndex:
+            for condition in query.conditions:
+                if condition.field != index.field:
+                    continue
+                if (condition.operator == "eq" and
+                        isinstance(condition.value, str) and
+                        condition.value):
+                    keys = index.lookup(condition.value)
+                elif (condition.operator == "in" and
+                      all(isinstance(value, str) and value
+                          for value in condition.value)):
+                    keys = [key for value in dict.fromkeys(condition.value)
+                            for key in index.lookup(value)]
+                else:
+                    continue
+                if len(keys) < best[0]:
+                    best = (len(keys), "foreign key", index.field,
+                            lambda keys=keys: list(keys))
+        elif kind is SortedIndex:
+            found = bounds(query.conditions, index.field)
+            if found is None or len(index) != size:
+                continue
+            ranges[index.field] = found
+            cost = counts[index.field] = index.count(*found)
+            if cost < best[0]:
+                best = (cost, "sorted range", index.field,
+                        lambda index=index, found=found: index.range(*found))
+        elif kind is ColumnIndex:
+            columns = index
+    if columns is not None:
+        for field in columns.fields:
+            found = bounds(query.conditions, field)
+            if found is not None:
+                ranges[field] = found
+        ranges = {field: found for field, found in ranges.items()
+                  if field in columns.fields and columns.covers(field)}
+        # the rows found, taking the ranges as independent, are checked
+        found = size
+        for field in ranges:
+            found = found * counts.get(field, size) / max(size, 1)
+        cost = len(columns) // COLUMN_ROWS_PER_CHECK + int(found)
+        if ranges and cost < best[0]:
+            best = (cost, "column scan", ", ".join(ranges),
+                    lambda: columns.select(ranges))
+    return best
+
+
+def ordered_walk(query, indexes, size, cost):
+    """
+    Returns the SortedIndex of the order of query when reading it in
+    order, until query.count results are found, should check fewer
+    objects than sorting the cost candidates; None otherwise. The index
+    must hold every object of the class.
+    """
+    if query.order is None or query.count is None:
+        return None
+    for index in indexes:
+        if (type(index) is SortedIndex and index.field == query.order and
+                len(index) == size):
+            # the candidates are taken for the results spread in order
+            expected = query.count * size / max(cost, 1)
+            return index if expected < cost else None
+    return None
+
+
+def run_query(query, objects, indexes, keys):
+    """
+    Returns the (key, object) pairs of the results of query, in order,
+    and its plan, reading the objects by key from objects, given the
+    indexes of the class and the keys of its objects.
+    """
+    size = len(keys)
+    cost, path, field, candidates = plan(query, indexes, size)
+    walk = ordered_walk(query, indexes, size, cost)
+    results = list()
+    examined = 0
+    if walk is not None:
+        path, field = "ordered walk", walk.field
+        found = bounds(query.conditions, walk.field) or (None, None)
+        candidates = walk.range(*found, query.reverse)
+        for key in candidates:
+            if len(results) >= query.count:
+                break
+            obj = objects[key]
+            examined += 1
+            if query.matches(obj):
+                results.append((key, obj))
+    else:
+        candidates = keys if candidates is None else candidates()
+        for key in candidates:
+            obj = objects[key]
+            examined += 1
+            if query.matches(obj):
+                results.append((key, obj))
+        results = order(query, results)
+    return results, {"class": query.class_name, "path": path,
+                     "index": field, "candidates": len(candidates),
+                     "examined": examined, "returned": len(results)}
+
+
+def order(query, results):
+    """Returns the (key, object) pairs of results in order and limited."""
+    if query.order is not None:
+        results = sorted(results, key=lambda item: (order_key(
+            field_value(item[1], query.order)), item[0]),
+            reverse=query.reverse)
+    if query.count is not None:
+        results = results[:query.count]
+    return results
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+"""
+Layout of a storage split into shard files, and its migration helpers.
+
+A sharded storage is a directory holding one JSON file per shard, in the
+same format as file.json, and a _layout.json manifest. Objects go to a
+shard per class (User.json, Place.json, ...) or to one of a number of
+buckets chosen by a hash of their key (bucket-0000.json, ...).
+"""
+
+import contextlib
+import errno
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from models.engine.jsonstream import (ObjectWriter, atomic_open, codec_of,
+                                      iter_object, open_text, write_object)
+
+MANIFEST = "_layout.json"
+# shard files split() writes at once, each with its own write buffer
+OPEN_SHARDS = 64
+
+
+def shard_of(key, shards):
+    """Returns the name of the shard of key for the layout shards."""
+    if shards == "class":
+        return key.partition(".")[0]
+    return "bucket-{:04d}".format(zlib.crc32(key.encode()) % shards)
+
+
+def shard_path(shard_dir, shard):
+    """Returns the path of the file of shard."""
+    return os.path.join(shard_dir, shard + ".json")
+
+
+def list_shards(shard_dir):
+    """Returns the names of the shards found in shard_dir."""
+    if not os.path.isdir(shard_dir):
+        return list()
+    return sorted(name[:-len(".json")] for name in os.listdir(shard_dir)
+                  if name.endswith(".json") and name != MANIFEST)
+
+
+def read_layout(shard_dir):
+    """Returns the layout written in the manifest, None without one."""
+    path = os.path.join(shard_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as fp:
+        return json.load(fp)["shards"]
+
+
+def write_layout(shard_dir, shards):
+    """Writes the manifest of the layout shards."""
+    os.makedirs(shard_dir, exist_ok=True)
+    write_text(os.path.join(shard_dir, MANIFEST),
+               json.dumps({"shards": shards}))
+
+
+def write_text(path, text, fsync=False):
+    """Replaces the file at path by text in one step."""
+    with atomic_open(path, fsync) as fp:
+        fp.write(text)
+
+
+def read_json(path):
+    """Returns the dictionary stored in the JSON file at path."""
+    with open_text(path) as fp:
+        return json.load(fp)
+
+
+def iter_json(path):
+    """Yields the (key, value) members of the JSON file at path."""
+    with open_text(path) as fp:
+        yield from iter_object(fp)
+
+
+def split(file_path, shard_dir, shards="class"):
+    """
+    Writes the objects of the JSON file file_path into shard_dir, in
+    place of the shards there. Each record goes to the file of its shard
+    as it is read, so memory holds one record at a time; the hash
+    buckets are written OPEN_SHARDS at a time, reading file_path once for
+    each group.
+
+    The shards are written to a directory next to shard_dir, then moved
+    into it once file_path was read whole: a missing or invalid
+    file_path, which raises OSError or ValueError, leaves shard_dir as it
+    was. file_path cannot be inside shard_dir.
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                file_path)
+    target = os.path.realpath(shard_dir)
+    if os.path.commonpath([os.path.realpath(file_path), target]) == target:
+        raise ValueError(f"{file_path} is inside {shard_dir}")
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".split-", dir=parent)
+    try:
+        write_layout(staging, shards)
+        if shards == "class":
+            write_shards(file_path, staging, shards)
+        else:
+            for first in range(0, shards, OPEN_SHARDS):
+                write_shards(file_path, staging, shards, {
+                    "bucket-{:04d}".format(bucket) for bucket
+                    in range(first, min(first + OPEN_SHARDS, shards))})
+        swap_shards(staging, shard_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def swap_shards(staging, shard_dir):
+    """
+    Moves the shards of staging into shard_dir, removes the others, then
+    moves the manifest of staging.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = list_shards(staging)
+    for shard in shards:
+        os.replace(shard_path(staging, shard), shard_path(shard_dir, shard))
+    for shard in set(list_shards(shard_dir)).difference(shards):
+        os.remove(shard_path(shard_dir, shard))
+    os.replace(os.path.join(staging, MANIFEST),
+               os.path.join(shard_dir, MANIFEST))
+
+
+def write_shards(file_path, shard_dir, shards, wanted=None):
+    """
+    Streams the records of the JSON file file_path to the files of their
+    shards in shard_dir, for the shards in wanted only unless it is None.
+    """
+    with contextlib.ExitStack() as stack:
+        writers = dict()
+        for key, record in iter_json(file_path):
+            if type(record) is not dict:
+                raise ValueError(f"invalid record {key!r}")
+            shard = shard_of(key, shards)
+            if wanted is not None and shard not in wanted:
+                continue
+            writer = writers.get(shard)
+            if writer is None:
+                writer = writers[shard] = ObjectWriter(stack.enter_context(
+                    atomic_open(shard_path(shard_dir, shard))))
+            writer.write(key, json.dumps(record))
+        for writer in writers.values():
+            writer.close()
+
+
+def join(shard_dir, file_path):
+    """
+    Writes the objects of every shard of shard_dir into file_path,
+    compressed by the codec of its extension.
+    """
+    members = ((key, json.dumps(record))
+               for shard in list_shards(shard_dir)
+               for key, record in iter_json(shard_path(shard_dir, shard)))
+    with atomic_open(file_path, codec=codec_of(file_path)) as fp:
+        write_object(fp, members)
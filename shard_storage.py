@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+"""
+Converts a storage file into a sharded storage directory and back.
+
+Usage:
+    ./shard_storage.py split <file.json> <directory> [class|<buckets>]
+    ./shard_storage.py join <directory> <file.json>
+"""
+
+import os
+import sys
+
+
+if __name__ == '__main__':
+    # the models package must not reload ./file.json on import: it fails
+    # when HBNB_STORAGE_SHARDS disagrees with the directory migrated
+    os.environ["HBNB_STORAGE_RELOAD"] = "0"
+    from models.engine.sharding import split, join
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "split":
+        layout = sys.argv[4] if len(sys.argv) == 5 else "class"
+        split(sys.argv[2], sys.argv[3],
+              int(layout) if layout.isdigit() else layout)
+    elif len(sys.argv) == 4 and sys.argv[1] == "join":
+        join(sys.argv[2], sys.argv[3])
+    else:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
@@ -21,12 +21,14 @@ from tests import CLASSES
 test_path = "_tmp_path.json"
 PROMPT_STR = "(hbnb) "
 CONSOLE_METHODS = [
-    'update_dict', 'count', 'default', 're_arrange', 'execute_command',
-    'do_update', 'do_all', 'do_destroy', 'do_show', 'do_create', 'do_EOF',
-    'do_quit', 'emptyline'
+    'update_dict', 'count', 'by_foreign_key', 'spatial', 'search',
+    'where', 'default',
+    're_arrange',
+    'execute_command', 'do_update', 'do_all', 'do_destroy', 'do_show',
+    'do_create', 'do_stats', 'do_EOF', 'do_quit', 'emptyline'
 ]
 MODULE_METHODS = [
-    'class_exists', 'retrieve', 'parse'
+    'class_exists', 'retrieve', 'coerce', 'keywords', 'parse'
 ]
 
 
@@ -129,7 +131,7 @@ class TestConsoleGenericMethods(BaseCase):
         expected_str = '''
 Documented commands (type help <topic>):
 ========================================
-EOF  all  create  destroy  help  quit  show  update\n\n'''
+EOF  all  create  destroy  help  quit  show  stats  update\n\n'''
         HBNBCommand().onecmd("help")
         self.assertEqual(stdout.getvalue(), expected_str)
 
@@ -190,6 +192,196 @@ class TestCountCommand(BaseCase):
             stdout.seek(0)
             stdout.truncate(0)
 
+    def test_count_exact_class_name(self, stdout):
+        """check that count does not add classes sharing a prefix."""
+        self.onecmd("Use.count()")
+        self.assertEqual(stdout.getvalue(), "0\n")
+
+
+@patch('sys.stdout', new_callable=StringIO)
+class TestByForeignKeyCommand(BaseCase):
+    """Test the <classname>.by_<foreign key>(<id>) commands."""
+
+    def setUp(self):
+        """Create a city with two places and a place elsewhere."""
+        super().setUp()
+        self.city = City()
+        self.places = [Place(), Place()]
+        for place in self.places:
+            place.city_id = self.city.id
+        Place().city_id = "elsewhere"
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_by_city(self, stdout):
+        """check that only the places of the city are printed."""
+        self.onecmd(f'Place.by_city("{self.city.id}")')
+        got = eval(stdout.getvalue())
+        self.assertEqual(sorted(got), sorted(str(p) for p in self.places))
+
+    def test_by_state_empty(self, stdout):
+        """check that no match prints an empty list."""
+        self.onecmd(f'City.by_state("{self.city.id}")')
+        self.assertEqual(stdout.getvalue(), "[]\n")
+
+    def test_id_missing(self, stdout):
+        """check the error when no id is given."""
+        self.onecmd("Review.by_place()")
+        self.assertEqual(stdout.getvalue(), "** instance id missing **\n")
+
+    def test_unknown_foreign_key(self, stdout):
+        """check that a field that is no foreign key is unknown syntax."""
+        HBNBCommand().onecmd(f'City.by_name("{self.city.id}")')
+        self.assertIn("Unknown syntax", stdout.getvalue())
+
+
+@patch('sys.stdout', new_callable=StringIO)
+class TestSpatialCommands(BaseCase):
+    """Test the <classname>.near() and <classname>.within() commands."""
+
+    def setUp(self):
+        """Create a place in Kampala and one in Nairobi."""
+        super().setUp()
+        self.places = [Place(), Place()]
+        for place, (lat, lon) in zip(self.places, ((0.3476, 32.5825),
+                                                   (-1.2921, 36.8219))):
+            place.latitude = lat
+            place.longitude = lon
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_near(self, stdout):
+        """check that the places in the circle are printed nearest first."""
+        self.onecmd("Place.near(-1, 36, 1000)")
+        self.assertEqual(eval(stdout.getvalue()),
+                         [str(place) for place in self.places[::-1]])
+
+    def test_within(self, stdout):
+        """check that the places in the box are printed."""
+        self.onecmd('Place.within(0, 30, "1", 33)')
+        self.assertEqual(eval(stdout.getvalue()), [str(self.places[0])])
+
+    def test_errors(self, stdout):
+        """check the errors of missing and invalid coordinates."""
+        self.onecmd("Place.near(0, 32)")
+        self.onecmd("Place.within(0, 1, 0, x)")
+        self.onecmd("Place.near(0, 32, -5)")
+        self.assertEqual(stdout.getvalue(), "** coordinates missing **\n"
+                         "** invalid coordinates **\n"
+                         "** invalid coordinates **\n")
+
+    def test_class_without_position(self, stdout):
+        """check that classes without position have no such command."""
+        HBNBCommand().onecmd("User.near(0, 0, 10)")
+        self.assertIn("Unknown syntax", stdout.getvalue())
+
+
+@patch('sys.stdout', new_callable=StringIO)
+class TestSearchCommand(BaseCase):
+    """Test the <classname>.search() command."""
+
+    def setUp(self):
+        """Create two reviews."""
+        super().setUp()
+        self.reviews = [Review(), Review()]
+        for review, text in zip(self.reviews, ("Quiet and clean, quiet",
+                                               "Clean, quiet kitchen")):
+            review.text = text
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_search(self, stdout):
+        """check that the reviews with every word are printed, best first."""
+        self.onecmd('Review.search("quiet clean")')
+        self.assertEqual(eval(stdout.getvalue()),
+                         [str(review) for review in self.reviews])
+
+    def test_any_and_limit(self, stdout):
+        """check the "any" match and the count of instances printed."""
+        self.onecmd('Review.search("kitchen, garden", "any", 1)')
+        self.assertEqual(eval(stdout.getvalue()), [str(self.reviews[1])])
+
+    def test_errors(self, stdout):
+        """check the errors of missing text and invalid searches."""
+        self.onecmd("Review.search()")
+        self.onecmd("Review.search(quiet)")
+        self.onecmd('Review.search("quiet", "most")')
+        self.onecmd('Review.search("quiet", -1)')
+        self.assertEqual(stdout.getvalue(), "** search text missing **\n" +
+                         "** invalid search **\n" * 3)
+
+    def test_class_without_text(self, stdout):
+        """check that classes without text fields have no such command."""
+        HBNBCommand().onecmd('User.search("quiet")')
+        self.assertIn("Unknown syntax", stdout.getvalue())
+
+
+@patch('sys.stdout', new_callable=StringIO)
+class TestWhereCommand(BaseCase):
+    """Test the <classname>.where() command."""
+
+    def setUp(self):
+        """Create three places."""
+        super().setUp()
+        self.places = [Place(), Place(), Place()]
+        for place, price in zip(self.places, (30, 10, 20)):
+            place.price_by_night = price
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_where(self, stdout):
+        """check that the matching instances are printed in order."""
+        self.onecmd('Place.where(price_by_night__lte=20, '
+                    'order_by="-price_by_night")')
+        self.assertEqual(eval(stdout.getvalue()),
+                         [str(place) for place in self.places[:0:-1]])
+
+    def test_limit_and_explain(self, stdout):
+        """check the limit, and the plan printed after the instances."""
+        self.onecmd('Place.where(price_by_night__in=[10, 30], '
+                    'order_by="price_by_night", limit=1, explain=True)')
+        instances, plan = stdout.getvalue().splitlines()
+        self.assertEqual(eval(instances), [str(self.places[1])])
+        self.assertEqual(eval(plan)["returned"], 1)
+
+    def test_errors(self, stdout):
+        """check the errors of unknown classes and invalid queries."""
+        self.onecmd("Nothing.where()")
+        self.onecmd("Place.where(price_by_night__below=3)")
+        self.onecmd("Place.where(10)")
+        self.onecmd("Place.where(limit=-1)")
+        self.onecmd("Place.where(name=)")
+        self.assertEqual(stdout.getvalue(), "** class doesn't exist **\n" +
+                         "** invalid query **\n" * 4)
+
+
+@patch('sys.stdout', new_callable=StringIO)
+class TestStatsCommand(BaseCase):
+    """Test the stats command."""
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_stats(self, stdout):
+        """check that every statistic is printed on its own line."""
+        User()
+        User()
+        self.onecmd("stats")
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), len(console.storage.stats()))
+        self.assertIn("objects: 2", lines)
+        self.assertIn("classes: {'User': 2}", lines)
+        self.assertTrue(any(line.startswith("saves: ") for line in lines))
+
 
 class TestUpdateCommand(BaseCase):
     """Test update command."""
@@ -257,6 +449,16 @@ class TestUpdateCommand(BaseCase):
                 self.assertEqual(getattr(fetched_obj, attr_name), attr_value,
                                  msg=msg)
 
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_update_invalid_value(self, stdout):
+        """check that a value of the wrong type changes nothing."""
+        place = Place()
+        self.onecmd(f"update Place {place.id} price_by_night cheap")
+        self.onecmd(f'Place.update("{place.id}", '
+                    '{"name": "Cabin", "max_guest": "many"})')
+        self.assertEqual(stdout.getvalue(), "** invalid value **\n" * 2)
+        self.assertEqual((place.price_by_night, place.name), (0, ""))
+
     def test_update_key_value(self):
         """check that key/value pair reflects in the __objects dict."""
         attr_name = 'xyz'
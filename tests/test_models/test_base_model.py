@@ -8,7 +8,9 @@ import datetime
 from datetime import datetime as dt
 import re
 import os
+from unittest.mock import patch
 
+import models
 from models.base_model import BaseModel
 from models.engine.file_storage import FileStorage
 
@@ -249,3 +251,176 @@ class TestBaseModelCreateFromDict(TestBase):
                             msg="type(dict_attr) does not match\
                             type(obj_attr)")
             self.assertEqual(_dict[key], obj_attr)
+
+    def test_no_storage_callbacks(self):
+        """
+        Check that building an object marks nothing dirty, and that
+        create_from_dict() on an object marks it once.
+        """
+        with patch.object(models.storage, "mark_dirty") as mark_dirty:
+            BaseModel()
+            obj = BaseModel(**self.__class__.all_dict)
+            self.assertEqual(mark_dirty.call_count, 0)
+            obj.create_from_dict(self.__class__.other_attrs)
+            mark_dirty.assert_called_once_with(obj)
+
+
+class TestBaseModelInterning(TestBase):
+    """Test the strings shared by objects created from dictionaries."""
+
+    def copy(self, text):
+        """Returns an equal string that is not text itself."""
+        return "".join(list(text))
+
+    def test_foreign_keys(self):
+        """Check that equal ids and foreign keys share one string."""
+        place_id = "68940dfc-901f-4af2-93df-e05490bea019"
+        objs = [BaseModel(id=self.copy(place_id),
+                          place_id=self.copy(place_id),
+                          amenity_ids=[self.copy(place_id), 1])
+                for _ in range(2)]
+        self.assertIs(objs[0].id, objs[1].id)
+        self.assertIs(objs[0].place_id, objs[1].id)
+        self.assertIs(objs[0].amenity_ids[0], objs[1].place_id)
+        self.assertEqual(objs[0].amenity_ids[1], 1)
+
+    def test_other_fields(self):
+        """Check that other fields are not interned."""
+        objs = [BaseModel(name=self.copy("Betty"), number_id=7)
+                for _ in range(2)]
+        self.assertIsNot(objs[0].name, objs[1].name)
+        self.assertEqual(objs[0].number_id, 7)
+
+    def test_low_cardinality_fields(self):
+        """Check that the fields of interned are shared."""
+        class Named(BaseModel):
+            interned = frozenset({"name"})
+
+        objs = [Named(name=self.copy("Betty")) for _ in range(2)]
+        self.assertIs(objs[0].name, objs[1].name)
+
+
+class TestBaseModelSlots(TestBase):
+    """Test the slots and the overflow of the model attributes."""
+
+    def test_no_instance_dict(self):
+        """Check that instances store their attributes in slots."""
+        from models.place import Place
+        place = Place()
+        self.assertIn("name", Place.__slots__)
+        self.assertEqual(Place._defaults["name"], "")
+        self.assertIsNone(place._BaseModel__overflow)
+        self.assertIsNot(place.__dict__, place.__dict__)
+
+    def test_class_defaults(self):
+        """Check that the class attributes still give the defaults."""
+        from models.place import Place
+        from models.user import User
+        self.assertEqual(Place.name, "")
+        self.assertEqual(Place.number_rooms, 0)
+        self.assertEqual(Place.amenity_ids, [])
+        self.assertEqual(User.email, "")
+        self.assertFalse(hasattr(User, "number_rooms"))
+        self.assertTrue(callable(Place.save))
+        place = Place()
+        place.name = "Home"
+        self.assertEqual(Place.name, "")
+        Place.max_guest = 2
+        self.addCleanup(setattr, Place, "max_guest", 0)
+        self.assertEqual(place.max_guest, 2)
+
+    def test_other_class_attributes(self):
+        """
+        Check that a model sets and deletes class attributes named after
+        the fields of other models as any class does.
+        """
+        from models.place import Place
+        from models.user import User
+        User.name = "x"
+        self.addCleanup(delattr, User, "name")
+        User.number_rooms = 1
+        self.assertEqual((User.name, User.number_rooms), ("x", 1))
+        self.assertEqual(User().name, "x")
+        self.assertEqual((Place.name, Place.number_rooms), ("", 0))
+        del User.number_rooms
+        self.assertFalse(hasattr(User, "number_rooms"))
+        self.assertIsNot(type(Place), type(User))
+
+    def test_defaults(self):
+        """Check that unset fields read as their class default."""
+        from models.place import Place
+        place = Place()
+        self.assertEqual(place.number_rooms, 0)
+        self.assertEqual(place.name, "")
+        self.assertNotIn("name", place.__dict__)
+        place.name = "Home"
+        self.assertEqual(place.__dict__["name"], "Home")
+        with self.assertRaises(AttributeError):
+            place.not_an_attribute
+
+    def test_dict_writes(self):
+        """Check that changes to __dict__ are made to the instance."""
+        from models.place import Place
+        place = Place()
+        attributes = place.__dict__
+        with patch.object(models.storage, "mark_dirty") as mark_dirty:
+            attributes["name"] = "Home"
+            attributes.update(extra=1, number_rooms=2)
+            attributes |= {"max_guest": 3}
+            self.assertEqual(mark_dirty.call_count, 4)
+        self.assertEqual((place.name, place.extra, place.number_rooms,
+                          place.max_guest), ("Home", 1, 2, 3))
+        self.assertEqual(attributes, place.__dict__)
+        del attributes["name"]
+        self.assertEqual(attributes.pop("extra"), 1)
+        self.assertEqual(place.name, "")
+        self.assertFalse(hasattr(place, "extra"))
+        self.assertEqual(attributes, place.__dict__)
+        self.assertIs(type(place.to_dict()), dict)
+
+    def test_overflow(self):
+        """Check that undeclared attributes go to the overflow."""
+        self.obj.my_number = 89
+        self.assertEqual(self.obj.my_number, 89)
+        self.assertEqual(self.obj._BaseModel__overflow, {"my_number": 89})
+        self.assertEqual(self.obj.to_dict()["my_number"], 89)
+        self.assertIn("'my_number': 89", str(self.obj))
+        del self.obj.my_number
+        self.assertNotIn("my_number", self.obj.__dict__)
+        with self.assertRaises(AttributeError):
+            del self.obj.my_number
+
+    def test_dict_order(self):
+        """Check that __dict__ lists the id and dates first."""
+        from models.place import Place
+        place = Place()
+        place.extra = 1
+        place.city_id = "c"
+        self.assertEqual(list(place.__dict__),
+                         ["id", "created_at", "updated_at", "city_id",
+                          "extra"])
+
+    def test_copy(self):
+        """Check that pickled and copied instances keep every attribute."""
+        import copy
+        import pickle
+        self.obj.my_number = 89
+        for clone in (copy.copy(self.obj), copy.deepcopy(self.obj),
+                      pickle.loads(pickle.dumps(self.obj))):
+            self.assertEqual(clone.__dict__, self.obj.__dict__)
+            self.assertIsNot(clone._BaseModel__overflow,
+                             self.obj._BaseModel__overflow)
+
+    def test_smaller(self):
+        """Check that an instance takes less memory than with __dict__."""
+        import sys
+        from models.place import Place
+
+        class Plain:
+            pass
+
+        plain = Plain()
+        plain.__dict__.update(Place().__dict__)
+        place = Place()
+        self.assertLess(sys.getsizeof(place),
+                        sys.getsizeof(plain) + sys.getsizeof(vars(plain)))
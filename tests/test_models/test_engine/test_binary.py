@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+"""Contains tests for the binary.py file."""
+
+import unittest
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+import models
+from models.engine import binary, sharding
+from models.engine.jsonstream import atomic_open, write_object
+
+test_path = "_tmp_path_binary.json"
+binary_path = "_tmp_path_binary.bin"
+
+
+def encode(members):
+    """Returns the snapshot of members."""
+    fp = io.BytesIO()
+    binary.write_records(fp, members)
+    return fp.getvalue()
+
+
+def decode(data, datetimes=False):
+    """Returns the members of the snapshot data."""
+    return list(binary.iter_records(io.BytesIO(data), datetimes))
+
+
+class TestVarint(unittest.TestCase):
+    """Test the varint and zigzag functions."""
+
+    def test_round_trip(self):
+        """Check that integers of every size read back."""
+        for number in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 70, -1, -2 ** 64):
+            out = bytearray()
+            binary.write_varint(out, binary.zigzag(number))
+            value, pos = binary.read_varint(out, 0)
+            self.assertEqual(binary.unzigzag(value), number)
+            self.assertEqual(pos, len(out))
+
+    def test_small(self):
+        """Check that small integers take one byte."""
+        for number in (0, 63, -64):
+            out = bytearray()
+            binary.write_varint(out, binary.zigzag(number))
+            self.assertEqual(len(out), 1)
+
+
+class TestRecords(unittest.TestCase):
+    """Test the write_records() and iter_records() functions."""
+
+    members = [
+        ("User.1", {"id": "1", "created_at": "2024-01-02T03:04:05.000006",
+                    "updated_at": "2024-01-02T03:04:05",
+                    "__class__": "User", "email": "a@b.c"}),
+        ("Place.2", {"id": "2", "__class__": "Place", "number_rooms": 3,
+                     "latitude": 1.5, "longitude": -0.1, "price": -7,
+                     "amenity_ids": ["1", "1", "x"], "name": "é€",
+                     "flags": [True, False, None], "big": 2 ** 80,
+                     "nested": {"a": {"b": []}}, "whole": 1.0}),
+        ("odd key", {"id": "3", "__class__": "User"}),
+        ("no record", [1, "2", None]),
+        ("Place.4", {"id": "4", "__class__": "Place", "number_rooms": 1,
+                     "latitude": 2.5, "longitude": 0.0, "price": 7,
+                     "amenity_ids": [], "name": "long " * 40,
+                     "flags": [], "big": 0, "nested": {}, "whole": 2.0}),
+    ]
+
+    def test_round_trip(self):
+        """Check that the members read back as they were written."""
+        self.assertEqual(decode(encode(self.members)), self.members)
+
+    def test_same_json(self):
+        """Check that the members give the same JSON text."""
+        for (key, record), (_, back) in zip(self.members,
+                                            decode(encode(self.members))):
+            self.assertEqual(json.dumps(back), json.dumps(record))
+
+    def test_not_datetimes(self):
+        """Check that strings not written by isoformat() stay strings."""
+        texts = ["2024-01-02 03:04:05", "2024-01-02T03:04:05.000",
+                 "2024-01-02T03:04:05+00:00", "2024-01-02T03:04:05.00000Z",
+                 "9999-99-99T99:99:99", "xxxxxxxxxxTxxxxxxxx"]
+        members = [("k", {"id": "k", "text": text}) for text in texts]
+        back = decode(encode(members), datetimes=True)
+        self.assertEqual(back, members)
+
+    def test_datetimes(self):
+        """Check that datetimes are read back as datetimes on demand."""
+        moment = datetime.datetime(1960, 5, 6, 7, 8, 9, 10)
+        members = [("User.1", {"id": "1", "__class__": "User",
+                               "created_at": moment,
+                               "updated_at": moment.isoformat()})]
+        data = encode(members)
+        (_, strings), = decode(data)
+        self.assertEqual(strings["created_at"], moment.isoformat())
+        self.assertEqual(strings["updated_at"], moment.isoformat())
+        (_, moments), = decode(data, datetimes=True)
+        self.assertEqual(moments["created_at"], moment)
+        self.assertEqual(moments["updated_at"], moment.isoformat())
+
+    def test_iso_strings(self):
+        """Check that strings holding a datetime read back as strings."""
+        members = [("Place.1", {"id": "1", "__class__": "Place",
+                                "name": "2024-01-01T00:00:00",
+                                "tags": ["2024-01-01T00:00:00.000001"]})]
+        data = encode(members)
+        self.assertNotIn(b"2024-01-01T00:00:00", data)
+        self.assertEqual(decode(data, datetimes=True), members)
+        self.assertEqual(decode(data), members)
+
+    def test_first_version(self):
+        """Check that only the timestamps of a MAGIC_V1 snapshot are dates."""
+        moment = datetime.datetime(2024, 1, 1)
+        # the first version wrote ISO strings as datetimes
+        members = [("Place.1", {"id": "1", "__class__": "Place",
+                                "created_at": moment, "name": moment})]
+        data = binary.MAGIC_V1 + encode(members)[len(binary.MAGIC):]
+        (_, record), = decode(data, datetimes=True)
+        self.assertEqual(record["created_at"], moment)
+        self.assertEqual(record["name"], moment.isoformat())
+        (_, record), = decode(data)
+        self.assertEqual(record["created_at"], moment.isoformat())
+
+    def test_string_table(self):
+        """Check that a repeated string is written once."""
+        text = "f" * binary.SHARED_BYTES
+        members = [(str(i), {"id": str(i), "city_id": text})
+                   for i in range(100)]
+        self.assertEqual(encode(members).count(text.encode()), 1)
+        self.assertEqual(decode(encode(members)), members)
+
+    def test_long_strings(self):
+        """Check that long strings are not kept in the table."""
+        text = "f" * (binary.SHARED_BYTES + 1)
+        members = [(str(i), {"text": text}) for i in range(3)]
+        self.assertEqual(encode(members).count(text.encode()), 3)
+
+    def test_smaller_than_json(self):
+        """Check that records of the same shape take less than JSON."""
+        members = [("User.{}".format(i),
+                    {"id": str(i), "created_at": "2024-01-02T03:04:05.000006",
+                     "updated_at": "2024-01-02T03:04:05.000006",
+                     "__class__": "User", "first_name": "Betty"})
+                   for i in range(100)]
+        text = io.StringIO()
+        write_object(text, ((key, json.dumps(record))
+                            for key, record in members))
+        self.assertLess(len(encode(members)), len(text.getvalue()) / 3)
+
+    def test_empty(self):
+        """Check that no member gives an empty snapshot."""
+        self.assertEqual(decode(encode([])), [])
+
+    def test_not_serializable(self):
+        """Check that values JSON refuses are refused too."""
+        for value in (object(), {1: "a"}, datetime.datetime.now(
+                datetime.timezone.utc)):
+            with self.assertRaises(TypeError):
+                encode([("k", {"v": value})])
+
+    def test_bad_files(self):
+        """Check that damaged snapshots are errors."""
+        data = encode(self.members)
+        with self.assertRaises(ValueError):
+            decode(b"{}")
+        for size in (len(data) - 1, len(data) // 2, len(binary.MAGIC)):
+            with self.assertRaises(EOFError):
+                decode(data[:size])
+
+
+class TestConversion(unittest.TestCase):
+    """Test the iter_file(), from_json() and to_json() functions."""
+
+    def setUp(self):
+        """Write a JSON file as the storage writes it."""
+        self.members = TestRecords.members
+        with atomic_open(test_path) as fp:
+            write_object(fp, ((key, json.dumps(record))
+                              for key, record in self.members))
+
+    def tearDown(self):
+        """rm the files written."""
+        for path in (test_path, test_path + ".gz", binary_path,
+                     binary_path + ".gz"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read(self, path):
+        """Returns the bytes of the file at path."""
+        with open(path, 'rb') as fp:
+            return fp.read()
+
+    def test_lossless(self):
+        """Check that JSON to binary to JSON gives the same file."""
+        original = self.read(test_path)
+        binary.from_json(test_path, binary_path)
+        self.assertTrue(self.read(binary_path).startswith(binary.MAGIC))
+        os.remove(test_path)
+        binary.to_json(binary_path, test_path)
+        self.assertEqual(self.read(test_path), original)
+
+    def test_iter_file(self):
+        """Check that iter_file() reads both formats, compressed or not."""
+        self.assertEqual(list(binary.iter_file(test_path)), self.members)
+        for path in (binary_path, binary_path + ".gz"):
+            binary.from_json(test_path, path)
+            self.assertEqual(list(binary.iter_file(path)), self.members)
+        self.assertNotEqual(self.read(binary_path + ".gz")[:2],
+                            binary.MAGIC[:2])
+
+    def test_load_or_stream(self):
+        """
+        Check that a small plain JSON file is decoded at once, and a large
+        or compressed one member by member.
+        """
+        with atomic_open(test_path + ".gz", codec="gzip") as fp:
+            write_object(fp, ((key, json.dumps(record))
+                              for key, record in self.members))
+        with patch.object(binary, "iter_object",
+                          wraps=binary.iter_object) as stream:
+            self.assertEqual(list(binary.iter_file(test_path)), self.members)
+            self.assertEqual(stream.call_count, 0)
+            self.assertEqual(list(binary.iter_file(test_path + ".gz")),
+                             self.members)
+            self.assertEqual(stream.call_count, 1)
+            with patch("models.engine.jsonstream.STREAM_MIN_BYTES", 1):
+                self.assertEqual(list(binary.iter_file(test_path)),
+                                 self.members)
+            self.assertEqual(stream.call_count, 2)
+        with open(test_path, "w") as fp:
+            fp.write("[]")
+        with self.assertRaises(ValueError):
+            list(binary.iter_file(test_path))
+
+
+class TestConvertStorageTool(unittest.TestCase):
+    """Test the convert_storage.py command."""
+
+    def test_other_layout_in_directory(self):
+        """Check that the tool ignores the storage of its directory."""
+        root = os.path.dirname(os.path.abspath(models.__path__[0]))
+        env = dict(os.environ, HBNB_STORAGE_SHARDS="class",
+                   PYTHONPATH=root)
+        records = {"User.1": {"__class__": "User", "id": "1"}}
+        with tempfile.TemporaryDirectory() as directory:
+            # ./file.json.d holds buckets, not the class shards of env
+            sharding.write_layout(os.path.join(directory, "file.json.d"), 4)
+            with open(os.path.join(directory, "in.json"), 'w') as fp:
+                json.dump(records, fp)
+            for args in (("to-binary", "in.json", "out.bin"),
+                         ("to-json", "out.bin", "out.json")):
+                done = subprocess.run(
+                    [sys.executable, os.path.join(root, "convert_storage.py"),
+                     *args], cwd=directory, env=env, capture_output=True,
+                    text=True)
+                self.assertEqual(done.returncode, 0, done.stderr)
+            with open(os.path.join(directory, "out.json")) as fp:
+                self.assertEqual(json.load(fp), records)
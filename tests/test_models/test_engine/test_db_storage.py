@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+"""Contains tests for the db_storage.py file."""
+
+import asyncio
+import gc
+import unittest
+import os
+import sqlite3
+from unittest.mock import patch
+import models
+from models.engine.db_storage import DBStorage
+from models.user import User
+from models.state import State
+from models.city import City
+from models.place import Place
+from models.review import Review
+
+test_path = "_tmp_path.db"
+
+
+class BaseCase(unittest.TestCase):
+    """Base class for the DBStorage tests."""
+
+    def setUp(self):
+        """
+        Open a DBStorage on test_path
+        Make it the storage of the models
+        """
+        self.storage = DBStorage(test_path)
+        self.storage.reload()
+        patcher = patch.object(models, "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Close the storage, rm test_path."""
+        self.storage.close()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def reopen(self):
+        """Close the storage and open a fresh one on the same file."""
+        self.storage.close()
+        self.storage = DBStorage(test_path)
+        self.storage.reload()
+        patcher = patch.object(models, "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return self.storage
+
+
+class TestDBStorageTables(BaseCase):
+    """Test the tables created by reload()."""
+
+    def test_one_table_per_class(self):
+        """Check that every model class has its table."""
+        connection = sqlite3.connect(test_path)
+        tables = {name for (name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        connection.close()
+        self.assertEqual(tables, {"BaseModel", "User", "State", "City",
+                                  "Amenity", "Place", "Review"})
+
+
+class TestDBStorageSave(BaseCase):
+    """Test new(), save() and reading back."""
+
+    def test_saved_objects_reload(self):
+        """Check that saved objects are found by a new storage."""
+        user = User()
+        user.email = "betty@holberton.io"
+        user.save()
+        storage = self.reopen()
+        fetched = storage.get(User, user.id)
+        self.assertEqual(fetched.to_dict(), user.to_dict())
+        self.assertEqual(storage.count(), 1)
+
+    def test_unsaved_objects_not_committed(self):
+        """Check that objects not saved are not in the database."""
+        User()
+        self.assertEqual(self.storage.count(User), 1)
+        self.assertEqual(self.reopen().count(User), 0)
+
+    def test_update_is_upsert(self):
+        """Check that saving a changed object updates its row."""
+        state = State()
+        state.save()
+        state.name = "Nairobi"
+        state.save()
+        storage = self.reopen()
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(storage.get("State", state.id).name, "Nairobi")
+
+    def test_delete(self):
+        """Check that a deleted object is removed on save."""
+        state = State()
+        state.save()
+        self.storage.delete(state)
+        self.assertIsNone(self.storage.get(State, state.id))
+        self.storage.save()
+        self.assertEqual(self.reopen().count(State), 0)
+
+    def test_asave(self):
+        """Check that asave() commits the changes off the event loop."""
+        user = User()
+        user.email = "betty@holberton.io"
+        asyncio.run(user.asave())
+        self.assertEqual(self.storage.stats()["saves"], 1)
+        fetched = self.reopen().get(User, user.id)
+        self.assertEqual(fetched.to_dict(), user.to_dict())
+
+
+class TestDBStorageQueries(BaseCase):
+    """Test all(), get(), count() and find_by()."""
+
+    def setUp(self):
+        """Save a state with two cities and a place."""
+        super().setUp()
+        self.state = State()
+        self.cities = [City(), City()]
+        for city in self.cities:
+            city.state_id = self.state.id
+        self.place = Place()
+        self.storage.save()
+
+    def test_all(self):
+        """Check all() with and without a class."""
+        self.assertEqual(len(self.storage.all()), 4)
+        self.assertEqual(sorted(self.storage.all(City)),
+                         sorted(f"City.{city.id}" for city in self.cities))
+        self.assertEqual(self.storage.all("Nothing"), {})
+
+    def test_get_identity(self):
+        """Check that get() gives back the object in memory."""
+        self.assertIs(self.storage.get(City, self.cities[0].id),
+                      self.cities[0])
+        self.assertIsNone(self.storage.get(City, "no-such-id"))
+
+    def test_identity_map_released(self):
+        """Check that saved objects no longer used leave memory."""
+        city_id = self.cities[0].id
+        del self.cities, self.state, self.place
+        gc.collect()
+        self.assertEqual(len(self.storage._DBStorage__objects), 0)
+        city = self.storage.get(City, city_id)
+        self.assertIs(self.storage.get(City, city_id), city)
+
+    def test_unsaved_kept(self):
+        """Check that unsaved objects stay in memory until saved."""
+        city_id = City().id
+        self.storage.get(City, self.cities[0].id).name = "Kampala"
+        del self.cities
+        gc.collect()
+        self.storage.save()
+        storage = self.reopen()
+        self.assertIsNotNone(storage.get(City, city_id))
+        self.assertEqual(storage.count(City), 3)
+        self.assertEqual(len(storage.find_by(City, "name", "Kampala")), 1)
+
+    def test_count(self):
+        """Check count() with and without a class."""
+        self.assertEqual(self.storage.count(), 4)
+        self.assertEqual(self.storage.count(City), 2)
+        self.assertEqual(self.storage.count("Place"), 1)
+
+    def test_find_by(self):
+        """Check find_by() on a foreign key, before and after a change."""
+        found = self.reopen().find_by(City, "state_id", self.state.id)
+        self.assertEqual(sorted(found),
+                         sorted(f"City.{city.id}" for city in self.cities))
+        city = self.storage.get(City, self.cities[0].id)
+        city.state_id = "other"
+        found = self.storage.find_by(City, "state_id", self.state.id)
+        self.assertEqual(list(found), [f"City.{self.cities[1].id}"])
+
+    def test_find_by_not_indexed(self):
+        """Check find_by() on a field without column."""
+        self.place.name = "Cabin"
+        found = self.storage.find_by(Place, "name", "Cabin")
+        self.assertEqual(list(found.values()), [self.place])
+
+    def test_find_range(self):
+        """Check find_range() and aggregate() on the JSON data."""
+        self.place.price_by_night = 80
+        other = Place()
+        other.price_by_night = 120
+        other.latitude = 1.5
+        found = self.storage.find_range(Place, price_by_night=(None, 100))
+        self.assertEqual(list(found.values()), [self.place])
+        found = self.storage.find_range(Place, price_by_night=(60, None),
+                                        latitude=(1, 2))
+        self.assertEqual(list(found.values()), [other])
+        self.assertEqual(self.storage.aggregate(Place, "price_by_night"),
+                         200)
+        self.assertEqual(self.storage.aggregate(Place, "latitude", "max"),
+                         1.5)
+        self.assertEqual(self.storage.aggregate(
+            Place, "price_by_night", "count", price_by_night=(500, None)), 0)
+        self.assertIsNone(self.storage.aggregate(
+            Place, "price_by_night", "mean", price_by_night=(500, None)))
+
+    def test_find_sorted(self):
+        """Check find_sorted() with and without other ranges."""
+        self.place.price_by_night = 80
+        places = [Place(), Place()]
+        places[0].price_by_night = 120
+        places[0].number_rooms = 2
+        places[1].price_by_night = 50
+        found = self.storage.find_sorted(Place, "price_by_night")
+        self.assertEqual(list(found.values()),
+                         [places[1], self.place, places[0]])
+        found = self.storage.find_sorted(Place, "price_by_night",
+                                         reverse=True, number_rooms=(0, 0))
+        self.assertEqual(list(found.values()), [self.place, places[1]])
+
+    def test_near_within(self):
+        """Check near() and within() on the JSON data."""
+        self.place.latitude = 0.3476
+        self.place.longitude = 32.5825
+        other = Place()
+        other.latitude = -1.2921
+        other.longitude = 36.8219
+        found = self.storage.near(Place, 0, 32, 100)
+        self.assertEqual(list(found.values()), [self.place])
+        found = self.storage.near(Place, -1, 36, 1000)
+        self.assertEqual(list(found.values()), [other, self.place])
+        found = self.storage.within(Place, (-2, 30, 0, 40))
+        self.assertEqual(list(found.values()), [other])
+
+    def test_query(self):
+        """Check query() on the foreign key columns and the JSON data."""
+        places = [Place(), Place(), Place()]
+        for place, city_id, price in zip(places, ("c1", "c1", "c2"),
+                                         (30, 10, 20)):
+            place.city_id = city_id
+            place.price_by_night = price
+        query = self.storage.query(Place).where(city_id__in=["c1", "c3"])
+        self.assertEqual(list(query.order_by("price_by_night")),
+                         places[1::-1])
+        plan = query.where(price_by_night__gt=15).explain()
+        self.assertEqual((plan["path"], plan["index"], plan["examined"],
+                          plan["returned"]),
+                         ("foreign key column", "city_id", 2, 1))
+        query = self.storage.query("Place").order_by("-price_by_night")
+        self.assertEqual(list(query.limit(2)), [places[0], places[2]])
+        self.assertEqual(query.explain()["path"], "scan")
+
+    def test_search(self):
+        """Check search() on the text fields of the JSON data."""
+        reviews = [Review(), Review(), Review()]
+        for review, text in zip(reviews, ("Quiet and clean, quiet",
+                                          "clean_room kitchen",
+                                          "Très propre")):
+            review.text = text
+        found = self.storage.search(Review, "QUIET clean")
+        self.assertEqual(list(found.values()), reviews[:1])
+        found = self.storage.search("Review", "kitchen quiet", "any")
+        self.assertEqual(list(found.values()), reviews[:2])
+        self.assertEqual(self.storage.search(Review, "clean_"), {})
+        found = self.storage.search(Review, "TRÈS")
+        self.assertEqual(list(found.values()), reviews[2:])
+        with self.assertRaises(ValueError):
+            self.storage.search(User, "quiet")
+
+
+class TestDBStorageStats(BaseCase):
+    """Test the statistics of stats()."""
+
+    def test_save(self):
+        """Check that saves and their rows are counted."""
+        User()
+        User()
+        self.assertEqual(self.storage.stats()["pending_changes"], 2)
+        self.storage.save()
+        stats = self.storage.stats()
+        self.assertEqual(stats["saves"], 1)
+        self.assertEqual(stats["rows_written"], 2)
+        self.assertEqual(stats["pending_changes"], 0)
+        self.assertGreater(stats["last_save_seconds"], 0)
+
+    def test_rows_committed(self):
+        """
+        Check that rows written by queries count once, on the save that
+        commits them, and not when they are never committed.
+        """
+        user = User()
+        self.storage.all(User)
+        user.email = "betty@holberton.io"
+        self.storage.count()
+        self.assertEqual(self.storage.stats()["rows_written"], 0)
+        self.storage.save()
+        self.assertEqual(self.storage.stats()["rows_written"], 1)
+        User()
+        self.storage.all(User)
+        self.storage.reload()
+        self.storage.save()
+        self.assertEqual(self.storage.stats()["rows_written"], 1)
+
+    def test_objects_by_class(self):
+        """Check the number of stored objects in all and by class."""
+        User()
+        State().save()
+        stats = self.storage.stats()
+        self.assertEqual(stats["objects"], 2)
+        self.assertEqual(stats["classes"], {"User": 1, "State": 1})
+
+    def test_disabled(self):
+        """Check that nothing is collected when stats are off."""
+        self.storage.close()
+        self.storage = DBStorage(test_path, collect_stats=False)
+        self.storage.reload()
+        self.storage.save()
+        self.assertEqual(self.storage.stats(),
+                         {"pending_changes": 0, "objects": 0,
+                          "classes": {}})
@@ -3,12 +3,25 @@
 """Contains test Files for the file_storage.py file."""
 
 import unittest
+import asyncio
+import datetime
+import atexit
 import re
 import os
 import json
 import random
 import uuid
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import fcntl
+import tempfile
+from unittest.mock import patch
+import models
 from models.engine.file_storage import FileStorage
+from models.engine import binary, sharding, parallel
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -21,6 +34,11 @@ from tests import CLASSES
 test_path = "_tmp_path.json"
 
 
+def atexit_unregister(storage):
+    """Stops a storage created by a test from writing at exit."""
+    atexit.unregister(storage.close)
+
+
 class BaseCase(unittest.TestCase):
     """Base class for all classes."""
 
@@ -259,3 +277,1836 @@ class TestFileStorageReloadMethod(BaseCase):
             if key in FileStorage._FileStorage__objects:
                 retrieved_obj = FileStorage._FileStorage__objects[key]
                 self.assertEqual(_dict, retrieved_obj.to_dict())
+
+
+class TestFileStorageDeleteMethod(BaseCase):
+    """Test the delete() method."""
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_delete(self):
+        """Check that delete() removes the object from __objects."""
+        obj = User()
+        key = f"User.{obj.id}"
+        self.file_storage_obj.delete(obj)
+        self.assertNotIn(key, FileStorage._FileStorage__objects)
+
+    def test_delete_none(self):
+        """Check that delete() with no object does nothing."""
+        User()
+        before = FileStorage._FileStorage__objects.copy()
+        self.file_storage_obj.delete()
+        self.assertEqual(before, FileStorage._FileStorage__objects)
+
+
+class TestFileStorageJournal(BaseCase):
+    """Test the append-only journal mode."""
+
+    def setUp(self):
+        """Create a journaled FileStorage obj with a first snapshot."""
+        self.file_storage_obj = FileStorage(journal=True, journal_ratio=100)
+        patcher = patch.object(models, "storage", self.file_storage_obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.journal_path = self.file_storage_obj.journal_path()
+        self.obj = Place()
+        self.file_storage_obj.save()
+
+    def tearDown(self):
+        """Clear __objects, rm test_path and its journal."""
+        FileStorage._FileStorage__objects.clear()
+        for path in (test_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read_journal(self):
+        """Returns the records of the journal."""
+        with open(self.journal_path, 'r') as fp:
+            return [json.loads(line) for line in fp if line.strip()]
+
+    def test_first_save_is_snapshot(self):
+        """Check that the first save writes the snapshot, not a journal."""
+        self.assertTrue(os.path.exists(test_path))
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_update_is_appended(self):
+        """Check that an update appends a record, not a new snapshot."""
+        with open(test_path, 'r') as fp:
+            snapshot = fp.read()
+        self.obj.name = "Lake house"
+        self.obj.save()
+        with open(test_path, 'r') as fp:
+            self.assertEqual(snapshot, fp.read())
+        records = self.read_journal()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["op"], "set")
+        self.assertEqual(records[0]["value"]["name"], "Lake house")
+
+    def test_only_changes_are_appended(self):
+        """Check that untouched objects are not written to the journal."""
+        User()
+        self.file_storage_obj.save()
+        records = self.read_journal()
+        self.assertEqual(len(records), 1)
+        self.assertTrue(records[0]["key"].startswith("User."))
+
+    def test_delete_is_appended(self):
+        """Check that a delete appends a 'del' record."""
+        key = f"Place.{self.obj.id}"
+        self.file_storage_obj.delete(self.obj)
+        self.file_storage_obj.save()
+        self.assertEqual(self.read_journal(),
+                         [{"op": "del", "key": key}])
+
+    def test_reload_replays_journal(self):
+        """Check that reload() applies the journal over the snapshot."""
+        key = f"Place.{self.obj.id}"
+        self.obj.name = "Lake house"
+        self.obj.save()
+        user = User()
+        self.file_storage_obj.save()
+        self.file_storage_obj.delete(user)
+        self.file_storage_obj.save()
+
+        FileStorage._FileStorage__objects.clear()
+        self.file_storage_obj.reload()
+        __objects = FileStorage._FileStorage__objects
+        self.assertEqual(list(__objects), [key])
+        self.assertEqual(__objects[key].name, "Lake house")
+
+    def test_reload_skips_torn_record(self):
+        """Check that a half written record does not stop the replay."""
+        self.obj.name = "Lake house"
+        self.obj.save()
+        with open(self.journal_path, 'a') as fp:
+            fp.write('{"op": "set", "key": "Pla')
+        user = User()
+        self.file_storage_obj.save()
+
+        FileStorage._FileStorage__objects.clear()
+        self.file_storage_obj.reload()
+        __objects = FileStorage._FileStorage__objects
+        self.assertIn(f"User.{user.id}", __objects)
+        self.assertEqual(__objects[f"Place.{self.obj.id}"].name,
+                         "Lake house")
+
+    def test_compaction(self):
+        """Check that a journal past its threshold is compacted."""
+        self.file_storage_obj.journal_max_bytes = 1
+        self.obj.name = "Lake house"
+        self.obj.save()
+        self.assertFalse(os.path.exists(self.journal_path))
+        with open(test_path, 'r') as fp:
+            snapshot = json.load(fp)
+        self.assertEqual(snapshot[f"Place.{self.obj.id}"]["name"],
+                         "Lake house")
+
+
+class TestFileStorageDirtyTracking(BaseCase):
+    """Test that save() only encodes the dirty objects again."""
+
+    def setUp(self):
+        """Create and save three objects."""
+        super().setUp()
+        self.objs = [User(), State(), City()]
+        self.file_storage_obj.save()
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def test_attribute_set_marks_dirty(self):
+        """Check that setting an attribute marks the object dirty."""
+        self.objs[0].first_name = "Betty"
+        key = f"User.{self.objs[0].id}"
+        self.assertIn(key, FileStorage._FileStorage__changes)
+
+    def test_first_save_encodes_all(self):
+        """Check that new objects are all encoded."""
+        counters = self.file_storage_obj.encode_counters()
+        self.assertEqual(counters["last_encoded"], 3)
+
+    def test_only_dirty_encoded(self):
+        """Check that a save after one change encodes a single object."""
+        self.objs[1].name = "Kampala"
+        self.file_storage_obj.save()
+        counters = self.file_storage_obj.encode_counters()
+        self.assertEqual(counters["last_encoded"], 1)
+        self.assertEqual(counters["last_reused"], 2)
+
+    def test_clean_save_encodes_nothing(self):
+        """Check that a save without changes encodes no object."""
+        before = self.file_storage_obj.encode_counters()
+        self.file_storage_obj.save()
+        after = self.file_storage_obj.encode_counters()
+        self.assertEqual(after["last_encoded"], 0)
+        self.assertEqual(after["flushes"], before["flushes"] + 1)
+        self.assertEqual(after["encoded"], before["encoded"])
+
+    def test_saved_content(self):
+        """Check that the incremental save writes every current object."""
+        self.objs[2].name = "Gulu"
+        self.file_storage_obj.save()
+        with open(test_path, 'r') as fp:
+            dict_from_json = json.load(fp)
+        expected = {f"{type(obj).__name__}.{obj.id}": obj.to_dict()
+                    for obj in self.objs}
+        self.assertEqual(dict_from_json, expected)
+
+    def test_changed_in_place(self):
+        """Check that lists and dictionaries changed in place are saved."""
+        place = Place()
+        place.amenity_ids = ["a"]
+        place.rules = {"pets": False}
+        self.file_storage_obj.save()
+        place.amenity_ids.append("b")
+        self.file_storage_obj.save()
+        place.rules["pets"] = True
+        self.file_storage_obj.save()
+        self.assertEqual(
+            self.file_storage_obj.encode_counters()["last_encoded"], 1)
+        with open(test_path, 'r') as fp:
+            record = json.load(fp)[f"Place.{place.id}"]
+        self.assertEqual(record["amenity_ids"], ["a", "b"])
+        self.assertEqual(record["rules"], {"pets": True})
+        self.file_storage_obj.save()
+        self.assertEqual(
+            self.file_storage_obj.encode_counters()["last_encoded"], 0)
+
+
+class TestFileStorageLazyReload(BaseCase):
+    """Test reload() in lazy mode."""
+
+    def setUp(self):
+        """Save a few objects and reload them lazily."""
+        self.file_storage_obj = FileStorage(lazy=True)
+        self.objs = {f"{type(obj).__name__}.{obj.id}": obj
+                     for obj in (User(), Place(), Review())}
+        self.file_storage_obj.save()
+        FileStorage._FileStorage__objects.clear()
+        self.file_storage_obj.reload()
+        self.__objects = self.file_storage_obj.all()
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def test_nothing_built(self):
+        """Check that reload() builds no instance in lazy mode."""
+        self.assertEqual(sorted(self.__objects), sorted(self.objs))
+        self.assertEqual(self.__objects.unloaded, 3)
+
+    def test_nothing_indexed(self):
+        """
+        Check that reload() indexes nothing in lazy mode, and that a query
+        indexes the records of its class only.
+        """
+        self.assertEqual(self.__objects.unindexed, {"User", "Place", "Review"})
+        found = self.file_storage_obj.find_range(Place, number_rooms=(0, 0))
+        self.assertEqual(
+            list(found), [key for key in self.objs if key.startswith("Place")])
+        self.assertEqual(self.__objects.unindexed, {"User", "Review"})
+        self.assertEqual(self.__objects.unloaded, 2)
+
+    def test_key_lookup(self):
+        """Check that a key lookup builds just that instance."""
+        key = next(iter(self.objs))
+        obj = self.__objects.get(key)
+        self.assertEqual(obj.to_dict(), self.objs[key].to_dict())
+        self.assertEqual(self.__objects.unloaded, 2)
+
+    def test_all_items(self):
+        """Check that iterating all() gives equal instances."""
+        for key, obj in self.__objects.items():
+            self.assertEqual(obj.to_dict(), self.objs[key].to_dict())
+
+    def test_save_unloaded(self):
+        """Check that save() writes records without building them."""
+        self.file_storage_obj.save()
+        self.assertEqual(self.__objects.unloaded, 3)
+        with open(test_path, 'r') as fp:
+            dict_from_json = json.load(fp)
+        self.assertEqual(dict_from_json,
+                         {key: obj.to_dict()
+                          for key, obj in self.objs.items()})
+
+    def test_indexed_defaults(self):
+        """Check that records missing fields match as their defaults do."""
+        place = Place()
+        record = place.to_dict()
+        self.assertNotIn("number_rooms", record)
+        with open(test_path, 'w') as fp:
+            json.dump({f"Place.{place.id}": record}, fp)
+        found = []
+        for lazy in (False, True):
+            FileStorage._FileStorage__objects.clear()
+            storage = FileStorage(lazy=lazy)
+            storage.reload()
+            found.append((
+                sorted(storage.find_range('Place', number_rooms=(0, 0))),
+                sorted(storage.near('Place', 0, 0, 10)),
+                sorted(storage.query('Place').where(
+                    price_by_night__lte=0).all())))
+        self.assertEqual(found[0], found[1])
+        self.assertEqual(len(found[0][0]), 1)
+
+
+class TestFileStorageByClass(BaseCase):
+    """Test all() and count() for a single class."""
+
+    def setUp(self):
+        """Create objects of several classes."""
+        super().setUp()
+        self.users = [User(), User()]
+        self.places = [Place()]
+
+    def tearDown(self):
+        """Clear __objects."""
+        FileStorage._FileStorage__objects.clear()
+
+    def test_all_class(self):
+        """Check that all(cls) gives only the objects of cls."""
+        expected = {f"User.{obj.id}": obj for obj in self.users}
+        self.assertEqual(self.file_storage_obj.all(User), expected)
+        self.assertEqual(self.file_storage_obj.all("User"), expected)
+        self.assertEqual(self.file_storage_obj.all(City), {})
+
+    def test_count(self):
+        """Check count() with and without a class."""
+        self.assertEqual(self.file_storage_obj.count(), 3)
+        self.assertEqual(self.file_storage_obj.count(User), 2)
+        self.assertEqual(self.file_storage_obj.count("Place"), 1)
+
+    def test_count_after_delete(self):
+        """Check that count() follows delete()."""
+        self.file_storage_obj.delete(self.users[0])
+        self.assertEqual(self.file_storage_obj.count(User), 1)
+
+
+class TestFileStorageFindBy(BaseCase):
+    """Test find_by() and the foreign key indexes behind it."""
+
+    def setUp(self):
+        """Create two cities of a state and a place."""
+        super().setUp()
+        self.state = State()
+        self.cities = [City(), City()]
+        for city in self.cities:
+            city.state_id = self.state.id
+        self.place = Place()
+        self.place.city_id = self.cities[0].id
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def keys(self, objs):
+        """Returns the keys of objs."""
+        return sorted(f"{type(obj).__name__}.{obj.id}" for obj in objs)
+
+    def test_find_by(self):
+        """Check that find_by() gives the objects with the foreign key."""
+        found = self.file_storage_obj.find_by(City, "state_id",
+                                              self.state.id)
+        self.assertEqual(sorted(found), self.keys(self.cities))
+        found = self.file_storage_obj.find_by("Place", "city_id",
+                                              self.cities[0].id)
+        self.assertEqual(list(found.values()), [self.place])
+
+    def test_update(self):
+        """Check that the index follows an attribute update."""
+        self.cities[1].state_id = "other"
+        found = self.file_storage_obj.find_by(City, "state_id",
+                                              self.state.id)
+        self.assertEqual(sorted(found), self.keys(self.cities[:1]))
+        found = self.file_storage_obj.find_by(City, "state_id", "other")
+        self.assertEqual(sorted(found), self.keys(self.cities[1:]))
+
+    def test_delete(self):
+        """Check that the index follows delete()."""
+        self.file_storage_obj.delete(self.cities[0])
+        found = self.file_storage_obj.find_by(City, "state_id",
+                                              self.state.id)
+        self.assertEqual(sorted(found), self.keys(self.cities[1:]))
+
+    def test_reload(self):
+        """Check that the index is rebuilt by reload()."""
+        self.file_storage_obj.save()
+        FileStorage._FileStorage__objects.clear()
+        self.assertEqual(self.file_storage_obj.find_by(
+            City, "state_id", self.state.id), {})
+        self.file_storage_obj.reload()
+        found = self.file_storage_obj.find_by(City, "state_id",
+                                              self.state.id)
+        self.assertEqual(sorted(found), self.keys(self.cities))
+
+    def test_not_indexed_field(self):
+        """Check that a field without index is still found."""
+        self.cities[0].name = "Entebbe"
+        found = self.file_storage_obj.find_by(City, "name", "Entebbe")
+        self.assertEqual(list(found.values()), [self.cities[0]])
+
+
+class TestFileStorageFindRange(BaseCase):
+    """Test find_range(), aggregate() and the columns behind them."""
+
+    def setUp(self):
+        """Create three places."""
+        super().setUp()
+        self.places = [Place(), Place(), Place()]
+        for place, price, rooms in zip(self.places, (50, 120, 80),
+                                       (1, 3, 4)):
+            place.price_by_night = price
+            place.number_rooms = rooms
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def find(self, **ranges):
+        """Returns the places of find_range(), in creation order."""
+        found = self.file_storage_obj.find_range(Place, **ranges)
+        return [place for place in self.places
+                if f"Place.{place.id}" in found]
+
+    def test_find_range(self):
+        """Check that find_range() gives the places inside the ranges."""
+        self.assertEqual(self.find(price_by_night=(50, 100),
+                                   number_rooms=(2, None)),
+                         self.places[2:])
+        self.assertEqual(self.find(max_guest=(0, 0)), self.places)
+
+    def test_aggregate(self):
+        """Check aggregate() with and without ranges."""
+        storage = self.file_storage_obj
+        self.assertEqual(storage.aggregate(Place, "price_by_night"), 250)
+        self.assertEqual(storage.aggregate("Place", "price_by_night", "max",
+                                           number_rooms=(None, 3)), 120)
+        self.assertEqual(storage.aggregate(Place, "number_rooms", "mean"),
+                         8 / 3)
+
+    def test_update(self):
+        """Check that the columns follow an attribute update."""
+        self.places[0].price_by_night = 300
+        self.assertEqual(self.find(price_by_night=(200, None)),
+                         self.places[:1])
+        self.places[0].price_by_night = "free"
+        self.assertEqual(self.find(price_by_night=(None, None)),
+                         self.places[1:])
+
+    def test_delete(self):
+        """Check that the columns follow delete()."""
+        self.file_storage_obj.delete(self.places[1])
+        self.assertEqual(self.find(number_rooms=(3, None)),
+                         self.places[2:])
+        self.assertEqual(self.file_storage_obj.aggregate(
+            Place, "number_rooms", "count"), 2)
+
+    def test_reload(self):
+        """Check that the columns are rebuilt by reload()."""
+        self.file_storage_obj.save()
+        FileStorage._FileStorage__objects.clear()
+        self.assertEqual(self.file_storage_obj.find_range(
+            Place, price_by_night=(None, None)), {})
+        self.file_storage_obj.reload()
+        found = self.file_storage_obj.find_range(Place,
+                                                 price_by_night=(60, None))
+        self.assertEqual(sorted(found), sorted(
+            f"Place.{place.id}" for place in self.places[1:]))
+
+    def test_not_a_column(self):
+        """Check that fields without column are compared object by object."""
+        user = User()
+        user.age = 30
+        found = self.file_storage_obj.find_range(User, age=(18, None))
+        self.assertEqual(list(found.values()), [user])
+        self.assertEqual(self.file_storage_obj.aggregate(User, "age", "min"),
+                         30)
+
+
+class TestFileStorageSorted(BaseCase):
+    """Test find_sorted() and the sorted indexes behind find_range()."""
+
+    def setUp(self):
+        """Create four places."""
+        super().setUp()
+        self.places = [Place() for _ in range(4)]
+        for place, price, rooms, guests in zip(self.places,
+                                               (80, 50, 120, 80),
+                                               (2, 3, 3, 1), (4, 6, 6, 2)):
+            place.price_by_night = price
+            place.number_rooms = rooms
+            place.max_guest = guests
+            place.latitude = rooms / 10
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def keys(self, places):
+        """Returns the keys of places."""
+        return [f"Place.{place.id}" for place in places]
+
+    def test_intersection(self):
+        """Check that ranges on sorted fields are intersected."""
+        found = self.file_storage_obj.find_range(
+            Place, price_by_night=(50, 120), number_rooms=(3, None),
+            max_guest=(None, 6))
+        self.assertEqual(sorted(found), sorted(self.keys(self.places[1:3])))
+
+    def test_find_sorted(self):
+        """Check that find_sorted() orders by the field, then by key."""
+        storage = self.file_storage_obj
+        ties = sorted(self.keys((self.places[0], self.places[3])))
+        found = storage.find_sorted(Place, "price_by_night")
+        self.assertEqual(list(found), [self.keys(self.places[1:2])[0],
+                                       *ties, self.keys(self.places[2:3])[0]])
+        found = storage.find_sorted(Place, "price_by_night", reverse=True,
+                                    price_by_night=(None, 100))
+        self.assertEqual(list(found), [*ties[::-1],
+                                       self.keys(self.places[1:2])[0]])
+
+    def test_find_sorted_filtered(self):
+        """Check find_sorted() with ranges on other fields."""
+        found = self.file_storage_obj.find_sorted(
+            "Place", "price_by_night", reverse=True, number_rooms=(3, 3))
+        self.assertEqual(list(found), self.keys(self.places[2:0:-1]))
+        found = self.file_storage_obj.find_sorted(
+            Place, "latitude", price_by_night=(80, 80))
+        self.assertEqual(list(found), self.keys(self.places[3::-3]))
+
+    def test_update_with_console(self):
+        """Check that the order follows updates made in the console."""
+        from console import HBNBCommand
+        console = HBNBCommand()
+        place = self.places[2]
+        console.onecmd(f"update Place {place.id} price_by_night 10")
+        self.assertEqual(place.price_by_night, 10)
+        console.onecmd(f'Place.update("{place.id}", '
+                       '{"price_by_night": 200.7, "number_rooms": "4"})')
+        found = self.file_storage_obj.find_sorted(Place, "price_by_night",
+                                                  reverse=True)
+        self.assertEqual(list(found)[0], self.keys([place])[0])
+        self.assertEqual((place.price_by_night, place.number_rooms),
+                         (200, 4))
+        found = self.file_storage_obj.find_range(Place, number_rooms=(4, 4))
+        self.assertEqual(list(found), self.keys([place]))
+
+    def test_delete_and_reload(self):
+        """Check that the sorted indexes follow delete() and reload()."""
+        self.file_storage_obj.delete(self.places[1])
+        self.file_storage_obj.save()
+        FileStorage._FileStorage__objects.clear()
+        self.file_storage_obj.reload()
+        found = self.file_storage_obj.find_sorted(Place, "price_by_night",
+                                                  price_by_night=(None, 90))
+        self.assertEqual(list(found), sorted(
+            self.keys((self.places[0], self.places[3]))))
+
+
+class TestFileStorageSpatial(BaseCase):
+    """Test near(), within() and the grid behind them."""
+
+    def setUp(self):
+        """Create places in Kampala, Entebbe and Nairobi."""
+        super().setUp()
+        self.places = [Place(), Place(), Place()]
+        for place, (lat, lon) in zip(self.places, ((0.3476, 32.5825),
+                                                   (0.0512, 32.4637),
+                                                   (-1.2921, 36.8219))):
+            place.latitude = lat
+            place.longitude = lon
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def keys(self, places):
+        """Returns the keys of places."""
+        return [f"Place.{place.id}" for place in places]
+
+    def test_near(self):
+        """Check that near() gives the places in the circle in order."""
+        found = self.file_storage_obj.near(Place, 0.0512, 32.4637, 50)
+        self.assertEqual(list(found), self.keys(self.places[1::-1]))
+        found = self.file_storage_obj.near("Place", -1, 36, 1000)
+        self.assertEqual(list(found), self.keys([self.places[2],
+                                                 *self.places[:2]]))
+
+    def test_within(self):
+        """Check that within() gives the places in the box."""
+        found = self.file_storage_obj.within(Place, (-2, 33, 0, 37))
+        self.assertEqual(list(found), self.keys(self.places[2:]))
+        with self.assertRaises(ValueError):
+            self.file_storage_obj.within(Place, (1, 0, 0, 0))
+
+    def test_update_and_delete(self):
+        """Check that the grid follows updates and delete()."""
+        self.places[2].latitude = 0.3
+        self.places[2].longitude = 32.6
+        self.file_storage_obj.delete(self.places[0])
+        found = self.file_storage_obj.near(Place, 0.3476, 32.5825, 10)
+        self.assertEqual(list(found), self.keys(self.places[2:]))
+
+    def test_reload(self):
+        """Check that the grid is rebuilt by reload()."""
+        self.file_storage_obj.save()
+        FileStorage._FileStorage__objects.clear()
+        self.file_storage_obj.reload()
+        found = self.file_storage_obj.within(Place, (-1, 32, 1, 33))
+        self.assertEqual(sorted(found), sorted(self.keys(self.places[:2])))
+
+    def test_not_indexed_class(self):
+        """Check that a class without grid is measured object by object."""
+        user = User()
+        user.latitude = 0.35
+        user.longitude = 32.58
+        found = self.file_storage_obj.near(User, 0.3476, 32.5825, 5)
+        self.assertEqual(list(found.values()), [user])
+        found = self.file_storage_obj.within(User, (0, 32, 1, 33))
+        self.assertEqual(list(found.values()), [user])
+
+
+class TestFileStorageQuery(BaseCase):
+    """Test query() and its planner on the storage indexes."""
+
+    def setUp(self):
+        """Create six places in two cities."""
+        super().setUp()
+        self.cities = [City(), City()]
+        self.places = [Place() for _ in range(6)]
+        for i, place in enumerate(self.places):
+            place.city_id = self.cities[i % 2].id
+            place.price_by_night = 10 * (6 - i)
+            place.number_rooms = i % 3
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def keys(self, places):
+        """Returns the keys of places."""
+        return [f"Place.{place.id}" for place in places]
+
+    def test_query(self):
+        """Check the results of conditions, order and limit."""
+        query = self.file_storage_obj.query(Place).where(
+            city_id=self.cities[0].id, price_by_night__lt=60)
+        self.assertEqual(sorted(query.all()),
+                         sorted(self.keys(self.places[2::2])))
+        ordered = query.order_by("price_by_night")
+        self.assertEqual(list(ordered), self.places[4:1:-2])
+        ordered = query.order_by("-number_rooms").limit(1)
+        self.assertEqual(list(ordered.all()), self.keys(self.places[2:3]))
+
+    def test_explain(self):
+        """Check that explain() gives the index used and the counts."""
+        plan = self.file_storage_obj.query("Place").where(
+            city_id=self.cities[1].id, number_rooms__gte=1).explain()
+        self.assertEqual(plan, {"class": "Place", "path": "foreign key",
+                                "index": "city_id", "candidates": 3,
+                                "examined": 3, "returned": 2})
+        plan = self.file_storage_obj.query(City).where(name="").explain()
+        self.assertEqual((plan["path"], plan["examined"]), ("scan", 2))
+
+    def test_update_and_delete(self):
+        """Check that queries follow updates and delete()."""
+        query = self.file_storage_obj.query(Place).where(
+            price_by_night__lte=20)
+        self.places[5].price_by_night = 100
+        self.places[0].price_by_night = 5
+        self.file_storage_obj.delete(self.places[4])
+        self.assertEqual(list(query), [self.places[0]])
+
+    def test_float_price(self):
+        """Check that a float among int prices is found on every path."""
+        for i in range(200):
+            Place().price_by_night = 100 + i
+        odd = Place()
+        odd.price_by_night = 49.5
+        storage = self.file_storage_obj
+        scan = sorted(key for key, obj in storage.all(Place).items()
+                      if obj.price_by_night < 50)
+        self.assertIn(f"Place.{odd.id}", scan)
+        query = storage.query(Place).where(price_by_night__lt=50)
+        self.assertEqual(sorted(query.all()), scan)
+        self.assertEqual(query.explain()["path"], "sorted range")
+        self.assertEqual(sorted(storage.find_range(
+            Place, price_by_night=(None, 49.9))), scan)
+        self.assertEqual(len(storage.find_sorted(Place, "price_by_night")),
+                         storage.count(Place))
+        self.assertEqual(storage.aggregate(Place, "price_by_night", "min"),
+                         10)
+
+    def test_errors(self):
+        """Check unknown operators, and a class without objects."""
+        with self.assertRaises(ValueError):
+            self.file_storage_obj.query(Place).where(price__between=(1, 2))
+        self.assertEqual(self.file_storage_obj.query(User).all(), {})
+
+
+class TestFileStorageSearch(BaseCase):
+    """Test search() and the text indexes behind it."""
+
+    def setUp(self):
+        """Create three reviews."""
+        super().setUp()
+        self.reviews = [Review(), Review(), Review()]
+        for review, text in zip(self.reviews, ("Quiet and clean, quiet",
+                                               "clean kitchen",
+                                               "noisy street")):
+            review.text = text
+
+    def tearDown(self):
+        """Clear __objects, rm test_path and its text indexes."""
+        FileStorage._FileStorage__objects.clear()
+        for path in (test_path, test_path + ".text"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def keys(self, reviews):
+        """Returns the keys of reviews."""
+        return [f"Review.{review.id}" for review in reviews]
+
+    def test_search(self):
+        """Check all and any words, best match first, and the limit."""
+        storage = self.file_storage_obj
+        found = storage.search(Review, "clean quiet")
+        self.assertEqual(list(found), self.keys(self.reviews[:1]))
+        found = storage.search("Review", "kitchen QUIET", "any")
+        self.assertEqual(list(found), self.keys(self.reviews[:2]))
+        found = storage.search(Review, "quiet clean", "any", limit=1)
+        self.assertEqual(list(found.values()), self.reviews[:1])
+        with self.assertRaises(ValueError):
+            storage.search(User, "clean")
+
+    def test_update_and_delete(self):
+        """Check that the index follows updates and delete()."""
+        self.reviews[2].text = "clean at last"
+        self.file_storage_obj.delete(self.reviews[0])
+        found = self.file_storage_obj.search(Review, "clean")
+        self.assertEqual(sorted(found), sorted(self.keys(self.reviews[1:])))
+        self.assertEqual(self.file_storage_obj.search(Review, "noisy"), {})
+
+    def test_small_index_not_saved(self):
+        """Check that a small index is not written next to the file."""
+        self.file_storage_obj.search(Review, "clean")
+        self.file_storage_obj.save()
+        self.assertFalse(os.path.exists(test_path + ".text"))
+
+    @patch("models.engine.indexes.TEXT_SAVE_MIN_DOCUMENTS", 1)
+    def test_not_searched(self):
+        """Check that an index not searched yet is not written."""
+        self.file_storage_obj.save()
+        self.assertFalse(os.path.exists(test_path + ".text"))
+
+    @patch("models.engine.indexes.TEXT_SAVE_MIN_DOCUMENTS", 1)
+    def test_reload(self):
+        """
+        Check that reload() restores the saved index, checked by the first
+        search instead of splitting every text.
+        """
+        storage = self.file_storage_obj
+        storage.search(Review, "clean")
+        storage.save()
+        self.assertTrue(os.path.exists(test_path + ".text"))
+        with open(test_path) as fp:
+            records = json.load(fp)
+        records[self.keys(self.reviews[1:2])[0]]["text"] = "quiet garden"
+        del records[self.keys(self.reviews[2:])[0]]
+        with open(test_path, "w") as fp:
+            json.dump(records, fp)
+        FileStorage._FileStorage__objects.clear()
+        with patch("models.engine.indexes.tokens",
+                   wraps=models.engine.indexes.tokens) as split:
+            storage.reload()
+            self.assertEqual(split.call_count, 0)
+            found = storage.search(Review, "quiet", "any")
+        self.assertEqual(split.call_count, 2)
+        self.assertEqual(list(found), self.keys(self.reviews[:2]))
+        self.assertEqual(storage.search(Review, "kitchen noisy", "any"), {})
+
+
+class TestFileStorageShards(BaseCase):
+    """Test the sharded mode of FileStorage."""
+
+    shards = "class"
+
+    def setUp(self):
+        """Save objects of three classes in shards."""
+        self.file_storage_obj = FileStorage(shards=self.shards)
+        patcher = patch.object(models, "storage", self.file_storage_obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.shard_dir = self.file_storage_obj.shard_dir()
+        self.user = User()
+        self.state = State()
+        self.city = City()
+        self.file_storage_obj.save()
+
+    def tearDown(self):
+        """Clear __objects, rm the shards."""
+        FileStorage._FileStorage__objects.clear()
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+
+    def inodes(self):
+        """Returns the inode of every shard file by shard name."""
+        return {shard: os.stat(sharding.shard_path(self.shard_dir,
+                                                   shard)).st_ino
+                for shard in sharding.list_shards(self.shard_dir)}
+
+    def reload_all(self, **kwargs):
+        """Clears __objects and reloads it with a new storage."""
+        FileStorage._FileStorage__objects.clear()
+        storage = FileStorage(shards=self.shards, **kwargs)
+        storage.reload()
+        return storage
+
+    def test_layout(self):
+        """Check that there is one file per class."""
+        self.assertEqual(sharding.list_shards(self.shard_dir),
+                         ["City", "State", "User"])
+        self.assertFalse(os.path.exists(test_path))
+
+    def test_save_rewrites_dirty_shard(self):
+        """Check that only the shard of the dirty object is written."""
+        before = self.inodes()
+        self.state.name = "Kigali"
+        self.state.save()
+        after = self.inodes()
+        self.assertEqual(before["User"], after["User"])
+        self.assertEqual(before["City"], after["City"])
+        records = sharding.read_json(
+            sharding.shard_path(self.shard_dir, "State"))
+        self.assertEqual(records[f"State.{self.state.id}"]["name"],
+                         "Kigali")
+
+    def test_delete_last_object(self):
+        """Check that the shard of a class without objects is removed."""
+        self.file_storage_obj.delete(self.city)
+        self.file_storage_obj.save()
+        self.assertNotIn("City", sharding.list_shards(self.shard_dir))
+
+    def test_reload(self):
+        """Check that reload() reads every shard back."""
+        storage = self.reload_all()
+        self.assertEqual(storage.count(), 3)
+        self.assertEqual(storage.get(User, self.user.id).to_dict(),
+                         self.user.to_dict())
+
+    def test_lazy_reload_skips_shards(self):
+        """Check that a lazy reload only reads the shards asked for."""
+        storage = self.reload_all(lazy=True)
+        self.assertEqual(len(FileStorage._FileStorage__objects), 0)
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(list(FileStorage._FileStorage__objects),
+                         [f"State.{self.state.id}"])
+
+    def test_unread_shard_kept_on_save(self):
+        """Check that saving a class never read keeps its objects."""
+        storage = self.reload_all(lazy=True)
+        with patch.object(models, "storage", storage):
+            User()
+            storage.save()
+        storage = self.reload_all()
+        self.assertEqual(storage.count(User), 2)
+
+    def test_layout_mismatch(self):
+        """Check that reload() refuses shards of another layout."""
+        with self.assertRaises(ValueError):
+            FileStorage(shards=4).reload()
+
+
+class TestFileStorageBuckets(TestFileStorageShards):
+    """Test the sharded mode of FileStorage with hash buckets."""
+
+    shards = 4
+
+    def test_layout(self):
+        """Check that the shards are hash buckets."""
+        for shard in sharding.list_shards(self.shard_dir):
+            self.assertRegex(shard, r"^bucket-000[0-3]$")
+
+    def test_save_rewrites_dirty_shard(self):
+        """Check that only the bucket of the dirty object is written."""
+        before = self.inodes()
+        self.state.name = "Kigali"
+        self.state.save()
+        after = self.inodes()
+        dirty = sharding.shard_of(f"State.{self.state.id}", 4)
+        for shard in before:
+            if shard != dirty:
+                self.assertEqual(before[shard], after[shard])
+
+    def test_delete_last_object(self):
+        """Check that deleting every object removes every bucket."""
+        for obj in (self.user, self.state, self.city):
+            self.file_storage_obj.delete(obj)
+        self.file_storage_obj.save()
+        self.assertEqual(sharding.list_shards(self.shard_dir), [])
+
+    def test_lazy_reload_skips_shards(self):
+        """Check that buckets are all read, as they mix classes."""
+        storage = self.reload_all(lazy=True)
+        self.assertEqual(len(FileStorage._FileStorage__objects), 3)
+
+    def test_layout_mismatch(self):
+        """Check that reload() refuses shards of another layout."""
+        with self.assertRaises(ValueError):
+            FileStorage(shards="class").reload()
+
+
+class TestFileStorageFlushPolicy(BaseCase):
+    """Test the flush policies of save()."""
+
+    def make_storage(self, flush, **kwargs):
+        """Create a FileStorage with the flush policy flush."""
+        storage = FileStorage(flush=flush, **kwargs)
+        self.addCleanup(atexit_unregister, storage)
+        return storage
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def saved_keys(self):
+        """Returns the keys in test_path, None without file."""
+        if not os.path.exists(test_path):
+            return None
+        with open(test_path, 'r') as fp:
+            return sorted(json.load(fp))
+
+    def test_immediate(self):
+        """Check that every save writes, synced or not."""
+        for fsync in (False, True):
+            storage = self.make_storage("immediate", fsync=fsync)
+            obj = User()
+            storage.save()
+            self.assertIn(f"User.{obj.id}", self.saved_keys())
+            self.assertFalse(os.path.exists(test_path + ".tmp"))
+
+    def test_count(self):
+        """Check that only every Nth save writes."""
+        storage = self.make_storage("count:3")
+        for i in range(2):
+            User()
+            storage.save()
+        self.assertIsNone(self.saved_keys())
+        User()
+        storage.save()
+        self.assertEqual(len(self.saved_keys()), 3)
+
+    def test_interval(self):
+        """Check that saves inside the interval are held back."""
+        storage = self.make_storage("interval:60000")
+        User()
+        storage.save()
+        self.assertEqual(len(self.saved_keys()), 1)
+        User()
+        storage.save()
+        self.assertEqual(len(self.saved_keys()), 1)
+        storage.flush()
+        self.assertEqual(len(self.saved_keys()), 2)
+        self.assertIsNone(storage._FileStorage__timer)
+        storage = self.make_storage("interval:0")
+        User()
+        storage.save()
+        self.assertEqual(len(self.saved_keys()), 3)
+
+    def test_interval_timer(self):
+        """Check that saves held back are written when the interval ends."""
+        storage = self.make_storage("interval:100")
+        User()
+        storage.save()
+        User()
+        storage.save()
+        self.assertEqual(len(self.saved_keys()), 1)
+        storage._FileStorage__timer.join(5)
+        self.assertEqual(len(self.saved_keys()), 2)
+        self.assertEqual(storage.stats()["pending_saves"], 0)
+        self.assertIsNone(storage.flush_error)
+
+    def test_interval_close(self):
+        """Check that close() stops the timer and writes the saves."""
+        storage = self.make_storage("interval:60000")
+        for i in range(2):
+            User()
+            storage.save()
+        timer = storage._FileStorage__timer
+        storage.close()
+        self.assertEqual(len(self.saved_keys()), 2)
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+
+    def test_exit(self):
+        """Check that saves wait for close()."""
+        storage = self.make_storage("exit")
+        for i in range(5):
+            User()
+            storage.save()
+        self.assertIsNone(self.saved_keys())
+        storage.close()
+        self.assertEqual(len(self.saved_keys()), 5)
+
+    def test_close_without_pending(self):
+        """Check that close() writes nothing without pending saves."""
+        self.make_storage("exit").close()
+        self.assertIsNone(self.saved_keys())
+
+    def test_unknown_policy(self):
+        """Check that an unknown or incomplete policy is refused."""
+        for flush in ("sometimes", "count", "count:x", "exit:3"):
+            with self.assertRaises(ValueError):
+                FileStorage(flush=flush)
+
+
+class TestFileStorageWithoutCache(BaseCase):
+    """Test save() without the encoded object cache."""
+
+    def setUp(self):
+        """Create a FileStorage without cache and a few objects."""
+        self.file_storage_obj = FileStorage(cache=False)
+        self.objs = [User(), Place(), Review()]
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def test_every_object_encoded(self):
+        """Check that each save encodes every object."""
+        for i in range(2):
+            self.file_storage_obj.save()
+            counters = self.file_storage_obj.encode_counters()
+            self.assertEqual(counters["last_encoded"], 3)
+            self.assertEqual(counters["last_reused"], 0)
+
+    def test_saved_content(self):
+        """Check that the streamed file holds every object."""
+        self.file_storage_obj.save()
+        with open(test_path, 'r') as fp:
+            dict_from_json = json.load(fp)
+        self.assertEqual(dict_from_json,
+                         {f"{type(obj).__name__}.{obj.id}": obj.to_dict()
+                          for obj in self.objs})
+
+
+class TestFileStorageStats(BaseCase):
+    """Test the statistics of stats()."""
+
+    def setUp(self):
+        """Create a FileStorage and a few objects."""
+        self.file_storage_obj = FileStorage()
+        self.objs = [User(), User(), Place()]
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def delta(self, before, after):
+        """Returns the counters that changed from before to after."""
+        return {name: after[name] - before[name] for name in before
+                if isinstance(before[name], int) and
+                after[name] != before[name]}
+
+    def test_save(self):
+        """Check that a save counts its flush, objects and bytes."""
+        before = self.file_storage_obj.stats()
+        self.file_storage_obj.save()
+        after = self.file_storage_obj.stats()
+        self.assertEqual(self.delta(before, after),
+                         {"saves": 1, "flushes": 1, "objects_encoded": 3,
+                          "bytes_written": os.path.getsize(test_path)})
+        self.assertGreater(after["last_flush_seconds"], 0)
+        self.assertGreaterEqual(after["flush_seconds"],
+                                before["flush_seconds"] +
+                                after["last_flush_seconds"])
+
+    def test_reload(self):
+        """Check that a reload counts its objects and bytes."""
+        self.file_storage_obj.save()
+        before = self.file_storage_obj.stats()
+        self.file_storage_obj.reload()
+        after = self.file_storage_obj.stats()
+        self.assertEqual(self.delta(before, after),
+                         {"reloads": 1, "objects_read": 3,
+                          "bytes_read": os.path.getsize(test_path)})
+        self.assertGreater(after["last_reload_seconds"], 0)
+
+    def test_objects_by_class(self):
+        """Check the number of objects in all and by class."""
+        stats = self.file_storage_obj.stats()
+        self.assertEqual(stats["objects"], 3)
+        self.assertEqual(stats["classes"], {"User": 2, "Place": 1})
+        self.file_storage_obj.delete(self.objs[2])
+        self.assertEqual(self.file_storage_obj.stats()["classes"],
+                         {"User": 2})
+
+    def test_pending_saves(self):
+        """Check that the saves held back by the flush policy show."""
+        storage = FileStorage(flush="exit")
+        self.addCleanup(atexit_unregister, storage)
+        storage.save()
+        storage.save()
+        self.assertEqual(storage.stats()["pending_saves"], 2)
+
+    def test_disabled(self):
+        """Check that nothing is collected when stats are off."""
+        before = FileStorage().stats()
+        storage = FileStorage(collect_stats=False)
+        storage.save()
+        storage.reload()
+        self.assertEqual(storage.stats(),
+                         {"pending_saves": 0, "objects": 3,
+                          "classes": {"User": 2, "Place": 1}})
+        self.assertEqual(FileStorage().stats(), before)
+
+
+class TestFileStorageThreaded(BaseCase):
+    """Test the threaded mode and its flusher thread."""
+
+    def setUp(self):
+        """Create a threaded FileStorage used by the models."""
+        self.file_storage_obj = FileStorage(threaded=True)
+        self.addCleanup(self.file_storage_obj.close)
+        patcher = patch.object(models, "storage", self.file_storage_obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def saved_keys(self):
+        """Returns the keys in test_path."""
+        with open(test_path, 'r') as fp:
+            return set(json.load(fp))
+
+    def test_save_does_not_wait_for_disk(self):
+        """Check that save() returns while the file is being written."""
+        storage = self.file_storage_obj
+        obj = User()
+        with storage._FileStorage__write_lock:
+            storage.save()
+            self.assertFalse(os.path.exists(test_path))
+        self.assertTrue(storage.wait(5))
+        self.assertEqual(self.saved_keys(), {f"User.{obj.id}"})
+
+    def test_all_is_copy(self):
+        """Check that all() returns a copy of __objects."""
+        User()
+        objects = self.file_storage_obj.all()
+        self.assertIsNot(objects, FileStorage._FileStorage__objects)
+        User()
+        self.assertEqual(len(objects), 1)
+
+    def test_concurrent_changes(self):
+        """Check saves and reads while other threads change objects."""
+        storage = self.file_storage_obj
+        errors = list()
+
+        def work():
+            try:
+                for i in range(200):
+                    obj = random.choice((User, Place, Review))()
+                    obj.name = str(i)
+                    storage.save()
+                    for value in storage.all().values():
+                        value.to_dict()
+                    if i % 3 == 0:
+                        storage.delete(obj)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        storage.save()
+        self.assertTrue(storage.wait(5))
+        self.assertEqual(self.saved_keys(), set(storage.all()))
+        self.assertEqual(storage.count(), 4 * 133)
+
+    def test_close_writes_pending(self):
+        """Check that close() stops the flusher and writes the saves."""
+        storage = FileStorage(threaded=True, flush="exit")
+        obj = User()
+        storage.save()
+        storage.close()
+        self.assertEqual(self.saved_keys(), {f"User.{obj.id}"})
+        self.assertFalse(storage._FileStorage__flusher.is_alive())
+
+    def test_flush_error(self):
+        """Check that wait() raises the error of the flusher."""
+        storage = self.file_storage_obj
+        os.mkdir(test_path)
+        User()
+        storage.save()
+        with self.assertRaises(OSError):
+            storage.wait(5)
+        os.rmdir(test_path)
+        self.assertTrue(storage.wait(5))
+
+    def test_no_journal_or_shards(self):
+        """Check that threaded mode only writes a single file."""
+        for kwargs in ({"journal": True}, {"shards": "class"}):
+            with self.assertRaises(ValueError):
+                FileStorage(threaded=True, **kwargs)
+
+
+class TestFileStorageMultiprocess(BaseCase):
+    """Test the locking and merging of the multiprocess mode."""
+
+    def setUp(self):
+        """Create a multiprocess FileStorage holding a saved user."""
+        self.file_storage_obj = FileStorage(multiprocess=True)
+        patcher = patch.object(models, "storage", self.file_storage_obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User()
+        self.user.save()
+        self.key = f"User.{self.user.id}"
+
+    def tearDown(self):
+        """Clear __objects, rm test_path and its lock."""
+        FileStorage._FileStorage__objects.clear()
+        for path in (test_path, test_path + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def other_process(self, change):
+        """Rewrites test_path with change applied to its records."""
+        with open(test_path, 'r') as fp:
+            records = json.load(fp)
+        change(records)
+        with open(test_path + ".tmp", 'w') as fp:
+            json.dump(records, fp)
+        os.replace(test_path + ".tmp", test_path)
+
+    def saved(self):
+        """Returns the records in test_path."""
+        with open(test_path, 'r') as fp:
+            return json.load(fp)
+
+    def counter(self, name):
+        """Returns the statistic name."""
+        return self.file_storage_obj.stats()[name]
+
+    def test_merge_new_records(self):
+        """Check that records added by another process are kept."""
+        record = {"id": "other", "created_at": "2024-01-01T00:00:00",
+                  "updated_at": "2024-01-01T00:00:00", "__class__": "State"}
+        self.other_process(lambda records: records.update(
+            {"State.other": record}))
+        place = Place()
+        place.save()
+        self.assertEqual(set(self.saved()),
+                         {self.key, "State.other", f"Place.{place.id}"})
+        self.assertEqual(self.file_storage_obj.get(State, "other").to_dict(),
+                         record)
+
+    def test_only_changed_records_loaded(self):
+        """Check that the records unchanged on disk are not loaded."""
+        users = [User() for i in range(3)]
+        self.file_storage_obj.save()
+        merged = self.counter("merged_records")
+
+        def rename(records):
+            record = records[f"User.{users[0].id}"]
+            record["name"] = "other"
+            record["updated_at"] = "2999-01-01T00:00:00"
+        self.other_process(rename)
+        Place().save()
+        self.assertEqual(self.counter("merged_records"), merged + 1)
+        self.assertEqual(
+            self.file_storage_obj.get(User, users[0].id).name, "other")
+        for user in users[1:]:
+            self.assertIs(self.file_storage_obj.get(User, user.id), user)
+
+    def test_conflict_latest_wins(self):
+        """Check that the latest of two changes of a record is kept."""
+        for theirs, winner in (("2999-01-01T00:00:00", "theirs"),
+                               ("2000-01-01T00:00:00", "ours")):
+            def rename(records):
+                records[self.key]["name"] = "theirs"
+                records[self.key]["updated_at"] = theirs
+            self.other_process(rename)
+            user = self.file_storage_obj.get(User, self.user.id)
+            user.name = "ours"
+            conflicts = self.counter("merge_conflicts")
+            user.save()
+            self.assertEqual(self.counter("merge_conflicts"), conflicts + 1)
+            self.assertEqual(self.saved()[self.key]["name"], winner)
+            self.assertEqual(
+                self.file_storage_obj.get(User, self.user.id).name, winner)
+
+    def test_deleted_by_other_process(self):
+        """Check that a record deleted by another process is dropped."""
+        self.other_process(lambda records: records.pop(self.key))
+        Place().save()
+        self.assertNotIn(self.key, self.saved())
+        self.assertIsNone(self.file_storage_obj.get(User, self.user.id))
+
+    def test_deletion_wins(self):
+        """Check that a deletion wins over a change elsewhere."""
+        def rename(records):
+            records[self.key]["updated_at"] = "2999-01-01T00:00:00"
+        self.other_process(rename)
+        self.file_storage_obj.delete(self.user)
+        self.file_storage_obj.save()
+        self.assertNotIn(self.key, self.saved())
+        self.assertIsNone(self.file_storage_obj.get(User, self.user.id))
+
+    def test_deletion_elsewhere_wins(self):
+        """Check that a deletion elsewhere wins over a change here."""
+        self.other_process(lambda records: records.pop(self.key))
+        self.user.name = "changed"
+        conflicts = self.counter("merge_conflicts")
+        self.user.save()
+        self.assertEqual(self.counter("merge_conflicts"), conflicts + 1)
+        self.assertNotIn(self.key, self.saved())
+        self.assertIsNone(self.file_storage_obj.get(User, self.user.id))
+        Place().save()
+        self.assertNotIn(self.key, self.saved())
+
+    def test_save_waits_for_lock(self):
+        """Check that another process saves once the lock is released."""
+        code = ("import sys, models\n"
+                "from models.engine.file_storage import FileStorage\n"
+                "FileStorage._FileStorage__file_path = sys.argv[1]\n"
+                "models.storage.reload()\n"
+                "print(models.State().id)\n"
+                "models.storage.save()\n")
+        root = os.path.dirname(os.path.abspath(models.__path__[0]))
+        env = dict(os.environ, HBNB_STORAGE_MULTIPROCESS="1",
+                   PYTHONPATH=root)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(test_path + ".lock", 'a') as fp:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+                other = subprocess.Popen(
+                    [sys.executable, "-c", code, os.path.abspath(test_path)],
+                    cwd=directory, env=env, stdout=subprocess.PIPE,
+                    text=True)
+                time.sleep(0.5)
+                self.assertIsNone(other.poll())
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            state_id = other.communicate(timeout=30)[0].strip()
+        self.assertEqual(other.returncode, 0)
+        place = Place()
+        place.save()
+        self.assertEqual(set(self.saved()), {self.key, f"State.{state_id}",
+                                             f"Place.{place.id}"})
+        self.assertIsNotNone(self.file_storage_obj.get(State, state_id))
+
+    def test_refused_modes(self):
+        """Check that multiprocess mode only writes a single file."""
+        for kwargs in ({"journal": True}, {"shards": "class"},
+                       {"threaded": True}):
+            with self.assertRaises(ValueError):
+                FileStorage(multiprocess=True, **kwargs)
+
+
+class TestFileStorageAsync(unittest.IsolatedAsyncioTestCase):
+    """Test asave(), areload() and aall()."""
+
+    def setUp(self):
+        """
+        Save __objects and __file_path
+        Create a FileStorage used by the models
+        """
+        self.memory__objects = FileStorage._FileStorage__objects.copy()
+        FileStorage._FileStorage__objects.clear()
+        self.memory__file_path = FileStorage._FileStorage__file_path
+        FileStorage._FileStorage__file_path = test_path
+        self.file_storage_obj = FileStorage()
+        patcher = patch.object(models, "storage", self.file_storage_obj)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Restore __objects and __file_path, rm test_path."""
+        FileStorage._FileStorage__file_path = self.memory__file_path
+        FileStorage._FileStorage__objects = self.memory__objects
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def saved_keys(self):
+        """Returns the keys in test_path."""
+        with open(test_path, 'r') as fp:
+            return set(json.load(fp))
+
+    async def test_asave(self):
+        """Check that the objects are written when asave() returns."""
+        objs = [User(), Place()]
+        await self.file_storage_obj.asave()
+        self.assertEqual(self.saved_keys(),
+                         {f"{type(obj).__name__}.{obj.id}" for obj in objs})
+
+    async def test_base_model_asave(self):
+        """Check that BaseModel.asave() updates and writes the object."""
+        obj = User()
+        updated_at = obj.updated_at
+        await obj.asave()
+        self.assertGreater(obj.updated_at, updated_at)
+        with open(test_path, 'r') as fp:
+            record = json.load(fp)[f"User.{obj.id}"]
+        self.assertEqual(record["updated_at"], obj.updated_at.isoformat())
+
+    async def test_saves_coalesced(self):
+        """Check that saves made during a write share the next write."""
+        storage = self.file_storage_obj
+        flushes = storage.stats()["flushes"]
+        objs = list()
+
+        async def create_and_save():
+            objs.append(User())
+            await storage.asave()
+        await asyncio.gather(*(create_and_save() for i in range(20)))
+        self.assertLessEqual(storage.stats()["flushes"] - flushes, 2)
+        self.assertEqual(self.saved_keys(),
+                         {f"User.{obj.id}" for obj in objs})
+
+    async def test_areload_aall(self):
+        """Check that areload() reads back what asave() wrote."""
+        obj = User()
+        await self.file_storage_obj.asave()
+        FileStorage._FileStorage__objects.clear()
+        await self.file_storage_obj.areload()
+        objects = await self.file_storage_obj.aall()
+        self.assertEqual(list(objects), [f"User.{obj.id}"])
+        self.assertIsNot(objects, FileStorage._FileStorage__objects)
+        self.assertEqual(await self.file_storage_obj.aall("Place"), {})
+
+    async def test_loop_responsive(self):
+        """Check that the event loop keeps running during a large save."""
+        storage = FileStorage(cache=False)
+        for i in range(20000):
+            Review().text = "x" * 100
+        gaps = list()
+        saving = True
+
+        async def tick():
+            last = time.perf_counter()
+            while saving:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        await storage.asave()
+        duration = time.perf_counter() - start
+        saving = False
+        await ticker
+        self.assertEqual(len(self.saved_keys()), 20000)
+        self.assertGreater(len(gaps), 5)
+        self.assertLess(max(gaps), duration / 2)
+
+    async def test_updates_responsive(self):
+        """Check that objects are created and changed during a large save."""
+        storage = FileStorage(cache=False)
+        for i in range(20000):
+            Review().text = "x" * 100
+        changed = Review()
+        waits = list()
+        created = list()
+        saving = True
+
+        async def update():
+            while saving:
+                await asyncio.sleep(0.001)
+                start = time.perf_counter()
+                created.append(User())
+                changed.text = str(len(created))
+                waits.append(time.perf_counter() - start)
+        updater = asyncio.create_task(update())
+        start = time.perf_counter()
+        await storage.asave()
+        duration = time.perf_counter() - start
+        saving = False
+        await updater
+        self.assertGreater(len(waits), 5)
+        self.assertLess(max(waits), duration / 2)
+        await storage.asave()
+        self.assertLessEqual({f"User.{obj.id}" for obj in created},
+                             self.saved_keys())
+        with open(test_path, 'r') as fp:
+            record = json.load(fp)[f"Review.{changed.id}"]
+        self.assertEqual(record["text"], changed.text)
+
+    async def test_all_unchanged(self):
+        """Check that all() still returns __objects after asave()."""
+        User()
+        await self.file_storage_obj.asave()
+        self.assertIs(self.file_storage_obj.all(),
+                      FileStorage._FileStorage__objects)
+
+
+class TestFileStorageParallelReload(BaseCase):
+    """Test reload() with worker processes."""
+
+    def setUp(self):
+        """Save objects of every class."""
+        patcher = patch.object(parallel, "MIN_BYTES", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for i in range(50):
+            for _class in (User, State, City, Amenity, Review):
+                _class().name = str(i)
+            Place().city_id = f"city-{i % 5}"
+        FileStorage().save()
+        self.saved = {key: obj.to_dict() for key, obj
+                      in FileStorage._FileStorage__objects.items()}
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def reloaded(self, storage):
+        """Returns the records of the objects reloaded by storage."""
+        FileStorage._FileStorage__objects.clear()
+        storage.reload()
+        return {key: obj.to_dict() for key, obj in storage.all().items()}
+
+    def test_same_objects(self):
+        """Check that workers reload the objects a single process does."""
+        storage = FileStorage(workers=3)
+        self.assertEqual(self.reloaded(storage), self.saved)
+        self.assertEqual(list(storage.all()), list(self.saved))
+        self.assertEqual(FileStorage._FileStorage__changes, {})
+
+    def test_indexes(self):
+        """Check that the indexes know the reloaded objects."""
+        storage = FileStorage(workers=2)
+        self.reloaded(storage)
+        self.assertEqual(
+            sorted(storage.find_by("Place", "city_id", "city-0")),
+            sorted(key for key, record in self.saved.items()
+                   if record.get("city_id") == "city-0"))
+
+    def test_journal_replayed(self):
+        """Check that the journal is replayed after a parallel reload."""
+        storage = FileStorage(journal=True, journal_ratio=100, workers=2)
+        with patch.object(models, "storage", storage):
+            obj = User()
+            obj.save()
+        self.assertIn(f"User.{obj.id}", self.reloaded(storage))
+
+    def test_single_line_file(self):
+        """Check that a file not written a record per line is read."""
+        with open(test_path, 'w') as fp:
+            json.dump(self.saved, fp)
+        self.assertEqual(self.reloaded(FileStorage(workers=2)), self.saved)
+
+    def test_indented_file(self):
+        """
+        Check that an indented file is read, even when its first member
+        holds on one line.
+        """
+        with open(test_path, 'w') as fp:
+            json.dump(self.saved, fp, indent=4)
+        self.assertEqual(self.reloaded(FileStorage(workers=2)), self.saved)
+        (first, record), *others = self.saved.items()
+        with open(test_path, 'w') as fp:
+            fp.write("{\n" + json.dumps({first: record})[1:-1] + ",\n" +
+                     json.dumps(dict(others), indent=4)[1:])
+        self.assertTrue(parallel.one_record_per_line(test_path))
+        self.assertEqual(self.reloaded(FileStorage(workers=2)), self.saved)
+
+    def test_refused_modes(self):
+        """Check that parallel reloads are not lazy nor sharded."""
+        for kwargs in ({"lazy": True}, {"shards": "class"}):
+            with self.assertRaises(ValueError):
+                FileStorage(workers=2, **kwargs)
+
+
+class TestFileStorageCompression(BaseCase):
+    """Test the compressed files of FileStorage."""
+
+    magics = {"gzip": b"\x1f\x8b", "lzma": b"\xfd7zXZ\x00", "zlib": b"\x78"}
+
+    def setUp(self):
+        """Create objects of every class."""
+        for i in range(20):
+            for _class in (User, State, City, Amenity, Place, Review):
+                _class().name = str(i)
+        self.saved = {key: obj.to_dict() for key, obj
+                      in FileStorage._FileStorage__objects.items()}
+        self.paths = [test_path]
+
+    def tearDown(self):
+        """Clear __objects, rm the files written."""
+        FileStorage._FileStorage__objects.clear()
+        FileStorage._FileStorage__file_path = test_path
+        for path in self.paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def use_path(self, path):
+        """Makes the storage write to path."""
+        FileStorage._FileStorage__file_path = path
+        self.paths.append(path)
+
+    def head(self, path):
+        """Returns the first bytes of the file at path."""
+        with open(path, 'rb') as fp:
+            return fp.read(6)
+
+    def reloaded(self, **kwargs):
+        """Returns the records of the objects reloaded by a new storage."""
+        FileStorage._FileStorage__objects.clear()
+        storage = FileStorage(**kwargs)
+        storage.reload()
+        return {key: obj.to_dict() for key, obj in storage.all().items()}
+
+    def test_extension(self):
+        """Check that the extension of the file chooses the codec."""
+        for extension, codec in ((".gz", "gzip"), (".xz", "lzma"),
+                                 (".zz", "zlib")):
+            path = test_path + extension
+            self.use_path(path)
+            storage = FileStorage()
+            self.assertEqual(storage.codec(), codec)
+            storage.save()
+            self.assertTrue(self.head(path).startswith(self.magics[codec]))
+            self.assertEqual(self.reloaded(), self.saved)
+
+    def test_setting(self):
+        """Check that the compression setting wins over the extension."""
+        FileStorage(compression="lzma", compression_level=1).save()
+        self.assertTrue(self.head(test_path).startswith(self.magics["lzma"]))
+        self.use_path(test_path + ".gz")
+        FileStorage(compression="none").save()
+        self.assertTrue(self.head(test_path + ".gz").startswith(b"{"))
+
+    def test_detected_on_reload(self):
+        """Check that reloads read plain and compressed files alike."""
+        FileStorage(compression="zlib").save()
+        self.assertEqual(self.reloaded(compression="none"), self.saved)
+        FileStorage(compression="none").save()
+        self.assertEqual(self.reloaded(compression="gzip"), self.saved)
+
+    def test_journal(self):
+        """Check that the snapshot is compressed, not the journal."""
+        storage = FileStorage(journal=True, journal_ratio=100,
+                              compression="gzip")
+        storage.compact()
+        with patch.object(models, "storage", storage):
+            obj = User()
+            obj.save()
+        self.paths.append(storage.journal_path())
+        self.assertTrue(self.head(test_path).startswith(self.magics["gzip"]))
+        self.assertTrue(self.head(storage.journal_path()).startswith(b"{"))
+        self.assertIn(f"User.{obj.id}", self.reloaded(journal=True))
+
+    def test_shards(self):
+        """Check that the shards are compressed too."""
+        storage = FileStorage(shards="class", compression="zlib")
+        self.paths.append(storage.shard_dir())
+        storage.save()
+        path = sharding.shard_path(storage.shard_dir(), "User")
+        self.assertTrue(self.head(path).startswith(self.magics["zlib"]))
+        self.assertEqual(self.reloaded(shards="class"), self.saved)
+
+    def test_parallel_reload(self):
+        """Check that a compressed file is read by a single process."""
+        FileStorage(compression="gzip").save()
+        with patch.object(parallel, "MIN_BYTES", 0), \
+                patch.object(parallel, "load") as load:
+            self.assertEqual(self.reloaded(workers=2), self.saved)
+        load.assert_not_called()
+
+    def test_stats(self):
+        """Check that the bytes written are the compressed bytes."""
+        storage = FileStorage(compression="gzip")
+        before = storage.stats()["bytes_written"]
+        storage.save()
+        self.assertEqual(storage.stats()["bytes_written"] - before,
+                         os.path.getsize(test_path))
+
+    def test_unknown_compression(self):
+        """Check that an unknown codec is refused."""
+        with self.assertRaises(ValueError):
+            FileStorage(compression="zip")
+
+
+class TestFileStorageBinary(BaseCase):
+    """Test the binary snapshots of FileStorage."""
+
+    def setUp(self):
+        """Save objects of every class in a binary snapshot."""
+        self.storage = FileStorage(snapshot_format="binary")
+        for i in range(20):
+            for _class in (User, State, City, Amenity, Review):
+                _class().name = str(i)
+            place = Place()
+            place.number_rooms = i
+            place.latitude = i / 3
+            place.amenity_ids = [str(i), "shared"]
+        self.storage.save()
+        self.saved = {key: obj.to_dict() for key, obj
+                      in FileStorage._FileStorage__objects.items()}
+
+    def tearDown(self):
+        """Clear __objects, rm test_path and the journal."""
+        FileStorage._FileStorage__objects.clear()
+        for path in (test_path, test_path + ".journal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def reloaded(self, **kwargs):
+        """Returns the records of the objects reloaded by a new storage."""
+        FileStorage._FileStorage__objects.clear()
+        storage = FileStorage(**kwargs)
+        storage.reload()
+        return {key: obj.to_dict() for key, obj in storage.all().items()}
+
+    def test_format(self):
+        """Check that the file is a binary snapshot."""
+        with open(test_path, 'rb') as fp:
+            self.assertEqual(fp.read(len(binary.MAGIC)), binary.MAGIC)
+
+    def test_reload(self):
+        """Check that every storage mode reloads the same objects."""
+        for kwargs in ({}, {"snapshot_format": "binary"}, {"lazy": True},
+                       {"workers": 2}):
+            with self.subTest(**kwargs):
+                self.assertEqual(self.reloaded(**kwargs), self.saved)
+
+    def test_datetimes(self):
+        """Check that reloaded objects get datetimes."""
+        self.reloaded()
+        for obj in FileStorage._FileStorage__objects.values():
+            self.assertIs(type(obj.created_at), datetime.datetime)
+            self.assertIs(type(obj.updated_at), datetime.datetime)
+
+    def test_iso_string(self):
+        """Check that a string holding a datetime reloads as a string."""
+        place = Place()
+        place.name = "2024-01-01T00:00:00"
+        self.storage.save()
+        for kwargs in ({}, {"lazy": True}):
+            with self.subTest(**kwargs):
+                record = self.reloaded(**kwargs)[f"Place.{place.id}"]
+                self.assertEqual(record["name"], "2024-01-01T00:00:00")
+                json.dumps(record)
+        # lazy records are written back, then reloaded eagerly
+        self.reloaded(lazy=True, snapshot_format="binary")
+        FileStorage(lazy=True, snapshot_format="binary").compact()
+        self.assertEqual(self.reloaded()[f"Place.{place.id}"]["name"],
+                         "2024-01-01T00:00:00")
+        self.test_datetimes()
+
+    def test_json_round_trip(self):
+        """Check that a JSON storage reads and rewrites the snapshot."""
+        self.reloaded()
+        FileStorage().compact()
+        with open(test_path, 'r') as fp:
+            self.assertEqual(json.load(fp), self.saved)
+        self.assertEqual(self.reloaded(snapshot_format="binary"),
+                         self.saved)
+
+    def test_dirty_save(self):
+        """Check that a later save writes the changed objects."""
+        with patch.object(models, "storage", self.storage):
+            obj = User()
+            obj.first_name = "Betty"
+            obj.save()
+        self.assertEqual(self.reloaded()[f"User.{obj.id}"]["first_name"],
+                         "Betty")
+
+    def test_journal(self):
+        """Check that a binary snapshot has a JSON journal."""
+        storage = FileStorage(journal=True, journal_ratio=100,
+                              snapshot_format="binary")
+        with patch.object(models, "storage", storage):
+            obj = State()
+            obj.save()
+        with open(storage.journal_path(), 'r') as fp:
+            self.assertIn(obj.id, fp.read())
+        self.assertIn(f"State.{obj.id}", self.reloaded(journal=True))
+
+    def test_compressed(self):
+        """Check that a binary snapshot can be compressed."""
+        FileStorage(snapshot_format="binary", compression="gzip").compact()
+        with open(test_path, 'rb') as fp:
+            self.assertEqual(fp.read(2), b"\x1f\x8b")
+        self.assertEqual(self.reloaded(), self.saved)
+
+    def test_stats(self):
+        """Check that a binary save counts its objects and bytes."""
+        before = self.storage.stats()
+        self.storage.compact()
+        after = self.storage.stats()
+        self.assertEqual(after["objects_encoded"] - before["objects_encoded"],
+                         len(self.saved))
+        self.assertEqual(after["bytes_written"] - before["bytes_written"],
+                         os.path.getsize(test_path))
+
+    def test_refused(self):
+        """Check that unknown formats and binary shards are refused."""
+        with self.assertRaises(ValueError):
+            FileStorage(snapshot_format="pickle")
+        with self.assertRaises(ValueError):
+            FileStorage(snapshot_format="binary", shards="class")
+
+
+class TestFileStorageInterning(BaseCase):
+    """Test the strings shared by reloaded objects."""
+
+    def setUp(self):
+        """Save a city and places pointing to it."""
+        self.city = City()
+        self.city.name = "Kampala"
+        for _ in range(3):
+            Place().city_id = self.city.id
+        FileStorage().save()
+
+    def tearDown(self):
+        """Clear __objects, rm test_path."""
+        FileStorage._FileStorage__objects.clear()
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def test_shared(self):
+        """Check that every reload shares the ids between objects."""
+        with patch.object(parallel, "MIN_BYTES", 0):
+            for kwargs in ({}, {"lazy": True}, {"workers": 2}):
+                with self.subTest(**kwargs):
+                    FileStorage._FileStorage__objects.clear()
+                    storage = FileStorage(**kwargs)
+                    storage.reload()
+                    city = storage.all(City)[f"City.{self.city.id}"]
+                    places = storage.all(Place).values()
+                    for place in places:
+                        self.assertIs(place.city_id, city.id)
+                    self.assertIs(city.name, sys.intern("Kampala"))
@@ -0,0 +1,497 @@
+#!/usr/bin/python3
+"""Contains tests for the indexes.py file."""
+
+import unittest
+from unittest.mock import patch
+from models.engine import indexes
+from models.engine.indexes import FOREIGN_KEYS, ForeignKeyIndex
+from models.engine.indexes import field_value, foreign_key_indexes
+from models.engine.indexes import ColumnIndex, NUMERIC_FIELDS
+from models.engine.indexes import aggregate_values, in_ranges
+from models.engine.indexes import numeric_value, storage_indexes
+from models.engine.indexes import GridIndex, bbox_around, check_bbox
+from models.engine.indexes import distance_km, in_bbox, position
+from models.engine.indexes import SortedIndex, intersect
+from models.engine.indexes import TextIndex, rank, tokens
+
+
+class Record:
+    """Stands for a model instance."""
+
+    def __init__(self, **kwargs):
+        """Set the attributes."""
+        self.__dict__.update(kwargs)
+
+
+class TestFieldValue(unittest.TestCase):
+    """Test the field_value() function."""
+
+    def test_instance(self):
+        """Check that the field of an instance is read."""
+        self.assertEqual(field_value(Record(state_id="s1"), "state_id"),
+                         "s1")
+
+    def test_record(self):
+        """Check that the field of a raw record is read."""
+        self.assertEqual(field_value({"state_id": "s1"}, "state_id"), "s1")
+
+    def test_missing(self):
+        """Check that a missing field gives None."""
+        self.assertIsNone(field_value(Record(), "state_id"))
+        self.assertIsNone(field_value({}, "state_id"))
+
+    def test_record_default(self):
+        """Check that a field missing from a record gives its default."""
+        record = {"__class__": "Place"}
+        self.assertEqual(field_value(record, "number_rooms"), 0)
+        self.assertEqual(field_value(record, "name"), "")
+        self.assertIsNone(field_value(record, "unknown"))
+
+
+class TestForeignKeyIndex(unittest.TestCase):
+    """Test the ForeignKeyIndex class."""
+
+    def setUp(self):
+        """Index three cities of two states."""
+        self.index = ForeignKeyIndex("City", "state_id")
+        self.index.add("City.1", Record(state_id="s1"))
+        self.index.add("City.2", {"state_id": "s1"})
+        self.index.add("City.3", Record(state_id="s2"))
+
+    def test_lookup(self):
+        """Check that lookup() gives the keys with the value."""
+        self.assertEqual(list(self.index.lookup("s1")), ["City.1", "City.2"])
+        self.assertEqual(list(self.index.lookup("s3")), [])
+
+    def test_discard(self):
+        """Check that discard() removes a key and empty values."""
+        self.index.discard("City.3")
+        self.index.discard("City.4")
+        self.assertEqual(list(self.index.lookup("s2")), [])
+        self.assertNotIn("s2", self.index.keys)
+
+    def test_empty_value_not_indexed(self):
+        """Check that empty or non string values are not indexed."""
+        self.index.add("City.4", Record(state_id=""))
+        self.index.add("City.5", Record(state_id=["s1"]))
+        self.assertNotIn("City.4", self.index.values)
+        self.assertNotIn("City.5", self.index.values)
+
+    def test_clear(self):
+        """Check that clear() empties the index."""
+        self.index.clear()
+        self.assertEqual(self.index.keys, {})
+        self.assertEqual(self.index.values, {})
+
+    def test_foreign_key_indexes(self):
+        """Check that every foreign key gets an index."""
+        indexes = foreign_key_indexes()
+        for class_name, fields in FOREIGN_KEYS.items():
+            self.assertEqual([index.field for index in indexes[class_name]],
+                             list(fields))
+
+
+class TestNumericValue(unittest.TestCase):
+    """Test the numeric_value(), in_ranges() and aggregate_values()."""
+
+    def test_numeric_value(self):
+        """Check which values each column type holds."""
+        self.assertEqual(numeric_value(3, "q"), 3)
+        self.assertEqual(numeric_value(3, "d"), 3)
+        self.assertEqual(numeric_value(2.5, "d"), 2.5)
+        for value in (2.5, True, "3", None, 2 ** 63):
+            self.assertIsNone(numeric_value(value, "q"))
+        for value in (float("nan"), False, "3.0", [1]):
+            self.assertIsNone(numeric_value(value, "d"))
+
+    def test_in_ranges(self):
+        """Check inclusive and open bounds."""
+        record = Record(price_by_night=50, latitude=1.5, name="x")
+        self.assertTrue(in_ranges(record, {"price_by_night": (50, 50)}))
+        self.assertTrue(in_ranges(record, {"price_by_night": (None, 60),
+                                           "latitude": (1, None)}))
+        self.assertFalse(in_ranges(record, {"price_by_night": (51, None)}))
+        self.assertFalse(in_ranges(record, {"name": (None, None)}))
+        self.assertFalse(in_ranges(record, {"missing": (None, None)}))
+
+    def test_aggregate_values(self):
+        """Check every aggregate, with and without values."""
+        values = [3, 1, 2]
+        self.assertEqual([aggregate_values(values, function)
+                          for function in indexes.AGGREGATES],
+                         [3, 6, 1, 3, 2.0])
+        self.assertEqual([aggregate_values([], function)
+                          for function in indexes.AGGREGATES],
+                         [0, 0, None, None, None])
+        with self.assertRaises(ValueError):
+            aggregate_values(values, "median")
+
+
+class TestColumnIndex(unittest.TestCase):
+    """Test the ColumnIndex class, with the array module."""
+
+    numpy = None
+
+    def setUp(self):
+        """Index four places, one of them without numbers."""
+        patcher = patch.object(indexes, "numpy", self.numpy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = ColumnIndex("Place", NUMERIC_FIELDS["Place"])
+        self.index.add("Place.1", Record(price_by_night=50, number_rooms=1,
+                                         latitude=0.5))
+        self.index.add("Place.2", {"price_by_night": 120, "number_rooms": 3,
+                                   "latitude": -10.25})
+        self.index.add("Place.3", Record(price_by_night=80, number_rooms=4,
+                                         latitude=2))
+        self.index.add("Place.4", Record(price_by_night="cheap"))
+
+    def select(self, **ranges):
+        """Returns the sorted keys selected by ranges."""
+        return sorted(self.index.select(ranges))
+
+    def test_typecodes(self):
+        """Check that int fields get integer columns."""
+        self.assertEqual(self.index.columns["price_by_night"].typecode, "q")
+        self.assertEqual(self.index.columns["latitude"].typecode, "d")
+
+    def test_select(self):
+        """Check range predicates, alone and together."""
+        self.assertEqual(self.select(price_by_night=(50, 120),
+                                     number_rooms=(3, None)),
+                         ["Place.2", "Place.3"])
+        self.assertEqual(self.select(latitude=(None, 1)),
+                         ["Place.1", "Place.2"])
+        self.assertEqual(self.select(price_by_night=(200, None)), [])
+
+    def test_select_everything(self):
+        """Check that no range selects every key."""
+        self.assertEqual(self.select(), ["Place.1", "Place.2", "Place.3",
+                                         "Place.4"])
+
+    def test_not_a_number(self):
+        """Check that a row without a number never matches its field."""
+        self.index.add("Place.5", Record(price_by_night=True,
+                                         latitude=float("nan")))
+        self.assertEqual(self.select(latitude=(None, None)),
+                         ["Place.1", "Place.2", "Place.3"])
+        self.assertEqual(self.select(price_by_night=(None, None)),
+                         ["Place.1", "Place.2", "Place.3"])
+        self.assertFalse(self.index.covers("price_by_night"))
+
+    def test_widen(self):
+        """Check that a float or a large integer widens an int column."""
+        self.index.discard("Place.4")
+        self.assertTrue(self.index.covers("price_by_night"))
+        self.index.add("Place.5", Record(price_by_night=49.5))
+        self.index.add("Place.6", Record(price_by_night=2 ** 70))
+        self.assertEqual(self.index.columns["price_by_night"].typecode, "d")
+        self.assertEqual(self.select(price_by_night=(None, 50)),
+                         ["Place.1", "Place.5"])
+        self.assertEqual(self.select(price_by_night=(2 ** 69, None)),
+                         ["Place.6"])
+        self.assertEqual(self.index.aggregate("price_by_night", "sum",
+                                              {"price_by_night": (0, 100)}),
+                         179.5)
+        self.assertTrue(self.index.covers("price_by_night"))
+        self.index.add("Place.7", Record(price_by_night=60))
+        self.assertEqual(self.select(price_by_night=(55, 65)), ["Place.7"])
+
+    def test_aggregate(self):
+        """Check the aggregates, filtered or not."""
+        self.assertEqual(self.index.aggregate("price_by_night", "sum", {}),
+                         250)
+        self.assertEqual(self.index.aggregate("price_by_night", "count", {}),
+                         3)
+        self.assertEqual(self.index.aggregate(
+            "price_by_night", "max", {"number_rooms": (None, 3)}), 120)
+        self.assertEqual(self.index.aggregate("latitude", "min", {}),
+                         -10.25)
+        self.assertEqual(self.index.aggregate(
+            "number_rooms", "mean", {"price_by_night": (None, 100)}), 2.5)
+        self.assertIsNone(self.index.aggregate(
+            "latitude", "max", {"price_by_night": (500, None)}))
+        with self.assertRaises(ValueError):
+            self.index.aggregate("latitude", "median", {})
+
+    def test_unknown_field(self):
+        """Check that a field without column is a KeyError."""
+        with self.assertRaises(KeyError):
+            self.index.select({"name": (None, None)})
+        with self.assertRaises(KeyError):
+            self.index.aggregate("name", "count", {})
+
+    def test_discard_and_reuse(self):
+        """Check that discard() frees a row for the next add()."""
+        self.index.discard("Place.2")
+        self.index.discard("Place.5")
+        self.assertEqual(self.select(number_rooms=(3, None)), ["Place.3"])
+        self.assertEqual(self.index.aggregate("number_rooms", "sum", {}), 5)
+        rows = len(self.index.row_keys)
+        self.index.add("Place.5", Record(number_rooms=7))
+        self.assertEqual(len(self.index.row_keys), rows)
+        self.assertEqual(self.select(number_rooms=(3, None)),
+                         ["Place.3", "Place.5"])
+        self.assertEqual(len(self.index), 4)
+
+    def test_clear(self):
+        """Check that clear() empties the columns."""
+        self.index.clear()
+        self.assertEqual(self.select(), [])
+        self.assertEqual(self.index.aggregate("latitude", "sum", {}), 0)
+        self.assertEqual(len(self.index.columns["latitude"]), 0)
+
+    def test_storage_indexes(self):
+        """Check that the storage gets every kind of index."""
+        kinds = [type(index) for index in storage_indexes()["Place"]]
+        self.assertEqual(kinds, [ForeignKeyIndex, ForeignKeyIndex,
+                                 ColumnIndex, SortedIndex, SortedIndex,
+                                 SortedIndex, GridIndex, TextIndex])
+
+
+@unittest.skipIf(indexes.numpy is None, "NumPy is not installed")
+class TestColumnIndexNumPy(TestColumnIndex):
+    """Test the ColumnIndex class, with NumPy."""
+
+    numpy = indexes.numpy
+
+
+class TestSortedIndex(unittest.TestCase):
+    """Test the SortedIndex class and the intersect() function."""
+
+    def setUp(self):
+        """Index the prices and rooms of five places."""
+        self.prices = SortedIndex("Place", "price_by_night")
+        self.rooms = SortedIndex("Place", "number_rooms")
+        for i, (price, rooms) in enumerate(((80, 2), (50, 3), (120, 3),
+                                            (80, 1), ("free", 4))):
+            record = Record(price_by_night=price, number_rooms=rooms)
+            self.prices.add(f"Place.{i}", record)
+            self.rooms.add(f"Place.{i}", record)
+
+    def test_range(self):
+        """Check ranges in order, ties by key, and reversed."""
+        self.assertEqual(self.prices.range(),
+                         ["Place.1", "Place.0", "Place.3", "Place.2"])
+        self.assertEqual(self.prices.range(60, 100),
+                         ["Place.0", "Place.3"])
+        self.assertEqual(self.prices.range(None, 80, reverse=True),
+                         ["Place.3", "Place.0", "Place.1"])
+        self.assertEqual(self.prices.range(100, 60), [])
+        self.assertEqual(self.prices.count(80, None), 3)
+
+    def test_discard_and_add(self):
+        """Check that the order follows discard() and add()."""
+        self.prices.discard("Place.0")
+        self.prices.discard("Place.4")
+        self.prices.add("Place.0", Record(price_by_night=10))
+        self.assertEqual(self.prices.range(),
+                         ["Place.0", "Place.1", "Place.3", "Place.2"])
+        self.assertEqual(len(self.prices), 4)
+
+    def test_floats(self):
+        """Check that floats are indexed between the integers."""
+        self.prices.add("Place.5", Record(price_by_night=49.5))
+        self.prices.add("Place.6", Record(price_by_night=2 ** 70))
+        self.assertEqual(self.prices.range(None, 60),
+                         ["Place.5", "Place.1"])
+        self.assertEqual(self.prices.range(1000), ["Place.6"])
+
+    def test_many_pending(self):
+        """Check that pending entries merge in order, few or many."""
+        for i in range(100):
+            self.rooms.add(f"Place.x{i}", Record(number_rooms=i % 7))
+        self.rooms.count()
+        for i in range(3):
+            self.rooms.add(f"Place.y{i}", Record(number_rooms=i))
+        entries = self.rooms.entries
+        self.assertEqual(self.rooms.range(), [key for _, key in
+                                              sorted(entries)])
+        self.assertEqual(len(entries), 108)
+
+    def test_intersect(self):
+        """Check the keys inside several ranges."""
+        found = intersect([(self.prices, 50, 120), (self.rooms, 3, None)])
+        self.assertEqual(found, ["Place.1", "Place.2"])
+        found = intersect([(self.rooms, None, 2), (self.prices, 80, 80)])
+        self.assertEqual(found, ["Place.3", "Place.0"])
+
+    def test_clear(self):
+        """Check that clear() empties the index."""
+        self.prices.clear()
+        self.assertEqual(self.prices.range(), [])
+        self.assertEqual(self.prices.values, {})
+
+
+class TestGeometry(unittest.TestCase):
+    """Test the position, distance and bbox functions."""
+
+    def test_position(self):
+        """Check that only positions of the globe are read."""
+        self.assertEqual(position(Record(latitude=1, longitude=2.5)),
+                         (1, 2.5))
+        for lat, lon in ((91, 0), (0, -180.5), ("1", 2), (None, 0)):
+            self.assertIsNone(position({"latitude": lat, "longitude": lon}))
+
+    def test_distance_km(self):
+        """Check distances along a meridian and across the 180th."""
+        self.assertAlmostEqual(distance_km(0, 0, 1, 0),
+                               indexes.KM_PER_DEGREE)
+        self.assertAlmostEqual(distance_km(0, 179.5, 0, -179.5),
+                               indexes.KM_PER_DEGREE)
+        self.assertAlmostEqual(distance_km(90, 0, -90, 0),
+                               180 * indexes.KM_PER_DEGREE)
+
+    def test_check_bbox(self):
+        """Check that bad boxes are errors."""
+        self.assertEqual(check_bbox(["1", 2, 3, 4]), (1.0, 2.0, 3.0, 4.0))
+        for bbox in ((3, 0, 1, 0), (0, 0, 91, 0), (0, 0, 0), "abcd", None):
+            with self.assertRaises(ValueError):
+                check_bbox(bbox)
+
+    def test_in_bbox(self):
+        """Check boxes on both sides of the 180th meridian."""
+        self.assertTrue(in_bbox(0, 10, (-1, 5, 1, 15)))
+        self.assertFalse(in_bbox(0, 20, (-1, 5, 1, 15)))
+        self.assertTrue(in_bbox(0, -179, (-1, 170, 1, -170)))
+        self.assertFalse(in_bbox(0, 0, (-1, 170, 1, -170)))
+
+    def test_bbox_around(self):
+        """Check the box of a circle, across the 180th and at a pole."""
+        south, west, north, east = bbox_around(0, 179.9, 111.2)
+        self.assertAlmostEqual(north, 1, places=2)
+        self.assertGreater(west, east)
+        self.assertEqual(bbox_around(89.5, 0, 100)[1::2], (-180, 180))
+        with self.assertRaises(ValueError):
+            bbox_around(0, 0, -1)
+
+
+class TestGridIndex(unittest.TestCase):
+    """Test the GridIndex class against a linear scan."""
+
+    def setUp(self):
+        """Index places everywhere, poles and 180th meridian included."""
+        self.index = GridIndex("Place", cell_degrees=5)
+        self.positions = {"Place.{}".format(i): (lat, lon) for i, (lat, lon)
+                          in enumerate((lat, lon)
+                                       for lat in range(-90, 91, 15)
+                                       for lon in range(-180, 181, 20))}
+        for key, (lat, lon) in self.positions.items():
+            self.index.add(key, Record(latitude=lat, longitude=lon))
+        self.index.add("Place.none", Record(latitude="x", longitude=0))
+
+    def test_near(self):
+        """Check that near() gives the keys in the circle, nearest first."""
+        for lat, lon, radius in ((0, 0, 2500), (44, 178, 1000),
+                                 (88, 0, 1000), (-30, -170, 5000),
+                                 (0, 0, 25000), (10, 10, 0)):
+            found = self.index.near(lat, lon, radius)
+            self.assertEqual(found, sorted(found))
+            expected = sorted(
+                key for key, where in self.positions.items()
+                if distance_km(lat, lon, *where) <= radius)
+            self.assertEqual(sorted(key for _, key in found), expected)
+
+    def test_within(self):
+        """Check that within() gives the keys in the box."""
+        for bbox in ((-10, -30, 40, 50), (-20, 170, 20, -170),
+                     (60, -180, 90, 180), (0, 0, 0, 0)):
+            expected = sorted(key for key, where in self.positions.items()
+                              if in_bbox(*where, bbox))
+            self.assertEqual(sorted(self.index.within(bbox)), expected)
+
+    def test_discard(self):
+        """Check that discard() removes a key and empty cells."""
+        self.index.discard("Place.0")
+        self.index.discard("Place.none")
+        self.assertNotIn("Place.0", self.index.within((-90, -180, 90, 180)))
+        self.assertEqual(len(self.index), len(self.positions) - 1)
+        self.index.clear()
+        self.assertEqual(self.index.cells, {})
+        self.assertEqual(self.index.near(0, 0, 30000), [])
+
+
+class TestTextIndex(unittest.TestCase):
+    """Test the TextIndex class and the tokens() and rank() functions."""
+
+    def setUp(self):
+        """Index the text of four reviews."""
+        self.index = TextIndex("Review", ("text",))
+        for i, text in enumerate(("Quiet and clean, very quiet.",
+                                  "Clean kitchen", "noisy street", 42)):
+            self.index.add(f"Review.{i}", Record(text=text))
+
+    def test_tokens(self):
+        """Check that words are lowercase, with or without ASCII."""
+        self.assertEqual(tokens("Quiet, CLEAN room_2!"),
+                         ["quiet", "clean", "room_2"])
+        self.assertEqual(tokens("Très calme—propre"),
+                         ["très", "calme", "propre"])
+        self.assertEqual(tokens(None), [])
+
+    def test_rank(self):
+        """Check the order by score, then key, and the limit."""
+        scores = {"b": 2, "a": 2, "c": 5}
+        self.assertEqual(rank(scores), [(5, "c"), (2, "a"), (2, "b")])
+        self.assertEqual(rank(scores, 2), [(5, "c"), (2, "a")])
+
+    def test_search(self):
+        """Check all and any words, ranked by their occurrences."""
+        self.assertEqual(self.index.search("QUIET clean"),
+                         [(3, "Review.0")])
+        self.assertEqual(self.index.search("quiet clean", "any"),
+                         [(3, "Review.0"), (1, "Review.1")])
+        self.assertEqual(self.index.search("clean", limit=1),
+                         [(1, "Review.0")])
+        self.assertEqual(self.index.search("clean garden"), [])
+        self.assertEqual(self.index.search(""), [])
+        with self.assertRaises(ValueError):
+            self.index.search("clean", "most")
+
+    def test_discard_and_add(self):
+        """Check that the postings follow discard() and add()."""
+        self.index.discard("Review.1")
+        self.index.discard("Review.1")
+        self.assertEqual(self.index.search("kitchen"), [])
+        self.assertNotIn("kitchen", self.index.postings)
+        self.index.add("Review.3", Record(text="clean"))
+        self.assertEqual(self.index.search("clean", "any"),
+                         [(1, "Review.0"), (1, "Review.3")])
+        self.assertEqual(len(self.index), 3)
+        self.index.clear()
+        self.assertEqual(self.index.search("clean", "any"), [])
+
+    def test_split_later(self):
+        """Check that documents are split by the next search, once."""
+        index = TextIndex("Review", ("text",))
+        with patch.object(indexes, "tokens", wraps=tokens) as split:
+            index.add("Review.0", Record(text="quiet garden"))
+            index.discard("Review.0")
+            index.add("Review.0", Record(text="quiet garden"))
+            self.assertEqual(split.call_count, 0)
+            self.assertEqual(index.search("garden"), [(1, "Review.0")])
+            self.assertEqual(split.call_count, 2)
+            index.discard("Review.0")
+            index.add("Review.0", Record(text="quiet garden"))
+            self.assertEqual(len(index), 1)
+            self.assertEqual(split.call_count, 2)
+        self.assertTrue(index.changed)
+
+    def test_restore(self):
+        """Check that restored documents are split again only if changed."""
+        state = self.index.state()
+        index = TextIndex("Review", ("text",))
+        self.assertTrue(index.restore(state))
+        self.assertFalse(index.restore(state))
+        with patch.object(indexes, "tokens", wraps=tokens) as split:
+            index.discard("Review.0")
+            index.add("Review.0", Record(text="Quiet and clean, very quiet."))
+            index.discard("Review.1")
+            index.add("Review.1", {"text": "quiet garden"})
+            index.discard("Review.2")
+            self.assertEqual(split.call_count, 0)
+            self.assertEqual(index.search("quiet", "any"),
+                             [(2, "Review.0"), (1, "Review.1")])
+        self.assertEqual(split.call_count, 2)
+        self.assertEqual(index.search("noisy kitchen", "any"), [])
+        self.assertFalse(TextIndex("Place", ("description",)).restore(state))
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+"""Contains tests for the jsonstream.py file."""
+
+import unittest
+import gzip
+import io
+import json
+import lzma
+import os
+import zlib
+from models.engine.jsonstream import (ObjectWriter, atomic_open, codec_of,
+                                      detect, iter_object, open_text,
+                                      write_object)
+
+test_path = "_tmp_path_stream.json"
+
+
+class TestWriteObject(unittest.TestCase):
+    """Test the write_object() function."""
+
+    def test_valid_json(self):
+        """Check that the members make one JSON object."""
+        fp = io.StringIO()
+        members = [("User.1", json.dumps({"id": "1"})),
+                   ("User.\"2\"", json.dumps({"id": "2", "n": [1, 2]}))]
+        written = write_object(fp, iter(members))
+        self.assertEqual(written, len(fp.getvalue()))
+        self.assertEqual(json.loads(fp.getvalue()),
+                         {key: json.loads(text) for key, text in members})
+
+    def test_member_per_line(self):
+        """Check that each member is on its own line."""
+        fp = io.StringIO()
+        write_object(fp, [("a", "1"), ("b", "2")])
+        self.assertEqual(fp.getvalue(), '{\n"a": 1,\n"b": 2\n}\n')
+
+    def test_empty(self):
+        """Check that no member gives an empty object."""
+        fp = io.StringIO()
+        write_object(fp, [])
+        self.assertEqual(json.loads(fp.getvalue()), {})
+
+
+class TestObjectWriter(unittest.TestCase):
+    """Test the ObjectWriter class."""
+
+    def test_interleaved(self):
+        """Check that objects written in turns match write_object()."""
+        files = [io.StringIO(), io.StringIO()]
+        writers = [ObjectWriter(fp) for fp in files]
+        for i in range(5):
+            writers[i % 2].write(f"k{i}", str(i))
+        for writer in writers:
+            writer.close()
+        for start, fp in enumerate(files):
+            expected = io.StringIO()
+            write_object(expected, [(f"k{i}", str(i))
+                                    for i in range(start, 5, 2)])
+            self.assertEqual(fp.getvalue(), expected.getvalue())
+
+    def test_empty(self):
+        """Check that a writer without members gives an empty object."""
+        fp = io.StringIO()
+        ObjectWriter(fp).close()
+        self.assertEqual(json.loads(fp.getvalue()), {})
+
+
+class TestAtomicOpen(unittest.TestCase):
+    """Test the atomic_open() function."""
+
+    def setUp(self):
+        """Write the old content of test_path."""
+        with open(test_path, 'w') as fp:
+            fp.write("old")
+
+    def tearDown(self):
+        """rm test_path."""
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def read(self):
+        """Returns the content of test_path."""
+        with open(test_path, 'r') as fp:
+            return fp.read()
+
+    def test_replace(self):
+        """Check that the file is replaced at the end of the block."""
+        for fsync in (False, True):
+            with atomic_open(test_path, fsync) as fp:
+                fp.write("new")
+                self.assertEqual(self.read(), "old")
+            self.assertEqual(self.read(), "new")
+            with open(test_path, 'w') as fp:
+                fp.write("old")
+
+    def test_error_keeps_old_file(self):
+        """Check that an error in the block keeps the old file."""
+        with self.assertRaises(RuntimeError):
+            with atomic_open(test_path) as fp:
+                fp.write("new")
+                raise RuntimeError
+        self.assertEqual(self.read(), "old")
+        self.assertFalse(os.path.exists(test_path + ".tmp"))
+
+
+class TestCompression(unittest.TestCase):
+    """Test the compressed files of atomic_open() and open_text()."""
+
+    members = [("User.{}".format(i), json.dumps({"id": str(i), "n": i}))
+               for i in range(2000)]
+
+    def tearDown(self):
+        """rm test_path."""
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def write(self, codec, level=None):
+        """Writes members to test_path with codec."""
+        with atomic_open(test_path, codec=codec, level=level) as fp:
+            write_object(fp, self.members)
+
+    def read(self):
+        """Returns the members read back from test_path."""
+        with open_text(test_path) as fp:
+            return [(key, json.dumps(value))
+                    for key, value in iter_object(fp, chunk_size=100)]
+
+    def test_round_trip(self):
+        """Check that every codec reads back what it wrote."""
+        for codec in (None, "gzip", "lzma", "zlib"):
+            for level in (None, 1):
+                with self.subTest(codec=codec, level=level):
+                    self.write(codec, level)
+                    self.assertEqual(self.read(), self.members)
+                    self.assertFalse(os.path.exists(test_path + ".tmp"))
+
+    def test_formats(self):
+        """Check that the files are read by the codec modules."""
+        openers = {"gzip": gzip.open, "lzma": lzma.open}
+        for codec, opener in openers.items():
+            self.write(codec)
+            with opener(test_path, 'rt') as fp:
+                self.assertEqual(len(json.load(fp)), len(self.members))
+        self.write("zlib")
+        with open(test_path, 'rb') as fp:
+            text = zlib.decompress(fp.read())
+        self.assertEqual(len(json.loads(text)), len(self.members))
+
+    def test_compressed(self):
+        """Check that the compressed file is smaller."""
+        self.write(None)
+        plain = os.path.getsize(test_path)
+        for codec in ("gzip", "lzma", "zlib"):
+            self.write(codec)
+            self.assertLess(os.path.getsize(test_path), plain / 2)
+
+    def test_detect(self):
+        """Check that the codec is found from the first bytes."""
+        self.assertEqual(detect(gzip.compress(b"{}")), "gzip")
+        self.assertEqual(detect(lzma.compress(b"{}")), "lzma")
+        self.assertEqual(detect(lzma.compress(
+            b"{}", format=lzma.FORMAT_ALONE)), "lzma")
+        for level in range(10):
+            self.assertEqual(detect(zlib.compress(b"{}", level)), "zlib")
+        for text in (b"{}", b"{\n", b" {", b"\n{", b"", b"[]"):
+            self.assertIsNone(detect(text))
+
+    def test_codec_of(self):
+        """Check that the codec of a path is the one of its extension."""
+        self.assertEqual(codec_of("file.json.gz"), "gzip")
+        self.assertEqual(codec_of("file.json.XZ"), "lzma")
+        self.assertEqual(codec_of("dir.gz/file.zz"), "zlib")
+        self.assertIsNone(codec_of("file.json"))
+        self.assertIsNone(codec_of("file"))
+
+    def test_truncated(self):
+        """Check that a truncated compressed file is an error."""
+        for codec in ("gzip", "lzma", "zlib"):
+            self.write(codec)
+            with open(test_path, 'rb') as fp:
+                data = fp.read()
+            with open(test_path, 'wb') as fp:
+                fp.write(data[:len(data) // 2])
+            with self.subTest(codec=codec):
+                with self.assertRaises((EOFError, ValueError)):
+                    self.read()
+
+
+class TestIterObject(unittest.TestCase):
+    """Test the iter_object() function."""
+
+    records = {
+        "User.1": {"id": "1", "name": "Betty \"B\" \u00e9", "n": 12345},
+        "Place.2": {"id": "2", "price": 1.5e3, "tags": [], "ok": True},
+        "City.3": {"id": "3", "nested": {"a": [1, {"b": None}]}},
+        "Amenity.4": 7,
+    }
+
+    def members(self, text, chunk_size):
+        """Returns the members of text read chunk_size at a time."""
+        return list(iter_object(io.StringIO(text), chunk_size))
+
+    def test_chunk_sizes(self):
+        """Check that any chunk size gives the members in order."""
+        texts = (json.dumps(self.records),
+                 json.dumps(self.records, indent=4))
+        for text in texts:
+            for chunk_size in (1, 2, 3, 7, 64, 1 << 20):
+                self.assertEqual(self.members(text, chunk_size),
+                                 list(self.records.items()))
+
+    def test_write_object(self):
+        """Check that the output of write_object() reads back."""
+        fp = io.StringIO()
+        write_object(fp, ((key, json.dumps(value))
+                          for key, value in self.records.items()))
+        self.assertEqual(dict(self.members(fp.getvalue(), 5)),
+                         self.records)
+
+    def test_number_at_chunk_end(self):
+        """Check that a number cut by a chunk is read whole."""
+        self.assertEqual(self.members('{"a": 123456}', 8), [("a", 123456)])
+
+    def test_empty(self):
+        """Check that an empty object has no member."""
+        for text in ("{}", " { } ", "{\n}\n"):
+            self.assertEqual(self.members(text, 1), [])
+
+    def test_invalid(self):
+        """Check that invalid JSON raises JSONDecodeError."""
+        for text in ("", "[]", "{", '{"a"}', '{"a": 1', '{"a": 1,}',
+                     "{1: 2}", '{"a": tru}'):
+            with self.assertRaises(json.JSONDecodeError, msg=text):
+                self.members(text, 2)
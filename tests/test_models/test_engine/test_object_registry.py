@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+"""Contains tests for the object_registry.py file."""
+
+import unittest
+from models.engine.indexes import ForeignKeyIndex
+from models.engine.object_registry import ObjectRegistry
+
+
+class Loaded:
+    """Stands for the instance built from a record."""
+
+    def __init__(self, record):
+        """Keep the record."""
+        self.record = record
+
+
+class TestObjectRegistry(unittest.TestCase):
+    """Test the ObjectRegistry class."""
+
+    def setUp(self):
+        """Create a registry with a loaded object and two records."""
+        self.calls = list()
+        self.registry = ObjectRegistry(loader=self.loader)
+        self.obj = Loaded({})
+        self.registry["Loaded.1"] = self.obj
+        self.registry.load("Loaded.2", {"id": "2"})
+        self.registry.load("Loaded.3", {"id": "3"})
+
+    def loader(self, record):
+        """Builds a Loaded object and remembers the call."""
+        self.calls.append(record["id"])
+        return Loaded(record)
+
+    def test_keys_do_not_load(self):
+        """Check that keys, len and membership build nothing."""
+        self.assertEqual(list(self.registry),
+                         ["Loaded.1", "Loaded.2", "Loaded.3"])
+        self.assertEqual(len(self.registry), 3)
+        self.assertIn("Loaded.2", self.registry)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.registry.unloaded, 2)
+
+    def test_get_loads_once(self):
+        """Check that a record is built on its first fetch only."""
+        first = self.registry.get("Loaded.2")
+        second = self.registry["Loaded.2"]
+        self.assertIsInstance(first, Loaded)
+        self.assertIs(first, second)
+        self.assertEqual(self.calls, ["2"])
+        self.assertEqual(self.registry.unloaded, 1)
+
+    def test_items_load_all(self):
+        """Check that items() and values() give instances only."""
+        for key, value in self.registry.items():
+            self.assertIsInstance(value, Loaded)
+        self.assertEqual(sorted(self.calls), ["2", "3"])
+        self.assertEqual(self.registry.unloaded, 0)
+
+    def test_raw_items(self):
+        """Check that raw_items() gives the records without loading."""
+        values = dict(self.registry.raw_items())
+        self.assertEqual(values["Loaded.3"], {"id": "3"})
+        self.assertEqual(self.calls, [])
+
+    def test_delete_does_not_load(self):
+        """Check that deleting a record does not build it."""
+        del self.registry["Loaded.3"]
+        self.assertNotIn("Loaded.3", self.registry)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.registry.unloaded, 1)
+
+    def test_copy(self):
+        """Check that copy() is a plain dictionary of instances."""
+        copy = self.registry.copy()
+        self.assertIs(type(copy), dict)
+        self.assertIs(copy["Loaded.1"], self.obj)
+        self.assertIsInstance(copy["Loaded.2"], Loaded)
+
+    def test_wrap_plain_dict(self):
+        """Check that a plain dictionary keeps its records unloaded."""
+        registry = ObjectRegistry(dict(self.registry.raw_items()),
+                                  loader=self.loader)
+        self.assertEqual(registry.unloaded, 2)
+        self.assertIs(registry["Loaded.1"], self.obj)
+
+
+class TestObjectRegistryClasses(unittest.TestCase):
+    """Test the per class partitions of ObjectRegistry."""
+
+    def setUp(self):
+        """Create a registry with objects of three classes."""
+        self.registry = ObjectRegistry(loader=Loaded)
+        for key in ("User.1", "User.2", "Place.1", "UserX.1"):
+            self.registry.load(key, {"id": key})
+
+    def test_class_keys(self):
+        """Check that class_keys() gives the keys of one class only."""
+        self.assertEqual(list(self.registry.class_keys("User")),
+                         ["User.1", "User.2"])
+        self.assertEqual(list(self.registry.class_keys("City")), [])
+
+    def test_count(self):
+        """Check count() with and without a class name."""
+        self.assertEqual(self.registry.count(), 4)
+        self.assertEqual(self.registry.count("User"), 2)
+        self.assertEqual(self.registry.count("UserX"), 1)
+        self.assertEqual(self.registry.count("Use"), 0)
+
+    def test_partitions_follow_changes(self):
+        """Check that the partitions follow deletes and clear()."""
+        del self.registry["User.1"]
+        self.registry.pop("Place.1")
+        self.registry["User.1"] = Loaded({})
+        self.registry["User.1"] = Loaded({})
+        self.assertEqual(self.registry.count("User"), 2)
+        self.assertEqual(self.registry.count("Place"), 0)
+        self.registry.clear()
+        self.assertEqual(self.registry.classes, {})
+
+
+class TestObjectRegistryIndexes(unittest.TestCase):
+    """Test the indexes of ObjectRegistry, built on first use after load()."""
+
+    def setUp(self):
+        """Index the cities by state, then load two records."""
+        self.index = ForeignKeyIndex("City", "state_id")
+        self.registry = ObjectRegistry(loader=Loaded,
+                                       indexes={"City": [self.index]})
+        self.registry["City.1"] = {"state_id": "a"}
+        self.registry.load("City.2", {"state_id": "a"})
+        self.registry.load("City.3", {"state_id": "b"})
+
+    def test_set_indexes(self):
+        """Check that setting a key updates the index at once."""
+        registry = ObjectRegistry(loader=Loaded,
+                                  indexes={"City": [self.index]})
+        registry["City.1"] = {"state_id": "a"}
+        self.assertEqual(list(self.index.lookup("a")), ["City.1"])
+
+    def test_load_defers(self):
+        """
+        Check that load() leaves the index empty, and that indexes_of()
+        builds it from every key of the class, changed since or not.
+        """
+        self.assertEqual(list(self.index.lookup("a")), [])
+        self.registry["City.4"] = {"state_id": "b"}
+        del self.registry["City.3"]
+        self.registry.reindex("City.2")
+        self.assertEqual(list(self.index.lookup("b")), [])
+        self.assertEqual(self.registry.unloaded, 3)
+        self.assertEqual(self.registry.indexes_of("City"), [self.index])
+        self.assertEqual(sorted(self.index.lookup("a")),
+                         ["City.1", "City.2"])
+        self.assertEqual(list(self.index.lookup("b")), ["City.4"])
+        self.assertEqual(self.registry.unindexed, set())
+        self.assertEqual(self.registry.unloaded, 3)
+        self.registry["City.5"] = {"state_id": "b"}
+        self.assertEqual(sorted(self.index.lookup("b")),
+                         ["City.4", "City.5"])
+        self.assertEqual(self.registry.indexes_of("State"), ())
+
+    def test_clear(self):
+        """Check that clear() forgets the classes waiting for indexes."""
+        self.registry.clear()
+        self.assertEqual(self.registry.unindexed, set())
+        self.registry["City.1"] = {"state_id": "a"}
+        self.assertEqual(list(self.index.lookup("a")), ["City.1"])
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""Contains tests for the parallel.py file."""
+
+import unittest
+import json
+import os
+from models.engine import parallel
+from models.engine.jsonstream import atomic_open, write_object
+
+test_path = "_tmp_path_parallel.json"
+
+
+def record(class_name, _id, **fields):
+    """Returns a stored record of class_name."""
+    return {"id": _id, "created_at": "2024-01-01T10:00:00.000001",
+            "updated_at": "2024-01-02T10:00:00", "__class__": class_name,
+            **fields}
+
+
+class TestParseLine(unittest.TestCase):
+    """Test the parse_line() function."""
+
+    def test_member(self):
+        """Check that a member line gives its key and record."""
+        self.assertEqual(parallel.parse_line(b'"User.1": {"id": "1"},\n'),
+                         ("User.1", {"id": "1"}))
+        self.assertEqual(parallel.parse_line(b'"User.1": {"a": ","}\n'),
+                         ("User.1", {"a": ","}))
+
+    def test_braces(self):
+        """Check that the lines of the braces give nothing."""
+        for line in (b"{\n", b"}\n", b"\n"):
+            self.assertIsNone(parallel.parse_line(line))
+
+
+class TestLoad(unittest.TestCase):
+    """Test reading a file by ranges and in worker processes."""
+
+    def setUp(self):
+        """Write a file of many records, one per line."""
+        self.records = dict()
+        for i in range(300):
+            class_name = ("User", "Place", "Review")[i % 3]
+            self.records[f"{class_name}.{i}"] = record(
+                class_name, str(i), text="é" * (i % 7), number=i)
+        self.write(self.records)
+
+    def tearDown(self):
+        """rm test_path."""
+        if os.path.exists(test_path):
+            os.remove(test_path)
+
+    def write(self, records):
+        """Writes records to test_path, one per line."""
+        with atomic_open(test_path) as fp:
+            write_object(fp, ((key, json.dumps(value))
+                              for key, value in records.items()))
+
+    def check_objects(self, members):
+        """Checks that members are the instances of the records."""
+        self.assertEqual([key for key, obj in members], list(self.records))
+        for key, obj in members:
+            self.assertEqual(obj.to_dict(), self.records[key])
+            self.assertEqual(type(obj).__name__, key.partition(".")[0])
+
+    def test_one_record_per_line(self):
+        """Check the detection of the file layout."""
+        self.assertTrue(parallel.one_record_per_line(test_path))
+        for indent in (None, 4):
+            with open(test_path, 'w') as fp:
+                json.dump(self.records, fp, indent=indent)
+            self.assertFalse(parallel.one_record_per_line(test_path))
+
+    def test_ranges_cover_each_line_once(self):
+        """Check that every record is in exactly one range."""
+        for count in (1, 2, 7, 100, 10000):
+            members = list()
+            for start, end in parallel.chunks(test_path, count):
+                members.extend(parallel.load_chunk(test_path, start, end))
+            self.check_objects(members)
+
+    def test_load(self):
+        """Check that workers read every record in file order."""
+        for workers in (1, 3):
+            self.check_objects(list(parallel.load(test_path, workers)))
+
+    def test_invalid_record(self):
+        """Check that a record not matching its key is refused."""
+        self.records["User.0"]["id"] = "other"
+        self.write(self.records)
+        with self.assertRaises(ValueError):
+            list(parallel.load(test_path, 2))
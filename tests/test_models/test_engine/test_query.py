@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""Contains tests for the query.py file."""
+
+import unittest
+from models.engine.indexes import storage_indexes
+from models.engine.query import Condition, Query, bounds, order_key
+from models.engine.query import run_query
+
+
+class Record:
+    """Stands for a model instance."""
+
+    def __init__(self, **kwargs):
+        """Set the attributes."""
+        self.__dict__.update(kwargs)
+
+
+class TestCondition(unittest.TestCase):
+    """Test the Condition class and the bounds() function."""
+
+    def test_parse(self):
+        """Check the field and operator of keywords."""
+        self.assertEqual(Condition.parse("city_id", "c1"),
+                         ("city_id", "eq", "c1"))
+        self.assertEqual(Condition.parse("price_by_night__lte", 10),
+                         ("price_by_night", "lte", 10))
+        with self.assertRaises(ValueError):
+            Condition.parse("price_by_night__below", 10)
+        for value in ("c1", b"c1", 5, None):
+            with self.assertRaises(ValueError):
+                Condition.parse("city_id__in", value)
+
+    def test_parse_in(self):
+        """Check that in keeps collections and reads other iterables."""
+        values = ["c1", "c2"]
+        self.assertIs(Condition.parse("city_id__in", values).value, values)
+        self.assertEqual(
+            Condition.parse("city_id__in", iter(values)).value, ("c1", "c2"))
+
+    def test_test(self):
+        """Check every operator, and values that do not compare."""
+        record = Record(price_by_night=80, name="Cosy")
+        for name, value, expected in (
+                ("price_by_night", 80, True),
+                ("price_by_night__ne", 80, False),
+                ("price_by_night__lt", 80, False),
+                ("price_by_night__lte", 80, True),
+                ("price_by_night__gt", 50, True),
+                ("price_by_night__gte", 90, False),
+                ("price_by_night__in", (10, 80), True),
+                ("name__lt", 100, False), ("max_guest__gt", 0, False)):
+            self.assertIs(Condition.parse(name, value).test(record), expected)
+
+    def test_bounds(self):
+        """Check that numeric conditions on a field give its bounds."""
+        conditions = [Condition.parse(name, value) for name, value in (
+            ("price_by_night__gt", 10), ("price_by_night__lte", 90),
+            ("price_by_night__gte", 20), ("price_by_night__ne", 50),
+            ("number_rooms", 3), ("name__lt", "b"))]
+        self.assertEqual(bounds(conditions, "price_by_night"), (20, 90))
+        self.assertEqual(bounds(conditions, "number_rooms"), (3, 3))
+        self.assertIsNone(bounds(conditions, "name"))
+
+    def test_order_key(self):
+        """Check that numbers come before strings and other values."""
+        values = [None, "b", 3, "a", 1.5]
+        self.assertEqual(sorted(values, key=order_key),
+                         [1.5, 3, "a", "b", None])
+
+
+class TestRunQuery(unittest.TestCase):
+    """Test the paths run_query() chooses and their results."""
+
+    def setUp(self):
+        """Index a hundred places in two cities."""
+        self.indexes = storage_indexes()["Place"]
+        self.objects = dict()
+        for i in range(100):
+            place = Record(city_id=f"c{i % 2}", price_by_night=i,
+                           number_rooms=i % 5, max_guest=i % 7,
+                           latitude=0.0, longitude=0.0, name=f"n{i}")
+            key = f"Place.{i:03}"
+            self.objects[key] = place
+            for index in self.indexes:
+                index.add(key, place)
+
+    def run_query(self, **conditions):
+        """Returns the keys of the results of the query and its plan."""
+        options = {name: conditions.pop(name)
+                   for name in ("order", "reverse", "count")
+                   if name in conditions}
+        query = Query("Place", None, **options).where(**conditions)
+        results, plan = run_query(query, self.objects, self.indexes,
+                                  list(self.objects))
+        return [key for key, _ in results], plan
+
+    def test_scan(self):
+        """Check that conditions no index serves scan the class."""
+        keys, plan = self.run_query(name="n7")
+        self.assertEqual(keys, ["Place.007"])
+        self.assertEqual((plan["path"], plan["examined"]), ("scan", 100))
+
+    def test_foreign_key(self):
+        """Check that an equality on a foreign key uses its index."""
+        keys, plan = self.run_query(city_id__in=["c1", "c9"], name__ne="n1")
+        self.assertEqual(len(keys), 49)
+        self.assertEqual((plan["path"], plan["index"], plan["candidates"]),
+                         ("foreign key", "city_id", 50))
+
+    def test_paths_agree(self):
+        """Check that every path finds floats and other odd numbers."""
+        for key, price in (("Place.100", 4.5), ("Place.101", 2 ** 70)):
+            place = Record(city_id="c0", price_by_night=price)
+            self.objects[key] = place
+            for index in self.indexes:
+                index.add(key, place)
+        scan = sorted(key for key, place in self.objects.items()
+                      if place.price_by_night < 5)
+        keys, plan = self.run_query(price_by_night__lt=5)
+        self.assertEqual(sorted(keys), scan)
+        self.assertEqual(plan["path"], "sorted range")
+        keys, _ = self.run_query(price_by_night__gt=2 ** 69)
+        self.assertEqual(keys, ["Place.101"])
+
+    def test_incomplete_index(self):
+        """Check that an index missing objects is not used."""
+        place = Record(city_id="c0", price_by_night=True)
+        self.objects["Place.100"] = place
+        for index in self.indexes:
+            index.add("Place.100", place)
+        keys, plan = self.run_query(price_by_night__lt=2)
+        self.assertEqual(sorted(keys),
+                         ["Place.000", "Place.001", "Place.100"])
+        self.assertEqual(plan["path"], "scan")
+
+    def test_foreign_key_iterator(self):
+        """Check that in reads the values of a one-time iterable."""
+        keys, plan = self.run_query(city_id__in=iter(["c1", "c9"]))
+        self.assertEqual(len(keys), 50)
+        self.assertEqual(plan["path"], "foreign key")
+        with self.assertRaises(ValueError):
+            self.run_query(city_id__in=5)
+
+    def test_sorted_range(self):
+        """Check that a narrow range uses its sorted index."""
+        keys, plan = self.run_query(price_by_night__gt=10,
+                                    price_by_night__lt=13, city_id="c1")
+        self.assertEqual(keys, ["Place.011"])
+        self.assertEqual((plan["path"], plan["index"], plan["examined"]),
+                         ("sorted range", "price_by_night", 4))
+
+    def test_column_scan(self):
+        """Check that wide ranges on several fields scan the columns."""
+        keys, plan = self.run_query(price_by_night__gte=20,
+                                    number_rooms__lte=1, latitude=0.0,
+                                    longitude__lt=1)
+        self.assertEqual(len(keys), 32)
+        self.assertEqual(plan["path"], "column scan")
+        self.assertEqual(plan["examined"], 32)
+
+    def test_ordered_walk(self):
+        """Check that a small limit reads the order index and stops."""
+        keys, plan = self.run_query(city_id="c1", order="price_by_night",
+                                    reverse=True, count=2)
+        self.assertEqual(keys, ["Place.099", "Place.097"])
+        self.assertEqual((plan["path"], plan["examined"]),
+                         ("ordered walk", 3))
+        _, plan = self.run_query(max_guest=0, order="price_by_night")
+        self.assertEqual(plan["path"], "sorted range")
+
+    def test_order_and_limit(self):
+        """Check the order, ties by key, and the limit of a scan."""
+        keys, _ = self.run_query(city_id="c0", order="number_rooms",
+                                 count=3)
+        self.assertEqual(keys, ["Place.000", "Place.010", "Place.020"])
+        keys, _ = self.run_query(name="none", order="number_rooms", count=3)
+        self.assertEqual(keys, [])
+
+
+class TestQuery(unittest.TestCase):
+    """Test the Query class."""
+
+    def test_immutable(self):
+        """Check that where(), order_by() and limit() return new queries."""
+        query = Query("Place", lambda query: ([], {}))
+        ordered = query.where(city_id="c1").order_by("-price_by_night")
+        self.assertEqual(query.conditions, ())
+        self.assertEqual((ordered.order, ordered.reverse),
+                         ("price_by_night", True))
+        self.assertEqual(ordered.limit(3).count, 3)
+        self.assertIsNone(ordered.count)
+        for count in (-1, 2.5, "3"):
+            with self.assertRaises(ValueError):
+                query.limit(count)
+
+    def test_runner(self):
+        """Check that the results are read from the runner."""
+        record = Record(name="a")
+        query = Query("Place", lambda query: ([("Place.1", record)],
+                                              {"path": "scan"}))
+        self.assertEqual(query.all(), {"Place.1": record})
+        self.assertEqual(list(query), [record])
+        self.assertEqual(query.explain(), {"path": "scan"})
+        self.assertTrue(query.where(name="a").matches(record))
+        self.assertFalse(query.where(name__ne="a").matches(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+"""Contains tests for the sharding.py file."""
+
+import unittest
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+import models
+from models.engine import sharding
+
+test_path = "_tmp_path_shards.json"
+test_dir = "_tmp_path_shards.d"
+
+
+class TestShardOf(unittest.TestCase):
+    """Test the shard_of() function."""
+
+    def test_class(self):
+        """Check that the class layout uses the class name."""
+        self.assertEqual(sharding.shard_of("User.1234", "class"), "User")
+
+    def test_buckets(self):
+        """Check that the bucket layout is stable and in range."""
+        shard = sharding.shard_of("User.1234", 8)
+        self.assertRegex(shard, r"^bucket-000[0-7]$")
+        self.assertEqual(shard, sharding.shard_of("User.1234", 8))
+
+
+class TestSplitJoin(unittest.TestCase):
+    """Test the split() and join() migration functions."""
+
+    def setUp(self):
+        """Write a JSON file with objects of two classes."""
+        self.records = {
+            "User.1": {"__class__": "User", "id": "1"},
+            "User.2": {"__class__": "User", "id": "2"},
+            "State.3": {"__class__": "State", "id": "3"},
+        }
+        with open(test_path, 'w') as fp:
+            json.dump(self.records, fp)
+
+    def tearDown(self):
+        """rm test_path and test_dir."""
+        if os.path.exists(test_path):
+            os.remove(test_path)
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+    def shards(self):
+        """Returns the records of each shard of test_dir."""
+        return {shard: sharding.read_json(sharding.shard_path(test_dir,
+                                                              shard))
+                for shard in sharding.list_shards(test_dir)}
+
+    def test_split_class(self):
+        """Check that split() writes one shard per class."""
+        sharding.split(test_path, test_dir)
+        self.assertEqual(sharding.read_layout(test_dir), "class")
+        self.assertEqual(sharding.list_shards(test_dir), ["State", "User"])
+        users = sharding.read_json(sharding.shard_path(test_dir, "User"))
+        self.assertEqual(sorted(users), ["User.1", "User.2"])
+
+    def test_split_buckets(self):
+        """Check that split() into buckets keeps every object once."""
+        sharding.split(test_path, test_dir, 2)
+        self.assertEqual(sharding.read_layout(test_dir), 2)
+        keys = list()
+        for shard in sharding.list_shards(test_dir):
+            path = sharding.shard_path(test_dir, shard)
+            keys.extend(sharding.read_json(path))
+        self.assertEqual(sorted(keys), sorted(self.records))
+
+    def test_split_bucket_groups(self):
+        """Check that buckets written a group at a time keep every object."""
+        with patch.object(sharding, "OPEN_SHARDS", 2), \
+                patch.object(sharding, "iter_json",
+                             wraps=sharding.iter_json) as iter_json:
+            sharding.split(test_path, test_dir, 5)
+        self.assertEqual(iter_json.call_count, 3)
+        records = dict()
+        for shard in sharding.list_shards(test_dir):
+            path = sharding.shard_path(test_dir, shard)
+            records.update(sharding.read_json(path))
+        self.assertEqual(records, self.records)
+
+    def test_split_replaces_shards(self):
+        """Check that split() drops the shards of a former layout."""
+        sharding.split(test_path, test_dir, 8)
+        sharding.split(test_path, test_dir)
+        self.assertEqual(sharding.list_shards(test_dir), ["State", "User"])
+
+    def test_bad_source_keeps_shards(self):
+        """
+        Check that a missing or invalid source, or one inside the shard
+        directory, leaves the shards as they were.
+        """
+        sharding.split(test_path, test_dir, 2)
+        shards = self.shards()
+        inside = os.path.join(test_dir, "in.json")
+        shutil.copy(test_path, inside)
+        with open(test_path, 'w') as fp:
+            fp.write('{"User.1": {"__class__": "User", "id": "1"}, "User.2"')
+        for source, error in ((test_path, ValueError),
+                              (test_path + ".missing", FileNotFoundError),
+                              (inside, ValueError)):
+            with self.assertRaises(error):
+                sharding.split(source, test_dir)
+        os.remove(inside)
+        self.assertEqual(sharding.read_layout(test_dir), 2)
+        self.assertEqual(self.shards(), shards)
+        self.assertEqual([name for name in os.listdir(".")
+                          if name.startswith(".split-")], [])
+
+    def test_round_trip(self):
+        """Check that join() gives back the split objects."""
+        sharding.split(test_path, test_dir, 3)
+        os.remove(test_path)
+        sharding.join(test_dir, test_path)
+        self.assertEqual(sharding.read_json(test_path), self.records)
+
+
+class TestShardStorageTool(unittest.TestCase):
+    """Test the shard_storage.py command."""
+
+    def test_other_layout_in_directory(self):
+        """Check that the tool ignores the storage of its directory."""
+        root = os.path.dirname(os.path.abspath(models.__path__[0]))
+        env = dict(os.environ, HBNB_STORAGE_SHARDS="class",
+                   PYTHONPATH=root)
+        records = {"User.1": {"__class__": "User", "id": "1"}}
+        with tempfile.TemporaryDirectory() as directory:
+            # ./file.json.d holds buckets, not the class shards of env
+            sharding.write_layout(os.path.join(directory, "file.json.d"), 4)
+            with open(os.path.join(directory, "in.json"), 'w') as fp:
+                json.dump(records, fp)
+            done = subprocess.run(
+                [sys.executable, os.path.join(root, "shard_storage.py"),
+                 "split", "in.json", "out.d"],
+                cwd=directory, env=env, capture_output=True, text=True)
+            self.assertEqual(done.returncode, 0, done.stderr)
+            self.assertEqual(sharding.read_json(sharding.shard_path(
+                os.path.join(directory, "out.d"), "User")), records)